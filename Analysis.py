@@ -0,0 +1,490 @@
+"""
+Post-hoc eye movement analysis of dumped data files, without the GUI. Files
+are streamed in chunks, so recordings of any length are analyzed in constant
+memory.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import argparse
+import io
+import os
+import time
+from itertools import islice
+import numpy as np
+
+# sections of a file written by PupilTracker.dump_data, in file order
+SECTIONS = ('pupil', 'reflection', 'angle', 'time', 'blink')
+
+# sample labels
+MISSING, FIXATION, SACCADE = -1, 0, 1
+
+
+def section_offsets(path):
+    """
+    Finds where each section's rows start, in one pass over the file.
+
+    :param path: data file written by dump_data
+    :return: dict of section name to (byte offset of first row, row count)
+    """
+    offsets = {}
+    name = None
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            if line.startswith(b'#'):
+                text = line[1:].strip().decode()
+                if text.endswith(' data') and not text.startswith('end '):
+                    name = text[:-len(' data')]
+                    # units line comes next
+                    offset += len(line)
+                    line = next(f)
+                    offsets[name] = [offset + len(line), 0]
+                elif text.startswith('end '):
+                    name = None
+            elif name is not None:
+                offsets[name][1] += 1
+            offset += len(line)
+
+    return dict((key, tuple(value)) for key, value in offsets.items())
+
+
+def read_rows(f, count):
+    """
+    Reads up to count rows of comma separated numbers.
+
+    :param f: binary file handle positioned at a row
+    :param count: max number of rows to read
+    :return: 2d float array, one row per line
+    """
+    lines = list(islice(f, count))
+    if not lines:
+        return np.empty((0, 1))
+    return np.loadtxt(io.BytesIO(b''.join(lines)), delimiter=',', ndmin=2)
+
+
+def iter_chunks(path, chunk_size=65536):
+    """
+    Reads a data file a chunk of frames at a time. Each section is read with
+    its own file handle, so every chunk holds the same frames of all of them.
+
+    :param path: data file written by dump_data
+    :param chunk_size: frames per chunk
+    :return: generator of dicts with frame numbers and the pupil,
+        reflection, angle, time and blink arrays of the chunk; sections missing
+        from the file are left out
+    """
+    offsets = section_offsets(path)
+    if 'pupil' not in offsets:
+        raise IOError('No pupil data in {}.'.format(path))
+    num_frames = offsets['pupil'][1]
+
+    handles = {}
+    try:
+        for name in SECTIONS:
+            if name in offsets:
+                handles[name] = open(path, 'rb')
+                handles[name].seek(offsets[name][0])
+
+        start = 0
+        while start < num_frames:
+            count = min(chunk_size, num_frames - start)
+            chunk = dict(frame=np.arange(start, start + count))
+            for name, f in handles.items():
+                rows = read_rows(f, count)
+                chunk[name] = rows if rows.shape[1] > 1 else rows[:, 0]
+            if 'blink' in chunk:
+                chunk['blink'] = chunk['blink'] > 0
+            yield chunk
+            start += count
+    finally:
+        for f in handles.values():
+            f.close()
+
+
+def has_reflection(path):
+    """
+    Checks whether a reflection was tracked in any frame, reading up to the
+    first one found.
+
+    :param path: data file written by dump_data
+    :return: whether or not the reflection section has a position
+    """
+    offsets = section_offsets(path)
+    if 'reflection' not in offsets:
+        return False
+
+    start, count = offsets['reflection']
+    with open(path, 'rb') as f:
+        f.seek(start)
+        for line in islice(f, count):
+            if b'nan' not in line.lower():
+                return True
+    return False
+
+
+def nan_runs(missing):
+    """
+    Finds runs of True.
+
+    :param missing: boolean array
+    :return: (starts, stops) of each run
+    """
+    edges = np.diff(np.concatenate(([0], missing.view(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+class Analyzer(object):
+    """
+    Streaming analysis of one recording. Each chunk fed in gives:
+
+    - position: pupil minus reflection, so head and camera movement cancel,
+      or the raw pupil if not correcting, relative to the first valid frame
+    - outliers: single frame spikes and blinks, removed
+    - interpolation: gaps of up to max_gap frames filled in linearly
+    - velocity, from real frame times
+    - I-VT labels: saccade where speed is above saccade_speed, fixation
+      otherwise, and saccade and fixation events
+
+    The last few frames of a chunk are held back until the next chunk, so
+    gaps and spikes across chunk boundaries are handled the same as any
+    others.
+    """
+    def __init__(self, fps=60, max_gap=5, spike_size=20, saccade_speed=300,
+                 min_fixation=0.1, correct=True):
+        """
+        Constructor.
+
+        :param fps: frame rate, for files without time data
+        :param max_gap: longest run of missing frames to interpolate
+        :param spike_size: pixels a single frame must jump away from, and back
+            to, its neighbours to be an outlier
+        :param saccade_speed: pixels/s above which the eye is in a saccade
+        :param min_fixation: seconds a fixation must last to be kept
+        :param correct: whether or not to subtract the reflection position.
+            Without a reflection every corrected position is missing, so
+            turn off for recordings where none was tracked
+        """
+        self.fps = fps
+        self.max_gap = max_gap
+        self.spike_size = spike_size
+        self.saccade_speed = saccade_speed
+        self.min_fixation = min_fixation
+        self.correct = correct
+
+        # frames held back for right hand context
+        self.hold = max_gap + 2
+        self.carry = None
+
+        # last emitted frame, for left hand context
+        self.origin = None
+        self.last_raw = np.full(2, np.NaN)
+        self.last_clean = np.full(2, np.NaN)
+        self.last_time = np.NaN
+
+        # event in progress: label, start time, start position, peak speed,
+        # position sum and count
+        self.event = None
+        # time and position of the last frame of the event in progress
+        self.event_end = None
+        self.saccades = []
+        self.fixations = []
+
+    def feed(self, chunk, final=False):
+        """
+        Analyzes a chunk of frames.
+
+        :param chunk: dict from iter_chunks
+        :param final: whether or not this is the last chunk
+        :return: dict of per frame results, for the frames now final
+        """
+        buf = self.combine(chunk)
+        n = len(buf['frame'])
+        emit = n if final else n - self.hold
+        if emit <= 0:
+            self.carry = buf
+            return None
+
+        # reflection corrected, blinks removed
+        if self.correct:
+            pos = buf['pupil'] - buf['reflection']
+        else:
+            pos = buf['pupil'].copy()
+        blink = buf['blink']
+        pos[blink] = np.NaN
+        times = buf['time']
+
+        # spikes: far from both neighbours, which are close to each other
+        ext = np.vstack((self.last_raw, pos))
+        left, mid, right = ext[:-2], ext[1:-1], ext[2:]
+        jump = np.hypot(*(mid - (left + right) / 2).T)
+        across = np.hypot(*(right - left).T)
+        outlier = np.zeros(n, dtype=bool)
+        outlier[:-1] = (jump > self.spike_size) & (across < self.spike_size)
+
+        clean = pos.copy()
+        clean[outlier] = np.NaN
+
+        # fill short gaps, using the last emitted frame as left anchor
+        ext_clean = np.vstack((self.last_clean, clean))
+        ext_times = np.concatenate(([self.last_time], times))
+        missing = np.isnan(ext_clean[:, 0])
+        interpolated = np.zeros(n + 1, dtype=bool)
+        valid = ~missing & ~np.isnan(ext_times)
+        if valid.sum() >= 2:
+            starts, stops = nan_runs(missing)
+            short = (stops - starts <= self.max_gap) & (starts > 0) & \
+                (stops < n + 1)
+            for start, stop in zip(starts[short], stops[short]):
+                interpolated[start:stop] = True
+            if interpolated.any():
+                for axis in range(2):
+                    ext_clean[interpolated, axis] = np.interp(
+                        ext_times[interpolated], ext_times[valid],
+                        ext_clean[valid, axis])
+        clean = ext_clean[1:]
+        interpolated = interpolated[1:]
+
+        # relative to first valid frame
+        if self.origin is None:
+            found = np.flatnonzero(~np.isnan(clean[:emit, 0]))
+            if len(found):
+                self.origin = clean[found[0]].copy()
+        origin = self.origin if self.origin is not None else np.zeros(2)
+
+        # velocity from previous frame
+        ext_clean = np.vstack((self.last_clean, clean))
+        ext_times = np.concatenate(([self.last_time], times))
+        velocity = np.diff(ext_clean, axis=0) / \
+            np.diff(ext_times)[:, np.newaxis]
+        speed = np.hypot(*velocity.T)
+
+        labels = np.where(speed > self.saccade_speed, SACCADE, FIXATION)
+        labels[np.isnan(speed)] = MISSING
+
+        out = dict(frame=buf['frame'][:emit],
+                   time=times[:emit],
+                   x=clean[:emit, 0] - origin[0],
+                   y=clean[:emit, 1] - origin[1],
+                   vx=velocity[:emit, 0],
+                   vy=velocity[:emit, 1],
+                   speed=speed[:emit],
+                   blink=blink[:emit],
+                   outlier=outlier[:emit],
+                   interpolated=interpolated[:emit],
+                   label=labels[:emit])
+        self.segment(out)
+
+        # context for next chunk
+        self.last_raw = pos[emit - 1].copy()
+        self.last_clean = clean[emit - 1].copy()
+        self.last_time = times[emit - 1]
+        self.carry = dict((key, value[emit:]) for key, value in buf.items())
+
+        if final:
+            self.close_event(out['time'][-1], None)
+
+        return out
+
+    def combine(self, chunk):
+        """
+        Fills in missing sections of a chunk and prepends frames held back
+        from the last one.
+
+        :param chunk: dict from iter_chunks
+        :return: dict of arrays
+        """
+        n = len(chunk['frame'])
+        buf = dict(frame=chunk['frame'],
+                   pupil=chunk['pupil'],
+                   reflection=chunk.get('reflection', np.zeros((n, 2))),
+                   time=chunk.get('time', chunk['frame'] / self.fps),
+                   blink=chunk.get('blink', np.zeros(n, dtype=bool)))
+
+        # frames never read have no time; estimate from frame rate
+        buf['time'] = np.where(np.isnan(buf['time']),
+                               buf['frame'] / self.fps, buf['time'])
+
+        if self.carry is not None:
+            buf = dict((key, np.concatenate((self.carry[key], value)))
+                       for key, value in buf.items())
+        return buf
+
+    def segment(self, out):
+        """
+        Turns runs of labels into saccade and fixation events, continuing the
+        event in progress from the last chunk.
+
+        :param out: per frame results
+        """
+        labels = out['label']
+        changes = np.flatnonzero(np.diff(labels)) + 1
+        bounds = np.concatenate(([0], changes, [len(labels)]))
+
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            label = labels[start]
+            if self.event is not None and self.event[0] != label:
+                self.close_event(out['time'][start],
+                                 (out['x'][start], out['y'][start]))
+
+            x = out['x'][start:stop]
+            y = out['y'][start:stop]
+            peak = np.nanmax(out['speed'][start:stop]) \
+                if label != MISSING else np.NaN
+            if self.event is None:
+                self.event = [label, out['time'][start],
+                              (x[0], y[0]), peak,
+                              np.nansum(x), np.nansum(y), len(x)]
+            else:
+                self.event[3] = np.fmax(self.event[3], peak)
+                self.event[4] += np.nansum(x)
+                self.event[5] += np.nansum(y)
+                self.event[6] += len(x)
+
+            self.event_end = (out['time'][stop - 1], x[-1], y[-1])
+
+    def close_event(self, end_time, end_pos):
+        """
+        Finishes the event in progress.
+
+        :param end_time: time the next event starts
+        :param end_pos: position the next event starts at, or None at the end
+            of the recording
+        """
+        if self.event is None:
+            return
+        label, start_time, start_pos, peak, x_sum, y_sum, count = self.event
+        self.event = None
+
+        if end_pos is None:
+            end_time, end_pos = self.event_end[0], self.event_end[1:]
+
+        duration = end_time - start_time
+        if label == SACCADE:
+            amplitude = np.hypot(end_pos[0] - start_pos[0],
+                                 end_pos[1] - start_pos[1])
+            self.saccades.append((start_time, duration, amplitude, peak))
+        elif label == FIXATION and duration >= self.min_fixation:
+            self.fixations.append((start_time, duration, x_sum / count,
+                                   y_sum / count))
+
+
+# columns of the per frame output file
+SAMPLE_COLUMNS = ('frame', 'time', 'x', 'y', 'vx', 'vy', 'speed', 'blink',
+                  'outlier', 'interpolated', 'label')
+
+
+def analyze_file(path, out_path=None, chunk_size=65536, correct=None,
+                 **kwargs):
+    """
+    Analyzes one data file.
+
+    :param path: data file written by dump_data
+    :param out_path: file to write per frame results to, or None. Saccades
+        and fixations go next to it, with _saccades and _fixations added
+    :param chunk_size: frames read at a time
+    :param correct: whether or not to correct the pupil by the reflection,
+        or None to correct only if a reflection was tracked
+    :param kwargs: passed to Analyzer
+    :return: the analyzer, holding the saccades and fixations
+    """
+    if correct is None:
+        correct = has_reflection(path)
+    analyzer = Analyzer(correct=correct, **kwargs)
+
+    out = None
+    if out_path is not None:
+        out = open(out_path, 'w')
+        out.write('# ' + ','.join(SAMPLE_COLUMNS) + '\n')
+
+    try:
+        chunks = iter_chunks(path, chunk_size)
+        chunk = next(chunks, None)
+        while chunk is not None:
+            following = next(chunks, None)
+            results = analyzer.feed(chunk, final=following is None)
+            if out is not None and results is not None:
+                np.savetxt(out, np.column_stack(
+                    [results[name] for name in SAMPLE_COLUMNS]),
+                    delimiter=',', fmt='%g')
+            chunk = following
+    finally:
+        if out is not None:
+            out.close()
+
+    if out_path is not None:
+        stem = os.path.splitext(out_path)[0]
+        np.savetxt(stem + '_saccades.csv',
+                   np.array(analyzer.saccades).reshape(-1, 4),
+                   delimiter=',', fmt='%g',
+                   header='start (s),duration (s),amplitude (pixels),'
+                          'peak speed (pixels/s)')
+        np.savetxt(stem + '_fixations.csv',
+                   np.array(analyzer.fixations).reshape(-1, 4),
+                   delimiter=',', fmt='%g',
+                   header='start (s),duration (s),x (pixels),y (pixels)')
+
+    return analyzer
+
+
+def pupil_shape(geometry):
+    """
+    Derives pupil size and shape from stored geometry, without re-tracking.
+
+    :param geometry: mapping from PupilTracker.load_geometry
+    :return: dict of per frame diameter (pixels, mean of the ellipse axes),
+        ellipticity (1 - minor / major axis) and area (pixels^2)
+    """
+    w = geometry['pupil_w'].astype(np.float64)
+    h = geometry['pupil_h'].astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ellipticity = 1 - np.fmin(w, h) / np.fmax(w, h)
+    return dict(diameter=(w + h) / 2,
+                ellipticity=ellipticity,
+                area=geometry['pupil_area'].astype(np.float64))
+
+
+def main():
+    """
+    Analyzes data files from the command line, writing results next to each.
+    """
+    parser = argparse.ArgumentParser(
+        description='Analyze dumped pupil data: corrected position, '
+                    'velocity, outliers, gaps, saccades and fixations.')
+    parser.add_argument('files', nargs='+', help='data files')
+    parser.add_argument('--fps', type=float, default=60,
+                        help='frame rate, for files without time data')
+    parser.add_argument('--max-gap', type=int, default=5,
+                        help='longest gap in frames to interpolate')
+    parser.add_argument('--spike-size', type=float, default=20,
+                        help='pixels for a one frame jump to be an outlier')
+    parser.add_argument('--saccade-speed', type=float, default=300,
+                        help='pixels/s above which is a saccade')
+    parser.add_argument('--min-fixation', type=float, default=0.1,
+                        help='shortest fixation in seconds')
+    parser.add_argument('--raw', action='store_true',
+                        help='use the pupil position without subtracting the '
+                             'reflection; the default when no reflection was '
+                             'tracked')
+    parser.add_argument('--chunk-size', type=int, default=65536)
+    args = parser.parse_args()
+
+    for path in args.files:
+        start = time.time()
+        out_path = os.path.splitext(path)[0] + '_analysis.csv'
+        analyzer = analyze_file(path, out_path, args.chunk_size,
+                                correct=False if args.raw else None,
+                                fps=args.fps,
+                                max_gap=args.max_gap,
+                                spike_size=args.spike_size,
+                                saccade_speed=args.saccade_speed,
+                                min_fixation=args.min_fixation)
+        print('{}: {} saccades, {} fixations in {:.2f} s'.format(
+            path, len(analyzer.saccades), len(analyzer.fixations),
+            time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Reusable image buffers, so the per-frame pipeline writes into the same
+memory every frame instead of allocating new arrays.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import numpy as np
+
+
+class BufferPool(object):
+    """
+    Named output buffers for OpenCV dst parameters. A buffer is made the first
+    time its name is asked for and handed back every time after, only being
+    reallocated when the shape or type asked for changes. A buffer's contents
+    are overwritten by the next user of the same name, so anything kept past
+    the current frame must be copied out.
+    """
+    def __init__(self):
+        """
+        Constructor.
+        """
+        self.buffers = {}
+        self.allocations = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        """
+        Gets a buffer.
+
+        :param name: name of buffer, one per pipeline stage
+        :param shape: shape needed
+        :param dtype: type needed
+        :return: buffer of that shape and type, contents undefined
+        """
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = np.empty(shape, dtype)
+            self.buffers[name] = buf
+            self.allocations += 1
+        return buf
+
+    def view(self, name, shape, dtype=np.uint8, capacity=0):
+        """
+        Gets a buffer for images whose shape changes from frame to frame,
+        such as a roi. One flat allocation of at least capacity elements is
+        kept and a contiguous view of the shape asked for is cut from it, so
+        it is only reallocated if the shape outgrows it.
+
+        :param name: name of buffer, one per pipeline stage
+        :param shape: shape needed
+        :param dtype: type needed
+        :param capacity: elements to allocate for, e.g. the size of the
+            whole frame the roi is cut from
+        :return: view of that shape and type, contents undefined
+        """
+        size = int(np.prod(shape))
+        buf = self.buffers.get(name)
+        if buf is None or buf.size < size or buf.dtype != dtype:
+            buf = np.empty(max(size, capacity), dtype)
+            self.buffers[name] = buf
+            self.allocations += 1
+        return buf[:size].reshape(shape)
+
+    def like(self, name, img):
+        """
+        Gets a buffer the same shape and type as an image.
+
+        :param name: name of buffer
+        :param img: image to match
+        :return: buffer
+        """
+        return self.get(name, img.shape, img.dtype)
+
+    def gray(self, name, img):
+        """
+        Gets a single channel buffer the same size as an image.
+
+        :param name: name of buffer
+        :param img: image to match
+        :return: buffer
+        """
+        return self.get(name, img.shape[:2], img.dtype)
+
+    def clear(self):
+        """
+        Drops all buffers, e.g. when a new video is loaded.
+        """
+        self.buffers = {}
+
+    def nbytes(self):
+        """
+        :return: total size of all buffers in bytes
+        """
+        return sum(buf.nbytes for buf in self.buffers.values())
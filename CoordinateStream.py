@@ -0,0 +1,288 @@
+"""
+Low latency streaming of tracked coordinates over a local socket, for closed
+loop experiments.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import argparse
+import os
+import socket
+import struct
+import threading
+import time
+import numpy as np
+
+# frame number, capture time, send time, pupil x, y, refle x, y, angle
+MESSAGE = struct.Struct('<iddfffff')
+
+# event kind, frame number, event time, send time, x, y, duration, amplitude,
+# peak speed; a different size than MESSAGE, so receivers tell them apart
+EVENT = struct.Struct('<iiddfffff')
+
+# event kinds by their number in EVENT, see OnlineFilter.emit
+EVENT_KINDS = ('saccade_start', 'saccade_end')
+
+DEFAULT_ADDRESS = ('127.0.0.1', 5005)
+
+
+def make_socket(address):
+    """
+    Makes a datagram socket for an address.
+
+    :param address: (host, port) for UDP, or a path for a unix domain socket
+    :return: socket
+    """
+    if isinstance(address, tuple):
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    else:
+        return socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+
+def unpack(message):
+    """
+    Unpacks a message.
+
+    :param message: bytes received
+    :return: tuple of frame number, capture time, send time, pupil x, y,
+        refle x, y and angle
+    """
+    return MESSAGE.unpack(message)
+
+
+def unpack_event(message):
+    """
+    Unpacks an event message.
+
+    :param message: bytes received
+    :return: tuple of kind, frame number, event time, send time, x, y and,
+        for saccade ends, duration, amplitude and peak speed, else NaN
+    """
+    msg = EVENT.unpack(message)
+    return (EVENT_KINDS[msg[0]],) + msg[1:]
+
+
+class CoordinatePublisher(object):
+    """
+    Sends each frame's coordinates as one compact binary datagram. Datagrams
+    are fire and forget, so a slow or missing receiver never blocks tracking.
+    Missing values are sent as NaN.
+    """
+    def __init__(self, address=DEFAULT_ADDRESS):
+        """
+        Constructor.
+
+        :param address: (host, port) for UDP, or a path for a unix domain
+            socket
+        """
+        self.address = address
+        self.sock = make_socket(address)
+        self.sock.setblocking(False)
+        self.dropped = 0
+
+    def publish(self, frame_num, capture_time, pupil, refle, angle):
+        """
+        Sends coordinates of a frame.
+
+        :param frame_num: frame number
+        :param capture_time: time the frame was captured
+        :param pupil: pupil (x, y)
+        :param refle: reflection (x, y)
+        :param angle: pupil angle
+        """
+        message = MESSAGE.pack(frame_num, capture_time, time.time(),
+                               pupil[0], pupil[1], refle[0], refle[1], angle)
+        self.send(message)
+
+    def publish_event(self, event):
+        """
+        Sends an event, e.g. from OnlineFilter's on_event.
+
+        :param event: tuple of kind, frame number, time, x, y and optionally
+            duration, amplitude and peak speed
+        """
+        kind, frame_num, t, x, y = event[:5]
+        extra = tuple(event[5:8]) + (np.NaN,) * (8 - max(len(event), 5))
+        message = EVENT.pack(EVENT_KINDS.index(kind), frame_num,
+                             t if t is not None else np.NaN, time.time(),
+                             x, y, *extra)
+        self.send(message)
+
+    def send(self, message):
+        """
+        Sends a message without blocking.
+
+        :param message: bytes to send
+        """
+        try:
+            self.sock.sendto(message, self.address)
+        except socket.error:
+            # no receiver on unix socket, or buffer full
+            self.dropped += 1
+
+    def close(self):
+        """
+        Closes the socket.
+        """
+        self.sock.close()
+
+
+class LoopbackReceiver(threading.Thread):
+    """
+    Receives coordinates on a background thread and records the latency of
+    each message, both since capture and since it was sent. Events are kept
+    in events.
+    """
+    def __init__(self, address=DEFAULT_ADDRESS, verbose=False):
+        """
+        Constructor.
+
+        :param address: (host, port) for UDP, or a path for a unix domain
+            socket
+        :param verbose: whether or not to print each message
+        """
+        super(LoopbackReceiver, self).__init__()
+        self.daemon = True
+
+        self.address = address
+        self.verbose = verbose
+        if not isinstance(address, tuple) and os.path.exists(address):
+            os.remove(address)
+        self.sock = make_socket(address)
+        self.sock.bind(address)
+        self.sock.settimeout(0.1)
+
+        self.stop_event = threading.Event()
+        self.capture_latency = []
+        self.send_latency = []
+        self.events = []
+
+    def run(self):
+        """
+        Receives until stopped.
+        """
+        while not self.stop_event.is_set():
+            try:
+                message = self.sock.recv(max(MESSAGE.size, EVENT.size))
+            except socket.timeout:
+                continue
+            received = time.time()
+
+            if len(message) == EVENT.size:
+                event = unpack_event(message)
+                self.events.append(event)
+                if self.verbose:
+                    print('{} frame {} at ({:.0f}, {:.0f})'.format(
+                        event[0], event[1], event[4], event[5]))
+                continue
+
+            msg = unpack(message)
+            self.capture_latency.append(received - msg[1])
+            self.send_latency.append(received - msg[2])
+
+            if self.verbose:
+                print('frame {} pupil ({:.0f}, {:.0f}) refle ({:.0f}, {:.0f}) '
+                      'angle {:.1f} latency {:.2f} ms'.format(
+                          msg[0], msg[3], msg[4], msg[5], msg[6], msg[7],
+                          1000 * self.capture_latency[-1]))
+
+    def stop(self):
+        """
+        Stops receiving and closes the socket.
+        """
+        self.stop_event.set()
+        self.join()
+        self.sock.close()
+        if not isinstance(self.address, tuple):
+            os.remove(self.address)
+
+    def report(self):
+        """
+        Summarizes latencies.
+
+        :return: dict of median and 99th percentile latencies in ms
+        """
+        stats = dict(received=len(self.send_latency),
+                     events=len(self.events))
+        for name, latency in [('capture', self.capture_latency),
+                              ('send', self.send_latency)]:
+            if latency:
+                stats[name + '_median_ms'] = 1000 * np.median(latency)
+                stats[name + '_p99_ms'] = 1000 * np.percentile(latency, 99)
+
+        return stats
+
+
+def measure_latency(count=1000, address=DEFAULT_ADDRESS, interval=0.001):
+    """
+    Measures publish to receive latency against a loopback receiver.
+
+    :param count: number of messages to send
+    :param address: (host, port) for UDP, or a path for a unix domain socket
+    :param interval: seconds between messages
+    :return: dict of latency stats
+    """
+    receiver = LoopbackReceiver(address)
+    receiver.start()
+    publisher = CoordinatePublisher(address)
+
+    for frame_num in range(count):
+        publisher.publish(frame_num, time.time(), (0, 0), (0, 0), 0)
+        time.sleep(interval)
+
+    # let stragglers arrive
+    time.sleep(0.2)
+    receiver.stop()
+    publisher.close()
+
+    stats = receiver.report()
+    stats['sent'] = count
+    if stats['received']:
+        print('received {received}/{sent}, latency median '
+              '{send_median_ms:.3f} ms, p99 {send_p99_ms:.3f} ms'.format(
+                  **stats))
+    else:
+        print('no messages received')
+
+    return stats
+
+
+def main():
+    """
+    Measures latency, or listens to a running tracker, from the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description='Measure coordinate stream latency, or listen to a '
+                    'running tracker.')
+    parser.add_argument('--listen', action='store_true',
+                        help='print coordinates from a running tracker')
+    parser.add_argument('--unix', help='unix domain socket path to use '
+                                       'instead of UDP')
+    parser.add_argument('--port', type=int, default=DEFAULT_ADDRESS[1])
+    parser.add_argument('--count', type=int, default=1000,
+                        help='messages to send when measuring')
+    args = parser.parse_args()
+
+    if args.unix is not None:
+        address = args.unix
+    else:
+        address = (DEFAULT_ADDRESS[0], args.port)
+
+    if args.listen:
+        receiver = LoopbackReceiver(address, verbose=True)
+        receiver.start()
+        try:
+            while receiver.is_alive():
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            pass
+        receiver.stop()
+        print(receiver.report())
+    else:
+        measure_latency(args.count, address)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Eye only recording. Stores a fixed size crop around the pupil per frame, with
+where it was cut from, and reads it back in place of a VideoCapture so it can
+be re-tracked. Storage and tracking then cost what the eye takes up, not the
+whole sensor.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import os
+import cv2
+import numpy as np
+
+
+def offsets_path(path):
+    """
+    Gets where the crop offsets of a crop video are saved.
+
+    :param path: crop video path
+    :return: offsets file path
+    """
+    return os.path.splitext(path)[0] + '_offsets.csv'
+
+
+def is_crop_archive(path):
+    """
+    :param path: video path
+    :return: whether or not the video is a crop archive, i.e. has offsets
+    """
+    return os.path.isfile(path) and os.path.isfile(offsets_path(path))
+
+
+class CropWriter(object):
+    """
+    Writes a fixed size crop of each frame to a video, and the top left corner
+    it was cut from, with the frame number and time, to a text file beside it.
+    The crop is kept inside the frame, so near an edge it is off center
+    rather than smaller.
+    """
+    def __init__(self, path, crop_size, source_size, fps, fourcc='mp4v'):
+        """
+        Constructor.
+
+        :param path: crop video save path
+        :param crop_size: (width, height) of the crop
+        :param source_size: (width, height) of the frames cropped from
+        :param fps: frame rate to save at
+        :param fourcc: four character code of the codec
+        """
+        self.source_size = tuple(int(s) for s in source_size)
+        self.crop_size = tuple(min(int(c), s) for c, s in
+                               zip(crop_size, self.source_size))
+        self.offset = (0, 0)
+
+        self.out = cv2.VideoWriter(path,
+                                   fourcc=cv2.VideoWriter_fourcc(*fourcc),
+                                   fps=fps,
+                                   frameSize=self.crop_size)
+        if not self.out.isOpened():
+            raise IOError('Could not open {} to record.'.format(path))
+
+        self.offsets = open(offsets_path(path), 'w')
+        self.offsets.write('# crop offsets\n'
+                           '# source {}x{}\n'
+                           '# frame,x,y (pixels),time (seconds)\n'.format(
+                               *self.source_size))
+
+    def write(self, frame, center, frame_num, frame_time, rgb=False):
+        """
+        Writes the crop around a point of a frame.
+
+        :param frame: frame of source_size
+        :param center: (x, y) to center the crop on, or None to cut from the
+            same place as last time
+        :param frame_num: frame number
+        :param frame_time: frame time in seconds
+        :param rgb: whether or not the frame is RGB instead of BGR
+        """
+        w, h = self.crop_size
+        if center is not None:
+            x = int(np.clip(center[0] - w // 2, 0, self.source_size[0] - w))
+            y = int(np.clip(center[1] - h // 2, 0, self.source_size[1] - h))
+            self.offset = (x, y)
+
+        x, y = self.offset
+        crop = frame[y:y + h, x:x + w]
+        if rgb:
+            crop = cv2.cvtColor(crop, cv2.COLOR_RGB2BGR)
+        self.out.write(np.ascontiguousarray(crop))
+        self.offsets.write('{:d},{:d},{:d},{:.6f}\n'.format(
+            frame_num, x, y, frame_time if frame_time is not None else np.NaN))
+
+    def release(self):
+        """
+        Closes the video and offsets file.
+        """
+        self.out.release()
+        self.offsets.close()
+
+
+class CropCapture(object):
+    """
+    Reads a crop archive with the parts of the cv2.VideoCapture interface the
+    tracker uses. Frames come out at crop size; offset holds where the last
+    frame read was cut from, to add to positions found in it.
+    """
+    def __init__(self, path):
+        """
+        Constructor.
+
+        :param path: crop video path
+        :raise IOError: if the video or its offsets can't be read
+        """
+        if not is_crop_archive(path):
+            raise IOError('{} is not a crop archive.'.format(path))
+
+        self.cap = cv2.VideoCapture(path)
+
+        self.source_size = None
+        with open(offsets_path(path)) as f:
+            for line in f:
+                if line.startswith('# source '):
+                    width, height = line[len('# source '):].split('x')
+                    self.source_size = (int(width), int(height))
+                    break
+        rows = np.loadtxt(offsets_path(path), delimiter=',', ndmin=2)
+        self.frames = rows[:, 0].astype(int)
+        self.offsets = rows[:, 1:3].astype(int)
+        self.times = rows[:, 3]
+
+        self.pos = 0
+        self.offset = (0, 0)
+
+    def isOpened(self):
+        """
+        :return: whether or not the video opened
+        """
+        return self.cap.isOpened()
+
+    def grab(self):
+        """
+        Advances to the next frame without decoding it into an image.
+
+        :return: whether or not there was a frame
+        """
+        if self.pos >= len(self.offsets) or not self.cap.grab():
+            return False
+        self.offset = tuple(self.offsets[self.pos])
+        self.pos += 1
+        return True
+
+    def read(self, image=None):
+        """
+        Reads the next frame.
+
+        :param image: array to decode into, or None
+        :return: (whether or not a frame was read, frame)
+        """
+        if self.pos >= len(self.offsets):
+            return False, None
+        ret, frame = self.cap.read(image)
+        if ret:
+            self.offset = tuple(self.offsets[self.pos])
+            self.pos += 1
+        return ret, frame
+
+    def get(self, prop):
+        """
+        Gets a capture property. Frame count and position come from the
+        offsets, and time is the time recorded with the frame.
+
+        :param prop: cv2.CAP_PROP_* id
+        :return: property value
+        """
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.offsets)
+        elif prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.pos
+        elif prop == cv2.CAP_PROP_POS_MSEC:
+            if self.pos == 0:
+                return 0
+            return 1000 * self.times[self.pos - 1]
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        """
+        Sets a capture property. Only seeking is passed through.
+
+        :param prop: cv2.CAP_PROP_* id
+        :param value: value to set
+        :return: whether or not it was set
+        """
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return False
+        self.pos = int(np.clip(value, 0, len(self.offsets)))
+        return self.cap.set(prop, self.pos)
+
+    def release(self):
+        """
+        Closes the video.
+        """
+        self.cap.release()
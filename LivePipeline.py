@@ -0,0 +1,363 @@
+"""
+Multi-process live tracking. A capture process decodes frames straight into
+a ring of shared memory buffers, and tracking, encoding and display read them
+in place from their own processes, so none of them can hold up another.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import argparse
+import ctypes
+import multiprocessing as mp
+import time
+import cv2
+import numpy as np
+from PupilTracker import PupilTracker, HeadlessApp
+
+
+class FrameRing(object):
+    """
+    Ring of frame buffers in shared memory with a single writer. The writer
+    counts frames written; readers keep their own position and read buffers in
+    place, no pickling or copying. A buffer holding frame i is overwritten
+    once the count reaches i + slots, which readers check after reading.
+    """
+    def __init__(self, shape, slots=8):
+        """
+        Constructor.
+
+        :param shape: (height, width, channels) of frames
+        :param slots: number of buffers in the ring
+        """
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.buffer = mp.RawArray(ctypes.c_uint8,
+                                  slots * int(np.prod(self.shape)))
+        self.stamps = mp.RawArray(ctypes.c_double, slots)
+        self.count = mp.RawValue(ctypes.c_long, 0)
+        self.frames = None
+
+    def __getstate__(self):
+        """
+        Drops the numpy view when sent to another process.
+        """
+        state = self.__dict__.copy()
+        state['frames'] = None
+        return state
+
+    def view(self):
+        """
+        Gets the buffers as an array, made once per process.
+
+        :return: array of shape (slots, height, width, channels)
+        """
+        if self.frames is None:
+            self.frames = np.frombuffer(self.buffer, np.uint8).reshape(
+                (self.slots,) + self.shape)
+        return self.frames
+
+    def write_from(self, cap):
+        """
+        Decodes the next frame of a capture directly into the next buffer.
+
+        :param cap: capture to read from
+        :return: whether or not a frame was read
+        """
+        index = self.count.value
+        slot = index % self.slots
+        buf = self.view()[slot]
+        ret, frame = cap.read(buf)
+        if ret:
+            # some backends ignore the buffer passed in
+            if frame.ctypes.data != buf.ctypes.data:
+                buf[...] = frame
+            self.stamps[slot] = time.time()
+            self.count.value = index + 1
+        return ret
+
+    def read(self, index):
+        """
+        Gets a frame in place. Check still_valid once done with it.
+
+        :param index: frame number
+        :return: (frame, capture time)
+        """
+        slot = index % self.slots
+        return self.view()[slot], self.stamps[slot]
+
+    def still_valid(self, index):
+        """
+        Checks a frame wasn't overwritten while it was being read.
+
+        :param index: frame number
+        :return: whether or not the buffer still holds the frame
+        """
+        return self.count.value < index + self.slots
+
+    def next_index(self, index):
+        """
+        Gets the frame a sequential reader should read next, skipping ahead if
+        it fell so far behind its frames were overwritten.
+
+        :param index: frame the reader wants next
+        :return: (frame to read or None if none yet, number of frames skipped)
+        """
+        count = self.count.value
+        if index >= count:
+            return None, 0
+        oldest = count - self.slots + 1
+        if index < oldest:
+            return oldest, oldest - index
+        return index, 0
+
+
+def capture_worker(ring, source, stop_event):
+    """
+    Decodes frames into the ring until stopped or the source ends.
+
+    :param ring: frame ring to write to
+    :param source: camera index or video path
+    :param stop_event: event set to stop
+    """
+    cap = cv2.VideoCapture(source)
+    while not stop_event.is_set():
+        if not ring.write_from(cap):
+            break
+    cap.release()
+    stop_event.set()
+
+
+def track_worker(ring, results, result_count, pupil_thresh, refle_thresh,
+                 stop_event):
+    """
+    Tracks every frame of the ring it can keep up with, and writes results to
+    a shared ring of rows (capture time, pupil x, y, refle x, y, angle).
+
+    :param ring: frame ring to read from
+    :param results: shared array of result rows
+    :param result_count: shared count of results written
+    :param pupil_thresh: pupil threshold
+    :param refle_thresh: reflection threshold
+    :param stop_event: event set to stop
+    """
+    rows = np.frombuffer(results, np.float64).reshape(-1, 6)
+    height, width = ring.shape[:2]
+
+    tracker = PupilTracker(HeadlessApp(pupil_thresh, refle_thresh))
+    tracker.init_video((width, height), len(rows), min(width, 480))
+
+    index = 0
+    while True:
+        current, _ = ring.next_index(index)
+        if current is None:
+            # finish frames already captured before stopping
+            if stop_event.is_set():
+                break
+            time.sleep(0.0005)
+            continue
+        index = current
+
+        frame, stamp = ring.read(index)
+        tracker.set_frame(frame, stamp)
+        if not ring.still_valid(index):
+            index += 1
+            continue
+
+        row = index % len(rows)
+        tracker.frame_num = row
+        tracker.data[:, row] = np.NaN
+        tracker.angle_data[row] = np.NaN
+
+        if tracker.roi_pupil is None:
+            try:
+                tracker.draw_pupil(index=0, verbose=False)
+                tracker.draw_refle(index=0, roi='pupil', verbose=False)
+            except AttributeError:
+                pass
+        tracker.track_pupil(verbose=False)
+        tracker.track_refle(verbose=False)
+
+        rows[row] = [stamp,
+                     tracker.data[0][row][0], tracker.data[0][row][1],
+                     tracker.data[1][row][0], tracker.data[1][row][1],
+                     tracker.angle_data[row]]
+        index += 1
+        result_count.value = index
+
+
+def encode_worker(ring, path, fps, stop_event):
+    """
+    Writes every frame of the ring it can keep up with to a video file.
+
+    :param ring: frame ring to read from
+    :param path: file save path
+    :param fps: frame rate of the file
+    :param stop_event: event set to stop
+    """
+    height, width = ring.shape[:2]
+    out = cv2.VideoWriter(path,
+                          fourcc=cv2.VideoWriter_fourcc('m', 'p', '4', 'v'),
+                          fps=fps,
+                          frameSize=(width, height))
+
+    # frames are copied out before writing, so one overwritten while being
+    # copied is caught by still_valid instead of encoded torn
+    copy = np.empty(ring.shape, np.uint8)
+
+    index = 0
+    skipped = 0
+    while True:
+        current, behind = ring.next_index(index)
+        if current is None:
+            # finish frames already captured before stopping
+            if stop_event.is_set():
+                break
+            time.sleep(0.001)
+            continue
+        index = current
+        skipped += behind
+
+        frame, _ = ring.read(index)
+        copy[...] = frame
+        if ring.still_valid(index):
+            out.write(copy)
+        else:
+            skipped += 1
+        index += 1
+
+    out.release()
+    if skipped:
+        print('encoder skipped {} frames'.format(skipped))
+
+
+class LivePipeline(object):
+    """
+    Runs capture, tracking and optionally encoding in separate processes,
+    sharing frames through a FrameRing. Display reads the ring from the
+    calling process.
+    """
+    def __init__(self, source=0, pupil_thresh=50, refle_thresh=190,
+                 record=None, fps=60, slots=8, result_size=600):
+        """
+        Constructor.
+
+        :param source: camera index or video path
+        :param pupil_thresh: pupil threshold
+        :param refle_thresh: reflection threshold
+        :param record: video path to record to, or None to not record
+        :param fps: frame rate of recording
+        :param slots: number of frame buffers
+        :param result_size: number of result rows kept
+        """
+        # probe frame size
+        cap = cv2.VideoCapture(source)
+        ret, frame = cap.read()
+        cap.release()
+        if not ret:
+            raise IOError('Could not read from {}.'.format(source))
+
+        self.ring = FrameRing(frame.shape, slots)
+        self.results = mp.RawArray(ctypes.c_double, result_size * 6)
+        self.result_count = mp.RawValue(ctypes.c_long, 0)
+        self.rows = np.frombuffer(self.results, np.float64).reshape(-1, 6)
+        self.rows.fill(np.NaN)
+        self.stop_event = mp.Event()
+
+        self.processes = [
+            mp.Process(target=capture_worker,
+                       args=(self.ring, source, self.stop_event)),
+            mp.Process(target=track_worker,
+                       args=(self.ring, self.results, self.result_count,
+                             pupil_thresh, refle_thresh, self.stop_event))]
+        if record is not None:
+            self.processes.append(
+                mp.Process(target=encode_worker,
+                           args=(self.ring, record, fps, self.stop_event)))
+
+    def start(self):
+        """
+        Starts all processes.
+        """
+        for process in self.processes:
+            process.daemon = True
+            process.start()
+
+    def stop(self):
+        """
+        Stops and waits for all processes.
+        """
+        self.stop_event.set()
+        for process in self.processes:
+            process.join()
+
+    def running(self):
+        """
+        :return: whether or not capture is still running
+        """
+        return not self.stop_event.is_set()
+
+    def latest(self):
+        """
+        Gets the latest captured frame, in place.
+
+        :return: (frame number, frame), or (None, None) if nothing captured
+        """
+        index = self.ring.count.value - 1
+        if index < 0:
+            return None, None
+        frame, _ = self.ring.read(index)
+        return index, frame
+
+    def latest_result(self):
+        """
+        Gets the latest tracking result.
+
+        :return: row of capture time, pupil x, y, refle x, y, angle
+        """
+        index = self.result_count.value - 1
+        if index < 0:
+            return None
+        return self.rows[index % len(self.rows)].copy()
+
+
+def main():
+    """
+    Runs the live pipeline from the command line, displaying the latest frame
+    and tracked pupil.
+    """
+    parser = argparse.ArgumentParser(description='Live multi-process '
+                                                 'pupil tracking.')
+    parser.add_argument('--source', default='0',
+                        help='camera index or video path')
+    parser.add_argument('--record', help='video file to record to')
+    parser.add_argument('--pupil-thresh', type=int, default=50)
+    parser.add_argument('--refle-thresh', type=int, default=190)
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source.isdigit() else args.source
+
+    pipeline = LivePipeline(source, args.pupil_thresh, args.refle_thresh,
+                            args.record)
+    pipeline.start()
+    try:
+        while pipeline.running():
+            index, frame = pipeline.latest()
+            result = pipeline.latest_result()
+            if frame is not None:
+                frame = frame.copy()
+                if result is not None and not np.isnan(result[1]):
+                    cv2.circle(frame, (int(result[1]), int(result[2])), 4,
+                               (255, 255, 255), 1)
+                cv2.imshow('PupilTracker live', frame)
+            if cv2.waitKey(15) & 0xFF == ord('q'):
+                break
+    except KeyboardInterrupt:
+        pass
+    pipeline.stop()
+    cv2.destroyAllWindows()
+
+
+if __name__ == '__main__':
+    main()
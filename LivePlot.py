@@ -0,0 +1,214 @@
+"""
+Live plot of the tracker's results, drawn by a separate process from shared
+memory, so plotting never takes time from tracking.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import ctypes
+import multiprocessing as mp
+import numpy as np
+
+# control flags shared with the plot process
+VERBOSE, PAUSED = range(2)
+
+# tracker arrays moved to shared memory
+SHARED = ('data', 'angle_data', 'time_data')
+
+
+def shared_array(shape):
+    """
+    Makes an array of doubles in shared memory, filled with NaN.
+
+    :param shape: shape of array
+    :return: (raw shared array, numpy view of it)
+    """
+    raw = mp.RawArray(ctypes.c_double, int(np.prod(shape)))
+    view = np.frombuffer(raw, np.float64).reshape(shape)
+    view.fill(np.NaN)
+    return raw, view
+
+
+def plot_worker(data, angle_data, time_data, control, num_frames, fps, rate,
+                stop_event):
+    """
+    Draws the plot from the shared arrays until stopped or the window is
+    closed. Runs in its own process.
+
+    :param data: shared pupil and reflection positions, shape (2, frames, 2)
+    :param angle_data: shared pupil angles
+    :param time_data: shared frame times, NaN for frames not yet read
+    :param control: shared flags, indexed by VERBOSE and PAUSED
+    :param num_frames: number of frames
+    :param fps: nominal frame rate, for times of frames not yet read
+    :param rate: redraws per second
+    :param stop_event: event set to stop
+    """
+    import matplotlib.pyplot as plt
+
+    data = np.frombuffer(data, np.float64).reshape((2, num_frames, 2))
+    angle_data = np.frombuffer(angle_data, np.float64)
+    time_data = np.frombuffer(time_data, np.float64)
+    estimate = np.arange(num_frames) / fps
+
+    fig, axes = plt.subplots(figsize=(9.6, 3))
+    fig.canvas.manager.set_window_title('PupilTracker plot')
+    angle_axes = axes.twinx()
+
+    guess_dif = 200
+    axes.set_ylim(-guess_dif, guess_dif)
+    axes.set_xlim(0, estimate[-1] if num_frames > 1 else 1)
+    axes.set_xlabel('time (s)')
+    axes.set_ylabel('pixels')
+    angle_axes.set_ylim(0, 180)
+
+    x_delta, = axes.plot([], [], color='red', label='x delta', linewidth=1)
+    y_delta, = axes.plot([], [], color='blue', label='y delta', linewidth=1)
+    x_apos, = axes.plot([], [], color='orange', label='x pos', linewidth=1)
+    y_apos, = axes.plot([], [], color='purple', label='y pos', linewidth=1)
+    pup_an, = angle_axes.plot([], [], color='green', label='angle',
+                              linewidth=1)
+    axes.legend(handles=[x_delta, y_delta, x_apos, y_apos, pup_an],
+                loc='upper left', fontsize=6)
+    fig.tight_layout()
+    plt.show(block=False)
+
+    while not stop_event.is_set() and plt.fignum_exists(fig.number):
+        if not control[PAUSED]:
+            times = np.where(np.isnan(time_data), estimate, time_data)
+
+            pupil_data = data[0]
+            refle_data = data[1]
+            x_norm = pupil_data[:, 0] - pupil_data[0][0]
+            y_norm = pupil_data[:, 1] - pupil_data[0][1]
+            refle_x_norm = refle_data[:, 0] - refle_data[0][0]
+            refle_y_norm = refle_data[:, 1] - refle_data[0][1]
+
+            x_delta.set_data(times, x_norm - refle_x_norm)
+            y_delta.set_data(times, y_norm - refle_y_norm)
+
+            verbose = bool(control[VERBOSE])
+            for line, values in [(x_apos, x_norm), (y_apos, y_norm),
+                                 (pup_an, angle_data)]:
+                line.set_visible(verbose)
+                if verbose:
+                    line.set_data(times, values)
+
+            fig.canvas.draw_idle()
+
+        # also runs the window's event loop
+        plt.pause(1 / rate)
+
+    plt.close(fig)
+
+
+class LivePlot(object):
+    """
+    Moves a tracker's position, angle and time arrays into shared memory and
+    plots them from another process. The tracker keeps writing its arrays
+    as usual; the plot process reads them at its own rate.
+    """
+    def __init__(self, rate=10):
+        """
+        Constructor.
+
+        :param rate: redraws per second
+        """
+        self.rate = rate
+        self.control = mp.RawArray(ctypes.c_int, 2)
+        self.stop_event = None
+        self.process = None
+
+        # raw shared arrays and the tracker's views of them
+        self.shared = None
+        self.views = None
+
+    def share(self, tracker, lock):
+        """
+        Replaces the tracker's position, angle and time arrays with copies in
+        shared memory, unless they already are. The tracker makes new arrays
+        when a video is opened, so this shares once per video.
+
+        :param tracker: tracker to share
+        :param lock: lock held by whatever writes the tracker's arrays, held
+            while they are copied and swapped
+        :return: raw shared arrays of positions, angles and times
+        """
+        if self.views is not None and all(
+                getattr(tracker, name) is view
+                for name, view in zip(SHARED, self.views)):
+            return self.shared
+
+        with lock:
+            shared, views = [], []
+            for name in SHARED:
+                current = getattr(tracker, name)
+                raw, view = shared_array(current.shape)
+                view[...] = current
+                setattr(tracker, name, view)
+                shared.append(raw)
+                views.append(view)
+
+        self.shared, self.views = shared, views
+        return shared
+
+    def start(self, tracker, lock):
+        """
+        Shares the tracker's results and opens the plot window, closing any
+        plot already open.
+
+        :param tracker: tracker to plot
+        :param lock: lock held by whatever writes the tracker's arrays, see
+            share
+        """
+        self.stop()
+
+        data, angle_data, time_data = self.share(tracker, lock)
+        # fresh interpreter, so the plot doesn't inherit the gui toolkit
+        if hasattr(mp, 'get_context'):
+            context = mp.get_context('spawn')
+        else:
+            context = mp
+        self.stop_event = context.Event()
+        self.process = context.Process(target=plot_worker,
+                                       args=(data, angle_data, time_data,
+                                             self.control,
+                                             tracker.num_frames, tracker.fps,
+                                             self.rate, self.stop_event))
+        self.process.daemon = True
+        self.process.start()
+
+    def stop(self):
+        """
+        Closes the plot window.
+        """
+        if self.process is not None:
+            self.stop_event.set()
+            self.process.join(1)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+
+    def running(self):
+        """
+        :return: whether or not the plot window is open
+        """
+        return self.process is not None and self.process.is_alive()
+
+    def set_verbose(self, verbose):
+        """
+        Sets whether or not to also plot absolute positions and angle.
+
+        :param verbose: whether or not to plot extra
+        """
+        self.control[VERBOSE] = int(verbose)
+
+    def set_paused(self, paused):
+        """
+        Pauses or resumes redrawing.
+
+        :param paused: whether or not to stop redrawing
+        """
+        self.control[PAUSED] = int(paused)
@@ -0,0 +1,462 @@
+"""
+Synchronized capture and tracking from several cameras or video files.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import argparse
+import multiprocessing as mp
+import signal
+import threading
+import time
+import cv2
+import numpy as np
+from PupilTracker import PupilTracker, HeadlessApp
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class CaptureThread(threading.Thread):
+    """
+    Grabs frames from one source on its own thread and stamps each with its
+    capture time. Cameras are stamped with the wall clock when the frame is
+    read, so streams from different cameras share a clock. Files are stamped
+    with their media time.
+    """
+    def __init__(self, source, frames, stop_event):
+        """
+        Constructor.
+
+        :param source: camera index or video path
+        :param frames: queue to put (frame number, timestamp, frame) on
+        :param stop_event: event set to stop capturing
+        """
+        super(CaptureThread, self).__init__()
+        self.daemon = True
+
+        self.source = source
+        self.live = isinstance(source, int)
+        self.frames = frames
+        self.stop_event = stop_event
+        self.dropped = 0
+
+        self.cap = cv2.VideoCapture(source)
+        if not self.cap.isOpened():
+            raise IOError('Could not open {}.'.format(source))
+        self.vid_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                         int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+    def run(self):
+        """
+        Reads frames until the source ends or capture is stopped. Cameras
+        never wait on a full queue; the frame is dropped instead so grabbing
+        keeps pace with the camera.
+        """
+        frame_num = 0
+        while not self.stop_event.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+
+            if self.live:
+                stamp = time.time()
+                try:
+                    self.frames.put_nowait((frame_num, stamp, frame))
+                except queue.Full:
+                    self.dropped += 1
+            else:
+                stamp = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                self.frames.put((frame_num, stamp, frame))
+
+            frame_num += 1
+
+        self.cap.release()
+        self.frames.put(None)
+
+
+class StreamTracker(object):
+    """
+    Tracks the frames of one capture thread. Runs in its own process with its
+    capture thread, see stream_worker, so streams don't share an interpreter
+    lock and each tracks as fast as it would alone, given free cores.
+    """
+    def __init__(self, frames, vid_size, pupil_thresh=50, refle_thresh=190,
+                 ring_size=600):
+        """
+        Constructor.
+
+        :param frames: queue to take (frame number, timestamp, frame) from
+        :param vid_size: (width, height) of frames
+        :param pupil_thresh: pupil threshold
+        :param refle_thresh: reflection threshold
+        :param ring_size: frames of data the tracker holds at once
+        """
+        self.frames = frames
+        self.tracker = PupilTracker(HeadlessApp(pupil_thresh, refle_thresh))
+        self.tracker.init_video(vid_size, ring_size, min(vid_size[0], 480))
+
+        # rows of frame number, timestamp, pupil x, y, refle x, y, angle
+        self.rows = []
+
+        # seconds spent from first frame to last, for throughput
+        self.elapsed = 0
+
+    def run(self):
+        """
+        Tracks frames until the capture thread ends.
+        """
+        tracker = self.tracker
+        start = None
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            if start is None:
+                start = time.time()
+            frame_num, stamp, frame = item
+
+            # tracker holds a ring of frames; clear slot so misses are NaN
+            tracker.frame_num = frame_num % tracker.num_frames
+            tracker.data[:, tracker.frame_num] = np.NaN
+            tracker.angle_data[tracker.frame_num] = np.NaN
+            tracker.set_frame(frame, stamp)
+
+            if tracker.roi_pupil is None:
+                self.acquire()
+            tracker.track_pupil(verbose=False)
+            tracker.track_refle(verbose=False)
+
+            pupil = tracker.data[0][tracker.frame_num]
+            refle = tracker.data[1][tracker.frame_num]
+            self.rows.append((frame_num, stamp, pupil[0], pupil[1],
+                              refle[0], refle[1],
+                              tracker.angle_data[tracker.frame_num]))
+
+        if start is not None:
+            self.elapsed = time.time() - start
+
+    def acquire(self):
+        """
+        Selects the first pupil found, and the first reflection within it.
+        """
+        try:
+            self.tracker.draw_pupil(index=0, verbose=False)
+            self.tracker.draw_refle(index=0, roi='pupil', verbose=False)
+        except AttributeError:
+            pass
+
+    def results(self):
+        """
+        Gets tracked rows as an array.
+
+        :return: array with a row per frame
+        """
+        return np.array(self.rows, dtype=float).reshape(-1, 7)
+
+    def throughput(self):
+        """
+        :return: frames tracked per second
+        """
+        if not self.elapsed:
+            return 0
+        return len(self.rows) / self.elapsed
+
+
+def stream_worker(stream, source, pupil_thresh, refle_thresh, queue_size,
+                  stop_event, results):
+    """
+    Captures and tracks one stream. Runs in its own process; the capture
+    thread grabs while the main thread tracks.
+
+    :param stream: index of the stream
+    :param source: camera index or video path
+    :param pupil_thresh: pupil threshold
+    :param refle_thresh: reflection threshold
+    :param queue_size: frames buffered between capture and tracking
+    :param stop_event: event set to stop capturing
+    :param results: queue to put (stream, rows, frames dropped, frames per
+        second, error message or None) on when done
+    """
+    # the parent stops streams on interrupt, so they can hand back results
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    frames = queue.Queue(maxsize=queue_size)
+    try:
+        capture = CaptureThread(source, frames, stop_event)
+        tracker = StreamTracker(frames, capture.vid_size, pupil_thresh,
+                                refle_thresh)
+        capture.start()
+        tracker.run()
+        capture.join()
+    except Exception as e:
+        # the parent waits for every stream to report
+        results.put((stream, np.empty((0, 7)), 0, 0,
+                     'stream {} ({}): {}'.format(stream, source, e)))
+        return
+
+    results.put((stream, tracker.results(), capture.dropped,
+                 tracker.throughput(), None))
+
+
+class MultiSourceTracker(object):
+    """
+    Opens several cameras or files, and captures and tracks each in its own
+    process, then aligns the results by capture time. Cameras are stamped
+    with the wall clock, which all processes share.
+    """
+    def __init__(self, sources, pupil_thresh=50, refle_thresh=190,
+                 queue_size=64):
+        """
+        Constructor.
+
+        :param sources: list of camera indices or video paths
+        :param pupil_thresh: pupil threshold, same for all streams
+        :param refle_thresh: reflection threshold, same for all streams
+        :param queue_size: frames buffered between capture and tracking
+        """
+        # fresh interpreters, so no locks held by other threads are inherited
+        if hasattr(mp, 'get_context'):
+            context = mp.get_context('spawn')
+        else:
+            context = mp
+        self.stop_event = context.Event()
+        self.result_queue = context.Queue()
+
+        self.processes = []
+        for stream, source in enumerate(sources):
+            process = context.Process(target=stream_worker,
+                                      args=(stream, source, pupil_thresh,
+                                            refle_thresh, queue_size,
+                                            self.stop_event,
+                                            self.result_queue))
+            process.daemon = True
+            self.processes.append(process)
+
+        # per stream, filled in by join
+        self.results = [np.empty((0, 7))] * len(sources)
+        self.dropped = [0] * len(sources)
+        self.fps = [0] * len(sources)
+        self.errors = []
+        self.reported = [False] * len(sources)
+        self.finished = 0
+
+    def start(self):
+        """
+        Starts capturing and tracking all streams.
+        """
+        for process in self.processes:
+            process.start()
+
+    def stop(self):
+        """
+        Stops capturing. Trackers finish the frames already captured.
+        """
+        self.stop_event.set()
+
+    def collect(self, timeout=None):
+        """
+        Takes the results of one finished stream, if any.
+
+        :param timeout: seconds to wait, or None to wait until one finishes
+        :return: whether or not a stream's results were taken
+        """
+        try:
+            stream, rows, dropped, fps, error = self.result_queue.get(
+                timeout=timeout)
+        except queue.Empty:
+            return False
+        self.results[stream] = rows
+        self.dropped[stream] = dropped
+        self.fps[stream] = fps
+        if error is not None:
+            self.errors.append(error)
+        self.reported[stream] = True
+        self.finished += 1
+        return True
+
+    def check_exited(self):
+        """
+        Counts streams whose process died without reporting, e.g. killed, as
+        finished with an error.
+        """
+        for stream, process in enumerate(self.processes):
+            if self.reported[stream] or process.exitcode is None:
+                continue
+            # anything it put before exiting is still in the pipe
+            if self.collect(0.1):
+                continue
+            self.errors.append('stream {} exited with code {} without '
+                               'results'.format(stream, process.exitcode))
+            self.reported[stream] = True
+            self.finished += 1
+
+    def join(self):
+        """
+        Waits for all streams to finish and collects their results.
+
+        :raise IOError: if a source couldn't be opened or a stream failed
+        """
+        # results are taken first; a process can't exit until they're read
+        while self.finished < len(self.processes):
+            if not self.collect(0.1):
+                self.check_exited()
+        for process in self.processes:
+            process.join()
+
+        if self.errors:
+            raise IOError(' '.join(self.errors))
+
+    def run(self, duration=None):
+        """
+        Captures and tracks until the sources end, a duration passes, or
+        interrupted.
+
+        :param duration: seconds to capture for, or None for until the end
+        :raise IOError: if a source couldn't be opened
+        """
+        self.start()
+        start = time.time()
+        try:
+            while self.finished < len(self.processes):
+                if duration is not None and time.time() - start > duration:
+                    break
+                if not self.collect(0.05):
+                    self.check_exited()
+        except KeyboardInterrupt:
+            pass
+        self.stop()
+        self.join()
+
+    def aligned(self, tolerance=None):
+        """
+        Aligns the streams on the timestamps of the first stream. Each row
+        takes the frame from every other stream closest in time, or NaN if
+        none is within the tolerance.
+
+        :param tolerance: max time difference in seconds, defaults to half
+            the frame interval of the first stream
+        :return: array of time, then frame number, time offset, pupil x, y,
+            refle x, y and angle for each stream
+        """
+        ref = self.results[0]
+        times = ref[:, 1]
+        if tolerance is None:
+            if len(times) > 1:
+                tolerance = np.median(np.diff(times)) / 2
+            else:
+                tolerance = 0
+
+        columns = [times]
+        for results in self.results:
+            stream = np.full((len(times), 7), np.NaN)
+
+            if len(results):
+                # nearest of the neighbouring timestamps
+                stamps = results[:, 1]
+                right = np.clip(np.searchsorted(stamps, times), 0,
+                                len(stamps) - 1)
+                left = np.clip(right - 1, 0, len(stamps) - 1)
+                nearer_left = np.abs(stamps[left] - times) < \
+                    np.abs(stamps[right] - times)
+                nearest = np.where(nearer_left, left, right)
+
+                offset = stamps[nearest] - times
+                match = np.abs(offset) <= tolerance
+                stream[match] = results[nearest[match]]
+                stream[match, 1] = offset[match]
+
+            columns.append(stream)
+
+        return np.column_stack(columns)
+
+    def dump_data(self, path, tolerance=None):
+        """
+        Dumps the time aligned results to file.
+
+        :param path: file save path
+        :param tolerance: max time difference in seconds for a match
+        """
+        names = ['time']
+        for i in range(len(self.results)):
+            names.extend(['{}_{}'.format(name, i) for name in
+                          ['frame', 'offset', 'pupil_x', 'pupil_y',
+                           'refle_x', 'refle_y', 'angle']])
+
+        np.savetxt(path, self.aligned(tolerance),
+                   delimiter=',',
+                   fmt='%.6f',
+                   header=','.join(names))
+
+        for i, dropped in enumerate(self.dropped):
+            if dropped:
+                print('stream {} dropped {} frames'.format(i, dropped))
+        print('data dumped')
+
+
+def measure_scaling(source, streams=4, pupil_thresh=50, refle_thresh=190):
+    """
+    Measures tracking throughput per stream with one stream, then with
+    several copies of the same video at once. With a core per stream, the
+    rate per stream should hold.
+
+    :param source: video path
+    :param streams: number of streams to compare with one
+    :param pupil_thresh: pupil threshold
+    :param refle_thresh: reflection threshold
+    :return: list of frames per second of each stream with one stream, and
+        with all streams
+    """
+    rates = []
+    for count in (1, streams):
+        multi = MultiSourceTracker([source] * count, pupil_thresh,
+                                   refle_thresh)
+        multi.run()
+        rates.append(list(multi.fps))
+    return rates
+
+
+def main():
+    """
+    Tracks several sources from the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description='Capture and track several cameras or videos at once.')
+    parser.add_argument('sources', nargs='+',
+                        help='camera indices or video paths')
+    parser.add_argument('--out', help='data file to save')
+    parser.add_argument('--seconds', type=float,
+                        help='how long to capture cameras for')
+    parser.add_argument('--pupil-thresh', type=int, default=50)
+    parser.add_argument('--refle-thresh', type=int, default=190)
+    parser.add_argument('--scaling', type=int, metavar='STREAMS',
+                        help='instead, measure frames per second per stream '
+                             'tracking the first video alone and as this '
+                             'many streams')
+    args = parser.parse_args()
+
+    sources = [int(s) if s.isdigit() else s for s in args.sources]
+
+    if args.scaling:
+        single, several = measure_scaling(sources[0], args.scaling,
+                                          args.pupil_thresh,
+                                          args.refle_thresh)
+        print('1 stream: {:.1f} fps'.format(single[0]))
+        print('{} streams: {} fps per stream, mean {:.1f}'.format(
+            len(several), ', '.join('{:.1f}'.format(f) for f in several),
+            np.mean(several)))
+        return
+    if args.out is None:
+        parser.error('--out is required')
+
+    multi = MultiSourceTracker(sources, args.pupil_thresh, args.refle_thresh)
+    multi.run(args.seconds)
+    multi.dump_data(args.out)
+
+
+if __name__ == '__main__':
+    main()
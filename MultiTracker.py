@@ -0,0 +1,280 @@
+"""
+Tracks several eyes (or animals) in the same video with a single decode.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import cv2
+import numpy as np
+from BufferPool import BufferPool
+from PupilTracker import PupilTracker, HeadlessApp
+
+
+class SlotTracker(PupilTracker):
+    """
+    Tracker for one target of a MultiTracker. Has its own rois, thresholds and
+    data, but gets its frames and grayscale image from the MultiTracker.
+    """
+    def __init__(self, parent, pupil_thresh=50, refle_thresh=190,
+                 search_roi=None):
+        """
+        Constructor.
+
+        :param parent: MultiTracker the slot belongs to
+        :param pupil_thresh: pupil threshold
+        :param refle_thresh: reflection threshold
+        :param search_roi: region searched when acquiring the pupil, so slots
+            can be told apart (e.g. left or right half of the frame)
+        """
+        super(SlotTracker, self).__init__(HeadlessApp(pupil_thresh,
+                                                      refle_thresh))
+        self.parent = parent
+        self.search_roi = search_roi
+
+    def process_image(self, img, roi=None, stage='frame'):
+        """
+        ROIs and blurs the grayscale frame shared by all slots. The image
+        passed in is ignored; it is always the current frame.
+
+        :param img: frame being processed
+        :param roi: region of interest being processed
+        :param stage: name of the buffer to use
+        :return: grayscaled, blurred, ROIed frame
+        """
+        gray = self.parent.gray
+        if roi is not None:
+            # roi
+            self.dx = max(roi[0][0], 0)
+            self.dy = max(roi[0][1], 0)
+            gray = gray[self.dy:roi[1][1],
+                        self.dx:roi[1][0]]
+        else:
+            self.dx = 0
+            self.dy = 0
+
+        # gaussian filter
+        return cv2.GaussianBlur(gray, (5, 5), 0,
+                                dst=self.buffers.like(stage + '_gauss', gray))
+
+    def acquire(self, verbose=False):
+        """
+        Selects the first pupil found in the search roi, and the first
+        reflection within that pupil.
+
+        :param verbose: whether or not to draw extra
+        :raise AttributeError: if no pupil found
+        """
+        self.draw_pupil(index=0, roi=self.search_roi, verbose=verbose)
+        try:
+            self.draw_refle(index=0, roi='pupil', verbose=verbose)
+        except AttributeError:
+            self.roi_refle = None
+
+
+class MultiTracker(object):
+    """
+    Holds N independent target slots, all fed from one decode and one
+    grayscale conversion per frame, so each extra eye only costs its roi work.
+    """
+    def __init__(self):
+        """
+        Constructor.
+        """
+        self.cap = None
+        self.slots = []
+
+        # frames
+        self.frame = None
+        self.gray = None
+        self.display_frame = None
+        self.buffers = BufferPool()
+
+        # frame info
+        self.frame_num = None
+        self.frame_time = None
+        self.num_frames = None
+        self.fps = None
+        self.vid_size = None
+        self.scaled_size = None
+        self.display_scale = None
+
+    def add_slot(self, pupil_thresh=50, refle_thresh=190, search_roi=None):
+        """
+        Adds a target to track.
+
+        :param pupil_thresh: pupil threshold
+        :param refle_thresh: reflection threshold
+        :param search_roi: region searched when acquiring the pupil
+        :return: the new slot
+        """
+        slot = SlotTracker(self, pupil_thresh, refle_thresh, search_roi)
+        self.slots.append(slot)
+        if self.cap is not None:
+            self.init_slot(slot)
+        return slot
+
+    def init_slot(self, slot):
+        """
+        Sizes a slot's data and params for the current video.
+
+        :param slot: slot to init
+        """
+        slot.num_frames = self.num_frames
+        slot.fps = self.fps
+        slot.vid_size = self.vid_size
+        slot.scaled_size = self.scaled_size
+        slot.display_scale = self.display_scale
+        slot.init_data()
+        self.share_frame(slot)
+
+    def init_cap(self, video_file, window_width=960):
+        """
+        Creates capture object for video and loads first frame.
+
+        :param video_file: video path
+        :param window_width: width of the display frame
+        """
+        if self.cap is not None:
+            self.cap.release()
+
+        self.cap = cv2.VideoCapture(video_file)
+        self.num_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        if not 0 < self.fps < 1000:
+            self.fps = 60
+        self.vid_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                         int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.scaled_size = (window_width,
+                            int(window_width * self.vid_size[1] /
+                                self.vid_size[0]))
+        self.display_scale = self.vid_size[0] / window_width
+
+        # load first frame, then go back so next_frame starts there
+        self.frame_num = -1
+        self.next_frame()
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.frame_num = -1
+
+        for slot in self.slots:
+            self.init_slot(slot)
+
+    def release_cap(self):
+        """
+        Destroys cap object.
+        """
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        else:
+            raise IOError('VideoCapture not created. Nothing to release.')
+
+    def share_frame(self, slot):
+        """
+        Points a slot at the current frames.
+
+        :param slot: slot to update
+        """
+        slot.frame = self.frame
+        slot.display_frame = self.display_frame
+        slot.frame_num = self.frame_num
+        slot.frame_time = self.frame_time
+        slot.overlay.clear()
+
+    def next_frame(self):
+        """
+        Decodes the next frame once and shares it, and its timestamp, with
+        every slot.
+
+        :raise EOFError: if at end of video file
+        :raise IOError: if no video file loaded
+        """
+        if self.cap is None:
+            raise IOError('No video loaded.')
+
+        ret, frame = self.cap.read(
+            self.buffers.get('capture', (self.vid_size[1], self.vid_size[0],
+                                         3)))
+        if not ret:
+            raise EOFError('Video end.')
+        self.frame_time = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+
+        self.frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB,
+                                  dst=self.buffers.like('frame', frame))
+        self.gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY,
+                                 dst=self.buffers.gray('gray', frame))
+        self.display_frame = cv2.resize(
+            self.frame, (self.scaled_size[0], self.scaled_size[1]),
+            dst=self.buffers.get('display', (self.scaled_size[1],
+                                             self.scaled_size[0], 3)))
+        self.frame_num += 1
+
+        for slot in self.slots:
+            self.share_frame(slot)
+            # slots not yet sized for a video have nowhere to stamp
+            if slot.data is not None:
+                slot.stamp_frame()
+
+    def acquire(self, verbose=False):
+        """
+        Selects pupils and reflections for all slots not yet tracking.
+
+        :param verbose: whether or not to draw extra
+        """
+        for slot in self.slots:
+            if slot.roi_pupil is None:
+                try:
+                    slot.acquire(verbose)
+                except AttributeError:
+                    pass
+
+    def track(self, verbose=False):
+        """
+        Tracks every slot in the current frame.
+
+        :param verbose: whether or not to draw extra
+        """
+        for slot in self.slots:
+            slot.track_pupil(verbose=verbose)
+            slot.track_refle(verbose=verbose)
+
+    def run(self, verbose=False):
+        """
+        Tracks all slots through the rest of the video. Slots without a pupil
+        are acquired on the first frame.
+
+        :param verbose: whether or not to draw extra
+        """
+        while True:
+            try:
+                self.next_frame()
+            except EOFError:
+                break
+            if self.frame_num == 0:
+                self.acquire(verbose)
+            self.track(verbose)
+
+    def dump_data(self, path):
+        """
+        Dumps data of all slots to one file, one row per frame and a group of
+        columns per slot.
+
+        :param path: file save path
+        """
+        columns = [np.arange(self.num_frames)]
+        names = ['frame']
+        for i, slot in enumerate(self.slots):
+            columns.extend([slot.data[0][:, 0], slot.data[0][:, 1],
+                            slot.data[1][:, 0], slot.data[1][:, 1],
+                            slot.angle_data])
+            names.extend(['{}_{}'.format(name, i) for name in
+                          ['pupil_x', 'pupil_y', 'refle_x', 'refle_y',
+                           'angle']])
+
+        np.savetxt(path, np.column_stack(columns),
+                   delimiter=',',
+                   fmt='%g',
+                   header=','.join(names))
+
+        print('data dumped')
@@ -0,0 +1,312 @@
+"""
+Online smoothing and saccade detection, run on each frame as it is tracked,
+for gaze contingent experiments. Attached to a tracker as a coordinate sink.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import argparse
+import math
+import timeit
+from collections import deque
+import numpy as np
+
+
+def smoothing(cutoff, dt):
+    """
+    Smoothing factor of a first order low-pass filter.
+
+    :param cutoff: cutoff frequency in Hz
+    :param dt: seconds since last sample
+    :return: weight of the new sample
+    """
+    tau = 1 / (2 * math.pi * cutoff)
+    return 1 / (1 + tau / dt)
+
+
+class OneEuroFilter(object):
+    """
+    One Euro filter of a 2d position: a low-pass whose cutoff rises with
+    speed, so the position is smooth while the eye is still and lags little
+    while it moves. See Casiez et al., CHI 2012.
+    """
+    def __init__(self, min_cutoff=1.0, beta=0.05, d_cutoff=10.0):
+        """
+        Constructor.
+
+        :param min_cutoff: cutoff in Hz while still. Lower is smoother.
+        :param beta: cutoff increase per pixel/s. Higher lags less.
+        :param d_cutoff: cutoff in Hz of the velocity estimate
+        """
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the past, so the next sample is taken as is.
+        """
+        self.t = None
+        self.x = self.y = 0.0
+        self.vx = self.vy = 0.0
+
+    def __call__(self, t, x, y):
+        """
+        Filters a sample.
+
+        :param t: sample time in seconds
+        :param x: x position
+        :param y: y position
+        :return: filtered (x, y, vx, vy)
+        """
+        if self.t is None or t <= self.t:
+            if self.t is None:
+                self.x, self.y = x, y
+            self.t = t
+            return self.x, self.y, self.vx, self.vy
+
+        dt = t - self.t
+        self.t = t
+
+        a = smoothing(self.d_cutoff, dt)
+        self.vx += a * ((x - self.x) / dt - self.vx)
+        self.vy += a * ((y - self.y) / dt - self.vy)
+
+        cutoff = self.min_cutoff + self.beta * math.hypot(self.vx, self.vy)
+        a = smoothing(cutoff, dt)
+        self.x += a * (x - self.x)
+        self.y += a * (y - self.y)
+
+        return self.x, self.y, self.vx, self.vy
+
+
+class OnlineFilter(object):
+    """
+    Coordinate sink that smooths the reflection corrected pupil position and
+    detects saccades as frames come in. A saccade starts when the filtered
+    speed rises above onset_speed and ends when it drops below offset_speed.
+
+    State is a handful of numbers, so each frame costs the same however long
+    the recording. The time each frame takes is recorded and summarized by
+    report.
+    """
+    def __init__(self, fps=None, correct=True, min_cutoff=1.0, beta=0.05,
+                 d_cutoff=10.0, onset_speed=300, offset_speed=150,
+                 max_gap=5, on_event=None, history=1000):
+        """
+        Constructor.
+
+        :param fps: frame rate to time samples by frame number, or None to
+            use capture times
+        :param correct: whether or not to subtract the reflection position;
+            if so, frames without a reflection count as missing
+        :param min_cutoff: see OneEuroFilter
+        :param beta: see OneEuroFilter
+        :param d_cutoff: see OneEuroFilter
+        :param onset_speed: pixels/s that starts a saccade
+        :param offset_speed: pixels/s that ends a saccade
+        :param max_gap: missing frames after which the filter starts over
+        :param on_event: callable given each event, or None
+        :param history: number of recent events and frame times kept
+        """
+        self.fps = fps
+        self.correct = correct
+        self.onset_speed = onset_speed
+        self.offset_speed = offset_speed
+        self.max_gap = max_gap
+        self.on_event = on_event
+
+        self.filter = OneEuroFilter(min_cutoff, beta, d_cutoff)
+        self.events = deque(maxlen=history)
+        self.latency = deque(maxlen=history)
+        self.reset()
+
+    def reset(self):
+        """
+        Starts over and forgets frame times.
+        """
+        self.restart()
+        self.latency.clear()
+        self.samples = 0
+        self.total = 0.0
+        self.worst = 0.0
+
+    def restart(self):
+        """
+        Starts filtering over, e.g. after seeking.
+        """
+        self.filter.reset()
+        self.last_frame = None
+        self.missing = 0
+        self.saccade = None
+
+        # latest output
+        self.frame_num = None
+        self.position = (np.NaN, np.NaN)
+        self.speed = np.NaN
+        self.in_saccade = False
+
+    def publish(self, frame_num, capture_time, pupil, refle, angle):
+        """
+        Filters a frame's position and checks for saccade onset or end.
+
+        :param frame_num: frame number
+        :param capture_time: time the frame was captured
+        :param pupil: pupil (x, y)
+        :param refle: reflection (x, y)
+        :param angle: pupil angle
+        """
+        start = timeit.default_timer()
+
+        if self.last_frame is not None and frame_num != self.last_frame + 1:
+            # seeked
+            self.restart()
+        self.last_frame = frame_num
+        self.frame_num = frame_num
+
+        if self.fps:
+            t = frame_num / self.fps
+        else:
+            t = capture_time
+
+        x, y = float(pupil[0]), float(pupil[1])
+        if self.correct:
+            x -= float(refle[0])
+            y -= float(refle[1])
+
+        if math.isnan(x) or math.isnan(y):
+            self.missing += 1
+            if self.missing > self.max_gap:
+                self.filter.reset()
+                self.end_saccade(frame_num, t, lost=True)
+            self.position = (np.NaN, np.NaN)
+            self.speed = np.NaN
+        else:
+            self.missing = 0
+            fx, fy, vx, vy = self.filter(t, x, y)
+            self.position = (fx, fy)
+            self.speed = math.hypot(vx, vy)
+
+            if self.saccade is None and self.speed > self.onset_speed:
+                self.saccade = [frame_num, t, fx, fy, self.speed]
+                self.emit(('saccade_start', frame_num, t, fx, fy))
+            elif self.saccade is not None:
+                self.saccade[4] = max(self.saccade[4], self.speed)
+                if self.speed < self.offset_speed:
+                    self.end_saccade(frame_num, t)
+
+        self.in_saccade = self.saccade is not None
+
+        elapsed = timeit.default_timer() - start
+        self.latency.append(elapsed)
+        self.samples += 1
+        self.total += elapsed
+        self.worst = max(self.worst, elapsed)
+
+    def end_saccade(self, frame_num, t, lost=False):
+        """
+        Ends the saccade in progress, if any.
+
+        :param frame_num: frame it ended on
+        :param t: time it ended
+        :param lost: whether or not it ended because the eye was lost, in
+            which case no amplitude is given
+        """
+        if self.saccade is None:
+            return
+        start_frame, start_t, sx, sy, peak = self.saccade
+        self.saccade = None
+
+        if lost:
+            amplitude = np.NaN
+        else:
+            amplitude = math.hypot(self.position[0] - sx,
+                                   self.position[1] - sy)
+        self.emit(('saccade_end', frame_num, t, self.position[0],
+                   self.position[1], t - start_t, amplitude, peak))
+
+    def emit(self, event):
+        """
+        Records an event and passes it on.
+
+        :param event: tuple of kind, frame number, time, x, y and, for
+            saccade ends, duration, amplitude and peak speed
+        """
+        self.events.append(event)
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def report(self):
+        """
+        Summarizes time spent per frame.
+
+        :return: dict of frames, mean and max since reset and median and 99th
+            percentile of recent frames, in ms
+        """
+        stats = dict(samples=self.samples)
+        if self.samples:
+            stats['mean_ms'] = 1000 * self.total / self.samples
+            stats['max_ms'] = 1000 * self.worst
+        if self.latency:
+            stats['median_ms'] = 1000 * np.median(self.latency)
+            stats['p99_ms'] = 1000 * np.percentile(self.latency, 99)
+        return stats
+
+    def close(self):
+        """
+        Nothing to release; here so the filter can be closed like any sink.
+        """
+        pass
+
+
+def measure_latency(count=100000, fps=500):
+    """
+    Measures per frame overhead on a synthetic trace of fixations and
+    saccades with tracking noise.
+
+    :param count: number of frames
+    :param fps: frame rate of the trace
+    :return: dict of latency stats, and the number of saccades found and in
+        the trace
+    """
+    rng = np.random.RandomState(0)
+    hold = fps // 2
+    targets = rng.uniform(-100, 100, (count // hold + 1, 2))
+    pupil = np.repeat(targets, hold, axis=0)[:count]
+    targets = targets[:(count - 1) // hold + 1]
+    pupil += rng.normal(0, 0.5, pupil.shape)
+    refle = np.zeros(2)
+
+    online = OnlineFilter(fps=fps, history=count)
+    for frame_num in range(count):
+        online.publish(frame_num, None, pupil[frame_num], refle, 0)
+
+    stats = online.report()
+    stats['saccades'] = sum(1 for e in online.events if e[0] == 'saccade_end')
+    stats['targets'] = len(targets) - 1
+    return stats
+
+
+def main():
+    """
+    Measures filter overhead from the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description='Measure online filter overhead per frame.')
+    parser.add_argument('--count', type=int, default=100000,
+                        help='frames to filter')
+    parser.add_argument('--fps', type=int, default=500,
+                        help='frame rate of the synthetic trace')
+    args = parser.parse_args()
+
+    stats = measure_latency(args.count, args.fps)
+    print('{samples} frames, mean {mean_ms:.4f} ms, median {median_ms:.4f} '
+          'ms, p99 {p99_ms:.4f} ms, max {max_ms:.4f} ms'.format(**stats))
+    print('{saccades} saccades detected of {targets}'.format(**stats))
+
+
+if __name__ == '__main__':
+    main()
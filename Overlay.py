@@ -0,0 +1,95 @@
+"""
+Annotations kept as a short list of drawing primitives, so they can be drawn
+over a frame only when it is shown or saved, and undone by forgetting them.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import cv2
+
+
+class Overlay(object):
+    """
+    Vector overlay for the display frame. Drawing methods take the same
+    arguments as the OpenCV functions they stand in for, minus the image, and
+    colors are RGB like the display frame. Primitives are drawn in the order
+    they were added.
+    """
+    def __init__(self):
+        """
+        Constructor.
+        """
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def clear(self):
+        """
+        Removes all annotations.
+        """
+        self.items = []
+
+    def line(self, pt1, pt2, color, thickness=1):
+        """
+        Adds a line.
+        """
+        self.items.append(('line', (pt1, pt2), color, thickness))
+
+    def ellipse(self, box, color, thickness=1):
+        """
+        Adds an ellipse, given as ((cx, cy), (w, h), angle).
+        """
+        self.items.append(('ellipse', (box,), color, thickness))
+
+    def rectangle(self, pt1, pt2, color, thickness=1):
+        """
+        Adds an upright rectangle.
+        """
+        self.items.append(('rectangle', (pt1, pt2), color, thickness))
+
+    def contours(self, contours, index, color, thickness=1):
+        """
+        Adds contours, as drawn by cv2.drawContours.
+        """
+        self.items.append(('contours', (contours, index), color, thickness))
+
+    def pip(self, src):
+        """
+        Adds a picture in picture: a region of the annotated frame, copied to
+        the top right corner.
+
+        :param src: [(x1, y1), (x2, y2)] region to copy
+        """
+        self.items.append(('pip', (src,), None, None))
+
+    def render(self, img, bgr=False):
+        """
+        Draws the annotations onto an image.
+
+        :param img: image to draw on, the same size as the display frame
+        :param bgr: whether or not the image is BGR instead of RGB
+        :return: the image
+        """
+        for kind, args, color, thickness in self.items:
+            if color is not None and bgr:
+                color = color[::-1]
+
+            if kind == 'line':
+                cv2.line(img, args[0], args[1], color, thickness)
+            elif kind == 'ellipse':
+                cv2.ellipse(img, args[0], color, thickness)
+            elif kind == 'rectangle':
+                cv2.rectangle(img, args[0], args[1], color, thickness)
+            elif kind == 'contours':
+                cv2.drawContours(img, args[0], args[1], color, thickness)
+            elif kind == 'pip':
+                (x1, y1), (x2, y2) = args[0]
+                roi_image = img[max(y1, 0):max(y2, 0),
+                                max(x1, 0):max(x2, 0)].copy()
+                img[0:roi_image.shape[0],
+                    img.shape[1]-roi_image.shape[1]:img.shape[1]] = roi_image
+
+        return img
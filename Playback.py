@@ -0,0 +1,282 @@
+"""
+Playback scheduling. Tracking runs on a worker thread, either as fast as it
+can or paced to the video's frame rate, and the display picks up the latest
+frame on its own schedule.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import threading
+import time
+from collections import deque
+
+MODES = ('fast', 'realtime', 'step')
+
+# optional work, in the order it is given up when falling behind. The plot
+# process competes with the step for cores, and the display holds the lock
+# while it composites a frame, stalling the step; so both are shed with the
+# step's own extras
+SHED_ORDER = ('plot', 'verbose', 'pip', 'display')
+
+
+class LoadGovernor(object):
+    """
+    Watches how often frames finish late and sheds optional work,
+    one item of SHED_ORDER at a time, while too many do. Restores them, last
+    shed first, once frames are comfortably on time again. Tracking itself is
+    never shed.
+    """
+    def __init__(self, window=30, shed_above=0.2, restore_below=0.02,
+                 tolerance=1.25):
+        """
+        Constructor.
+
+        :param window: number of frames each decision is made over
+        :param shed_above: fraction of missed frames that sheds an item
+        :param restore_below: fraction of missed frames that restores one
+        :param tolerance: lateness, relative to the frame interval, that
+            counts as a miss. Above 1 so a camera read that waits for the next
+            frame doesn't count.
+        """
+        self.window = window
+        self.shed_above = shed_above
+        self.restore_below = restore_below
+        self.tolerance = tolerance
+
+        self.misses = deque(maxlen=window)
+        self.level = 0
+        self.changed = False
+        self.shed_frames = dict((name, 0) for name in SHED_ORDER)
+
+    def reset(self):
+        """
+        Restores everything and forgets past frames.
+        """
+        self.misses.clear()
+        self.changed = self.level != 0
+        self.level = 0
+        self.shed_frames = dict((name, 0) for name in SHED_ORDER)
+
+    def frame_done(self, lateness, interval):
+        """
+        Records how late a frame finished, and sheds or restores work.
+
+        :param lateness: seconds between the frame's due time and when it
+            finished tracking. Builds up over frames that are each only a
+            little slow.
+        :param interval: seconds between frames of the source
+        """
+        self.misses.append(lateness > self.tolerance * interval)
+        for name in self.shed():
+            self.shed_frames[name] += 1
+
+        if len(self.misses) < self.window:
+            return
+
+        missed = sum(self.misses) / len(self.misses)
+        if missed > self.shed_above and self.level < len(SHED_ORDER):
+            self.level += 1
+        elif missed < self.restore_below and self.level > 0:
+            self.level -= 1
+        else:
+            return
+
+        # judge the new level on its own frames
+        self.misses.clear()
+        self.changed = True
+
+    def active(self, name):
+        """
+        :param name: item of SHED_ORDER
+        :return: whether or not the item should be done
+        """
+        return SHED_ORDER.index(name) >= self.level
+
+    def shed(self):
+        """
+        :return: items currently shed
+        """
+        return SHED_ORDER[:self.level]
+
+    def report(self):
+        """
+        Describes what is shed now, and how long everything was shed for.
+
+        :return: report string
+        """
+        if self.level:
+            now = 'Falling behind, skipping ' + ', '.join(self.shed())
+        else:
+            now = 'Keeping up'
+
+        past = ['{} {} frames'.format(name, self.shed_frames[name])
+                for name in SHED_ORDER if self.shed_frames[name]]
+        if past:
+            now += ' (skipped ' + ', '.join(past) + ')'
+        return now
+
+
+class PlaybackScheduler(object):
+    """
+    Runs playback in one of three modes:
+
+    'fast': tracks frames back to back on a worker thread.
+    'realtime': tracks on a worker thread, paced to the source frame rate.
+        Falling behind never skips tracking a frame, only showing it.
+    'step': no worker; frames are advanced by the caller (arrow keys).
+
+    In the threaded modes the display polls take_new on a timer and shows the
+    latest frame, holding lock while it reads, so however many frames were
+    tracked in between only the newest is drawn. In realtime mode how late
+    each frame finished against the schedule is given to governor, which
+    decides what optional work step should skip. A frame more than
+    resync_after intervals late restarts the schedule from it, since a
+    camera can't run ahead to make up for a stall.
+    """
+    def __init__(self, step, on_end=None, mode='realtime', fps=60):
+        """
+        Constructor.
+
+        :param step: callable that reads and tracks one frame, raising
+            EOFError at the end of the video. Called with lock held.
+        :param on_end: callable run on the worker thread when the video ends
+            or can't be read
+        :param mode: one of MODES
+        :param fps: source frame rate, for realtime pacing
+        """
+        self.step = step
+        self.on_end = on_end
+        self.set_mode(mode)
+        self.fps = fps
+
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.governor = LoadGovernor()
+
+        # frame intervals late after which the schedule restarts, and the
+        # time frame 0 would have been due on the current schedule
+        self.resync_after = 2
+        self.anchor = None
+
+        # counts since started
+        self.start_time = None
+        self.frames_tracked = 0
+        self.frames_seen = 0
+
+    def set_mode(self, mode):
+        """
+        Sets the playback mode. Takes effect the next time playback starts.
+
+        :param mode: one of MODES
+        :raise AttributeError: if not a mode
+        """
+        if mode not in MODES:
+            raise AttributeError('No playback mode {}. Choose from {}.'.format(
+                mode, ', '.join(MODES)))
+        self.mode = mode
+
+    def start(self):
+        """
+        Starts the worker, unless in step mode or already running.
+
+        :return: whether or not a worker was started
+        """
+        if self.mode == 'step' or self.running():
+            return False
+
+        self.stop_event.clear()
+        self.start_time = time.time()
+        self.anchor = self.start_time
+        self.frames_tracked = 0
+        self.frames_seen = 0
+        self.governor.reset()
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """
+        Stops the worker and waits for the frame being tracked to finish.
+        """
+        self.stop_event.set()
+        if self.thread is not None and \
+                self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def running(self):
+        """
+        :return: whether or not the worker is running
+        """
+        return self.thread is not None and self.thread.is_alive()
+
+    def run(self):
+        """
+        Worker loop. Tracks until stopped or the video ends.
+        """
+        count = 0
+        while not self.stop_event.is_set():
+            if self.mode == 'realtime':
+                # wait for the frame's due time; if late, go straight on
+                delay = self.anchor + count / self.fps - time.time()
+                if delay > 0 and self.stop_event.wait(delay):
+                    break
+
+            with self.lock:
+                try:
+                    self.step()
+                except EOFError:
+                    ended = True
+                except IOError as e:
+                    print(e)
+                    ended = True
+                else:
+                    ended = False
+
+            if ended:
+                self.stop_event.set()
+                if self.on_end is not None:
+                    self.on_end()
+                break
+
+            if self.mode == 'realtime':
+                interval = 1 / self.fps
+                now = time.time()
+                lateness = now - (self.anchor + count * interval)
+                self.governor.frame_done(lateness, interval)
+                if lateness > self.resync_after * interval:
+                    # next frame is due now
+                    self.anchor = now - (count + 1) * interval
+
+            count += 1
+            self.frames_tracked += 1
+
+    def take_new(self):
+        """
+        Checks whether frames were tracked since the display last looked, and
+        marks them as shown. While the governor sheds display, a single new
+        frame isn't reported, so at most every other frame is shown.
+
+        :return: number of frames tracked since last time
+        """
+        new = self.frames_tracked - self.frames_seen
+        if new < 2 and not self.governor.active('display'):
+            return 0
+        self.frames_seen = self.frames_tracked
+        return new
+
+    def throughput(self):
+        """
+        :return: frames tracked per second since started
+        """
+        if self.start_time is None:
+            return 0
+        elapsed = time.time() - self.start_time
+        if elapsed <= 0:
+            return 0
+        return self.frames_tracked / elapsed
@@ -0,0 +1,413 @@
+"""
+Pupil detector engines and a harness to benchmark them against each other.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import cv2
+import numpy as np
+from BufferPool import BufferPool
+
+
+class PupilDetector(object):
+    """
+    Base class for pupil detectors. A detector takes a blurred, grayscaled
+    image (the whole frame or just the pupil roi) and returns a list of
+    candidate pupils as (ellipse, contour) pairs. Ellipses are in the same
+    ((cx, cy), (w, h), angle) form as cv2.fitEllipse, and both are in the
+    coordinates of the image passed in. Contour is only used for drawing and
+    may be None.
+    """
+    name = None
+
+    def __init__(self):
+        """
+        Constructor.
+        """
+        self.noise_kernel = np.ones((3, 3), np.uint8)
+        self.buffers = BufferPool()
+
+    def detect(self, grayed, thresh, param_scale, roi_size=None):
+        """
+        Searches for possible pupils.
+
+        :param grayed: blurred, grayscaled image
+        :param thresh: pupil threshold
+        :param param_scale: size of frame relative to 1080p
+        :param roi_size: half width of the roi if tracking
+        :return: list of (ellipse, contour) candidates
+        """
+        raise NotImplementedError
+
+    def threshold(self, grayed, thresh):
+        """
+        Thresholds and removes noise.
+
+        :param grayed: blurred, grayscaled image
+        :param thresh: pupil threshold
+        :return: binary image
+        """
+        _, thresh_pupil = cv2.threshold(
+            grayed, thresh, 255, cv2.THRESH_BINARY,
+            dst=self.buffers.view('thresh', grayed.shape, grayed.dtype))
+        return cv2.morphologyEx(thresh_pupil, cv2.MORPH_CLOSE,
+                                self.noise_kernel, iterations=2,
+                                dst=self.buffers.view('closed', grayed.shape,
+                                                      grayed.dtype))
+
+    def contours(self, grayed, thresh):
+        """
+        Thresholds and finds contours.
+
+        :param grayed: blurred, grayscaled image
+        :param thresh: pupil threshold
+        :return: list of contours
+        """
+        _, contours, _ = cv2.findContours(self.threshold(grayed, thresh),
+                                          cv2.RETR_TREE,
+                                          cv2.CHAIN_APPROX_SIMPLE)
+        return contours
+
+    @staticmethod
+    def area_ok(area, param_scale, roi_size=None):
+        """
+        Drops too small and too large pupils.
+
+        :param area: area of candidate
+        :param param_scale: size of frame relative to 1080p
+        :param roi_size: half width of the roi if tracking
+        :return: whether or not the area is plausible for a pupil
+        """
+        if area == 0:
+            return False
+
+        if roi_size is None:
+            return 2000 < area / param_scale < 120000
+        else:
+            return param_scale * 2000 < area < roi_size**2
+
+
+class ContourDetector(PupilDetector):
+    """
+    Threshold, close, contours, convex hull and ellipse fit. The original
+    detector.
+    """
+    name = 'contour'
+
+    def detect(self, grayed, thresh, param_scale, roi_size=None):
+        """
+        Searches for possible pupils.
+
+        :param grayed: blurred, grayscaled image
+        :param thresh: pupil threshold
+        :param param_scale: size of frame relative to 1080p
+        :param roi_size: half width of the roi if tracking
+        :return: list of (ellipse, contour) candidates
+        """
+        found_pupils = []
+        for cnt in self.contours(grayed, thresh):
+
+            # drop small and large
+            area = cv2.contourArea(cnt)
+            if not self.area_ok(area, param_scale, roi_size):
+                continue
+
+            # remove concavities, drop too few points
+            hull = cv2.convexHull(cnt)
+            if hull.shape[0] < 5:
+                continue
+
+            # drop too eccentric
+            circumference = cv2.arcLength(hull, True)
+            circularity = circumference ** 2 / (4*np.pi*area)
+            if circularity >= 1.6:
+                continue
+
+            found_pupils.append((cv2.fitEllipse(hull), hull))
+
+        return found_pupils
+
+
+class MomentsDetector(PupilDetector):
+    """
+    Threshold, close and contours, then takes centroid, axes and angle from
+    the contour moments. Skips the hull and ellipse fit.
+    """
+    name = 'moments'
+
+    def detect(self, grayed, thresh, param_scale, roi_size=None):
+        """
+        Searches for possible pupils.
+
+        :param grayed: blurred, grayscaled image
+        :param thresh: pupil threshold
+        :param param_scale: size of frame relative to 1080p
+        :param roi_size: half width of the roi if tracking
+        :return: list of (ellipse, contour) candidates
+        """
+        found_pupils = []
+        for cnt in self.contours(grayed, thresh):
+
+            m = cv2.moments(cnt)
+
+            # drop small and large
+            area = m['m00']
+            if not self.area_ok(area, param_scale, roi_size):
+                continue
+
+            # covariance of the blob gives axes and orientation
+            mu20 = m['mu20'] / area
+            mu02 = m['mu02'] / area
+            mu11 = m['mu11'] / area
+            spread = np.sqrt(((mu20 - mu02) / 2)**2 + mu11**2)
+            major = 4 * np.sqrt((mu20 + mu02) / 2 + spread)
+            minor = 4 * np.sqrt(max((mu20 + mu02) / 2 - spread, 0))
+
+            # drop too eccentric
+            if minor == 0 or major / minor >= 2:
+                continue
+
+            # fitEllipse gives angle of the minor (width) axis
+            theta = np.degrees(0.5 * np.arctan2(2 * mu11, mu20 - mu02))
+            angle = (theta + 90) % 180
+
+            ellipse = ((m['m10'] / area, m['m01'] / area),
+                       (minor, major),
+                       angle)
+            found_pupils.append((ellipse, cnt))
+
+        return found_pupils
+
+
+class StarburstDetector(PupilDetector):
+    """
+    Casts rays out from the center of the dark pixels and fits an ellipse to
+    the points where each ray leaves the dark pupil. Only ever returns one
+    candidate, so works best within the pupil roi.
+    """
+    name = 'starburst'
+
+    def __init__(self, num_rays=32, iterations=2):
+        """
+        Constructor.
+
+        :param num_rays: number of rays to cast
+        :param iterations: times to recast rays from the center of the last
+            edge points
+        """
+        super(StarburstDetector, self).__init__()
+
+        self.num_rays = num_rays
+        self.iterations = iterations
+        angles = np.linspace(0, 2*np.pi, num_rays, endpoint=False)
+        self.cos = np.cos(angles)[:, np.newaxis]
+        self.sin = np.sin(angles)[:, np.newaxis]
+
+    def detect(self, grayed, thresh, param_scale, roi_size=None):
+        """
+        Searches for the pupil.
+
+        :param grayed: blurred, grayscaled image
+        :param thresh: pupil threshold
+        :param param_scale: size of frame relative to 1080p
+        :param roi_size: half width of the roi if tracking
+        :return: list with the (ellipse, contour) candidate, or empty
+        """
+        if roi_size is None:
+            max_radius = int(np.sqrt(120000 * param_scale / np.pi))
+        else:
+            max_radius = roi_size
+        radii = np.arange(1, max_radius)
+        h, w = grayed.shape
+
+        # start from center of dark pixels, or darkest point if that misses
+        _, dark = cv2.threshold(grayed, thresh, 1, cv2.THRESH_BINARY_INV,
+                                dst=self.buffers.view('dark', grayed.shape,
+                                                      grayed.dtype))
+        m = cv2.moments(dark, True)
+        if m['m00'] == 0:
+            return []
+        cx = int(m['m10'] / m['m00'])
+        cy = int(m['m01'] / m['m00'])
+        if grayed[cy, cx] > thresh:
+            _, _, (cx, cy), _ = cv2.minMaxLoc(grayed)
+
+        edges = None
+        for _ in range(self.iterations):
+            xs = np.rint(cx + self.cos * radii).astype(int)
+            ys = np.rint(cy + self.sin * radii).astype(int)
+            inside = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+            np.clip(xs, 0, w - 1, out=xs)
+            np.clip(ys, 0, h - 1, out=ys)
+
+            # first point on each ray brighter than threshold
+            bright = (grayed[ys, xs] > thresh) & inside
+            hit = bright.any(axis=1)
+            first = bright.argmax(axis=1)
+
+            rays = np.nonzero(hit)[0]
+            if len(rays) < 5:
+                return []
+            edges = np.column_stack((xs[rays, first[rays]],
+                                     ys[rays, first[rays]]))
+
+            # drop rays that escaped through gaps in the pupil edge or
+            # stopped short on the reflection
+            dist = np.hypot(edges[:, 0] - cx, edges[:, 1] - cy)
+            median = np.median(dist)
+            edges = edges[(dist > 0.6 * median) & (dist < 1.6 * median)]
+            if len(edges) < 5:
+                return []
+
+            cx, cy = [int(i) for i in np.rint(edges.mean(axis=0))]
+
+        cnt = edges.reshape(-1, 1, 2).astype(np.int32)
+        ellipse = cv2.fitEllipse(cnt)
+
+        area = np.pi * ellipse[1][0] * ellipse[1][1] / 4
+        if not self.area_ok(area, param_scale, roi_size):
+            return []
+
+        return [(ellipse, cnt)]
+
+
+DETECTORS = dict((detector.name, detector) for detector in
+                 [ContourDetector, MomentsDetector, StarburstDetector])
+
+
+def get_detector(name):
+    """
+    Makes a detector by name.
+
+    :param name: name of detector engine
+    :return: detector
+    :raise AttributeError: if no detector with that name
+    """
+    if name not in DETECTORS:
+        raise AttributeError('No detector named {}. Choose from {}.'.format(
+            name, ', '.join(sorted(DETECTORS))))
+    return DETECTORS[name]()
+
+
+def benchmark(video_file, names=None, pupil_thresh=50, max_frames=300,
+              reference='contour'):
+    """
+    Runs each detector over the same frames and compares them on speed and
+    on agreement with a reference detector. Each detector tracks on its own,
+    searching the whole first frame and then a roi around its last pupil, the
+    same way the tracker does. Only the detect call is timed.
+
+    :param video_file: video path
+    :param names: names of detectors to compare, defaults to all
+    :param pupil_thresh: pupil threshold
+    :param max_frames: number of frames to run
+    :param reference: name of detector the others are compared to
+    :return: dict of results for each detector
+    """
+    import timeit
+
+    if names is None:
+        names = sorted(DETECTORS)
+    if reference not in names:
+        names = [reference] + list(names)
+
+    # decode once so decode time doesn't count
+    cap = cv2.VideoCapture(video_file)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        gauss = cv2.GaussianBlur(frame, (5, 5), 0)
+        frames.append(cv2.cvtColor(gauss, cv2.COLOR_BGR2GRAY))
+    cap.release()
+
+    if not frames:
+        raise IOError('Could not read video.')
+
+    param_scale = frames[0].shape[1] / 1920
+
+    centers = {}
+    results = {}
+    for name in names:
+        detector = get_detector(name)
+        centers[name] = np.full((len(frames), 2), np.NaN)
+        elapsed = 0
+        roi = None
+        roi_size = None
+
+        for i, grayed in enumerate(frames):
+            if roi is None:
+                image, dx, dy = grayed, 0, 0
+            else:
+                (dx, dy), (x2, y2) = roi
+                image = grayed[dy:y2, dx:x2]
+
+            start = timeit.default_timer()
+            found = detector.detect(image, pupil_thresh, param_scale,
+                                    roi_size)
+            elapsed += timeit.default_timer() - start
+
+            if not found:
+                continue
+
+            ellipse = found[0][0]
+            cx = ellipse[0][0] + dx
+            cy = ellipse[0][1] + dy
+            centers[name][i] = [cx, cy]
+
+            if roi_size is None:
+                roi_size = int(np.rint(max(ellipse[1]) * 1.75))
+            roi = [(max(int(cx) - roi_size, 0), max(int(cy) - roi_size, 0)),
+                   (int(cx) + roi_size, int(cy) + roi_size)]
+
+        results[name] = dict(ms_per_frame=1000 * elapsed / len(frames),
+                             detected=np.mean(~np.isnan(centers[name][:, 0])))
+
+    for name in names:
+        error = np.hypot(*(centers[name] - centers[reference]).T)
+        error = error[~np.isnan(error)]
+        if len(error):
+            results[name]['median_err'] = np.median(error)
+            results[name]['p95_err'] = np.percentile(error, 95)
+        else:
+            results[name]['median_err'] = np.NaN
+            results[name]['p95_err'] = np.NaN
+
+    print('{} frames, errors in pixels vs {}'.format(len(frames), reference))
+    print('{:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'detector', 'ms/frame', 'detected', 'median', 'p95'))
+    for name in names:
+        r = results[name]
+        print('{:>10} {:>10.3f} {:>10.1%} {:>10.2f} {:>10.2f}'.format(
+            name, r['ms_per_frame'], r['detected'], r['median_err'],
+            r['p95_err']))
+
+    return results
+
+
+def main():
+    """
+    Benchmarks detectors from the command line.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare pupil detectors.')
+    parser.add_argument('video_file')
+    parser.add_argument('--detectors', nargs='+', choices=sorted(DETECTORS))
+    parser.add_argument('--thresh', type=int, default=50,
+                        help='pupil threshold')
+    parser.add_argument('--frames', type=int, default=300,
+                        help='number of frames to run')
+    parser.add_argument('--reference', default='contour',
+                        choices=sorted(DETECTORS))
+    args = parser.parse_args()
+
+    benchmark(args.video_file, args.detectors, args.thresh, args.frames,
+              args.reference)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,8 +8,45 @@ Pupil tracking class.
 # Distributed under the terms of the GNU General Public License (GPL).
 
 from __future__ import division, print_function
+import os
+import time
 import cv2
 import numpy as np
+from BufferPool import BufferPool
+from CropArchive import CropCapture, CropWriter, is_crop_archive
+from Overlay import Overlay
+from PupilDetectors import get_detector
+
+# columns of the per frame geometry store: pupil ellipse as fit, its area,
+# circularity and candidate count, and reflection rect
+GEOMETRY_COLUMNS = ('pupil_cx', 'pupil_cy', 'pupil_w', 'pupil_h',
+                    'pupil_angle', 'pupil_area', 'pupil_circularity',
+                    'pupil_count', 'refle_cx', 'refle_cy', 'refle_w',
+                    'refle_h', 'refle_angle')
+
+
+class HeadlessApp(object):
+    """
+    Stands in for the GUI window when tracking without one. Holds the
+    thresholds the tracker reads from its app.
+    """
+    def __init__(self, pupil_thresh=50, refle_thresh=190):
+        """
+        Constructor.
+
+        :param pupil_thresh: pupil threshold
+        :param refle_thresh: reflection threshold
+        """
+        self.pupil_thresh = pupil_thresh
+        self.refle_thresh = refle_thresh
+
+    def toggle_to_dump_data(self, set_to=None):
+        """
+        Nothing to toggle without a GUI.
+
+        :param set_to: ignored
+        """
+        pass
 
 
 class PupilTracker(object):
@@ -27,15 +64,28 @@ class PupilTracker(object):
         # capture and output
         self.cap = None
         self.out = None
+        self.crop_out = None
+
+        # top left of the current frame in the source frame, for crop
+        # archives; added to stored positions
+        self.frame_offset = (0, 0)
 
         # frames
         self.frame = None
         self.display_frame = None
-        self.orig_frame = None
+
+        # annotations, drawn over the display frame when shown or saved
+        self.overlay = Overlay()
+
+        # output buffers reused every frame
+        self.buffers = BufferPool()
 
         # frame info
         self.frame_num = None
         self.num_frames = None
+        self.fps = None
+        self.start_time = None
+        self.frame_time = None
         self.vid_size = None
         self.display_scale = None
         self.scaled_size = None
@@ -52,6 +102,7 @@ class PupilTracker(object):
         self.param_scale = None
 
         # roi and processing params
+        self.detector = get_detector('contour')
         self.noise_kernel = None
         self.dx = None
         self.dy = None
@@ -67,6 +118,73 @@ class PupilTracker(object):
         self.angle = None
         self.angle_data = None
 
+        # temporal coherence gate; reuses last pupil when the roi changes by
+        # less than gate_tol gray levels on average. None disables
+        self.gate_tol = None
+        self.gate_thumb = None
+        self.scaled_ellipse = None
+        self.reused_data = None
+
+        # detection quality; per frame circularity, relative area change,
+        # candidate count and whether reflection is inside pupil roi
+        self.pupil_count = None
+        self.pupil_area = None
+        self.pupil_circularity = None
+        self.prev_area = None
+        self.quality_data = None
+
+        # full detection geometry per frame, see GEOMETRY_COLUMNS
+        self.pupil_ellipse = None
+        self.geometry_data = None
+
+        # blink detection; blink when the dark fraction of the roi drops
+        # below blink_ratio of its open eye baseline and its mean brightens
+        # by blink_rise gray levels, as when the lid covers the pupil. None
+        # disables, e.g. 0.3
+        self.blink_ratio = None
+        self.blink_rise = 2
+        self.dark_frac = None
+        self.dark_baseline = None
+        self.roi_mean = None
+        self.mean_baseline = None
+        self.blink_data = None
+
+        # frames whose positions were interpolated between sparse samples
+        # rather than tracked, see track_sparse
+        self.interp_data = None
+
+        # usual pupil area in a 1080p frame, for automatic selection
+        self.size_prior = 20000
+
+        # frames without a pupil (not counting blinks) before searching the
+        # whole frame again. None disables
+        self.reacquire_after = None
+        self.lost_frames = 0
+
+        # blink frames in a row after which the whole frame is searched, in
+        # case the eye moved off the roi while closed. None disables
+        self.max_blink = 15
+        self.blink_frames = 0
+
+        # reflection tracking; 'contour' or 'template'. template mode matches
+        # the last contour detection and falls back to contours when the
+        # match confidence drops below template_thresh
+        self.refle_mode = 'contour'
+        self.refle_rect = None
+        self.refle_roi_size = None
+        self.refle_template = None
+        self.template_thresh = 0.8
+
+        # coordinate sinks, sent each frame's results
+        self.capture_time = None
+        self.sinks = []
+
+        # result cache
+        self.video_file = None
+        self.cache = None
+        self.cache_key = None
+        self.cache_thresh = None
+
     def init_cap(self, video_file, window_width):
         """
         Creates capture object for video
@@ -77,30 +195,73 @@ class PupilTracker(object):
         if self.cap is not None:
             self.cap.release()
 
+        self.video_file = video_file
+
         # create capture and get info
         if video_file == 'webcam':
             self.cap = cv2.VideoCapture(0)
             self.num_frames = 200
+        elif is_crop_archive(video_file):
+            self.cap = CropCapture(video_file)
+            self.num_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
         else:
             self.cap = cv2.VideoCapture(video_file)
             self.num_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
-        self.vid_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
-                         int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        # nominal rate, only used where real timestamps aren't known yet
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        if not 0 < self.fps < 1000:
+            self.fps = 60
+        self.start_time = time.time()
+        self.frame_offset = (0, 0)
 
+        vid_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                    int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.init_video(vid_size, self.num_frames, window_width)
+
+        # load first frame
+        self.load_first_frame()
+
+    def init_video(self, vid_size, num_frames, window_width):
+        """
+        Sets up the tracker for frames of a given size, whether they come from
+        its own capture or are passed in with set_frame.
+
+        :param vid_size: (width, height) of frames
+        :param num_frames: number of frames to hold data for
+        :param window_width: width of the window
+        """
+        self.vid_size = vid_size
+        self.num_frames = num_frames
         self.get_set_scaled_size(window_width)
+        self.buffers.clear()
+        self.init_data()
 
+    def init_data(self):
+        """
+        Creates data holders and size dependent params for the current video.
+        """
         # init data holders
         self.data = np.empty((2, self.num_frames, 2))
         self.angle_data = np.empty(self.num_frames)
+        self.time_data = np.empty(self.num_frames)
+        self.quality_data = np.empty((self.num_frames, 4))
+        self.geometry_data = np.empty((self.num_frames,
+                                       len(GEOMETRY_COLUMNS)), np.float32)
+        self.reused_data = np.zeros(self.num_frames, dtype=bool)
+        self.blink_data = np.zeros(self.num_frames, dtype=bool)
+        self.interp_data = np.zeros(self.num_frames, dtype=bool)
         self.clear_data()
 
         # init noise kernel
         self.noise_kernel = np.ones((3, 3), np.uint8)
-        self.param_scale = self.vid_size[0] / 1920
 
-        # load first frame
-        self.load_first_frame()
+        # crops keep the scale of the frames they were cut from
+        width = self.vid_size[0]
+        if isinstance(self.cap, CropCapture) and \
+                self.cap.source_size is not None:
+            width = self.cap.source_size[0]
+        self.param_scale = width / 1920
 
     def release_cap(self):
         """
@@ -121,16 +282,18 @@ class PupilTracker(object):
         :raise IOError: if no video file loaded
         """
         if self.cap is not None:
-            ret, self.frame = self.cap.read()
-            if ret:
-                self.frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB)
-                self.display_frame = cv2.resize(self.frame,
-                                                (self.scaled_size[0],
-                                                 self.scaled_size[1]))
-                self.orig_frame = self.display_frame.copy()
+            if self.read_frame():
                 self.frame_num += 1
+                self.stamp_frame()
+
+                # frames tracked at other thresholds don't match cache key
+                if self.cache_key is not None and self.cache_thresh != \
+                        (self.app.pupil_thresh, self.app.refle_thresh):
+                    self.cache_key = None
             else:
-                # at end; clear locations and return to first frame
+                # at end; cache results, clear locations and return to first
+                # frame
+                self.save_cached()
                 self.roi_pupil = None
                 self.roi_refle = None
                 self.roi_size = None
@@ -150,28 +313,481 @@ class PupilTracker(object):
         if self.frame_num < 0:
             raise EOFError('Already at beginning')
 
+        # going back re-tracks frames, so run no longer matches cache key
+        self.cache_key = None
+
         if self.cap is not None:
             self.frame_num -= 1
             self.cap.set(cv2.CAP_PROP_POS_FRAMES,
                          self.frame_num)
-            ret, self.frame = self.cap.read()
-            if ret:
-                self.frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB)
-                self.display_frame = cv2.resize(self.frame,
-                                                (self.scaled_size[0],
-                                                 self.scaled_size[1]))
-                self.orig_frame = self.display_frame.copy()
+            self.read_frame()
+        else:
+            raise IOError('No video loaded.')
+
+    def read_frame(self):
+        """
+        Reads the next frame from the capture and makes the display frame.
+
+        :return: whether or not a frame was read
+        """
+        # decode into the same buffer every frame
+        ret, frame = self.cap.read(
+            self.buffers.get('capture', (self.vid_size[1], self.vid_size[0],
+                                         3)))
+        if ret:
+            self.set_frame(frame)
+            if isinstance(self.cap, CropCapture):
+                self.move_offset(self.cap.offset)
+
+            # media time for files; capture clock for webcam, which doesn't
+            # report a reliable position
+            if self.video_file == 'webcam':
+                self.frame_time = self.capture_time - self.start_time
+            else:
+                self.frame_time = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+
+        return ret
+
+    def move_offset(self, offset):
+        """
+        Moves to a frame cut from elsewhere in the source, shifting the rois
+        so they stay on the same part of the eye.
+
+        :param offset: (x, y) of the new frame's top left in the source
+        """
+        dx = int(self.frame_offset[0] - offset[0])
+        dy = int(self.frame_offset[1] - offset[1])
+        self.frame_offset = (int(offset[0]), int(offset[1]))
+        if not dx and not dy:
+            return
+
+        for name in ['roi_pupil', 'roi_refle']:
+            roi = getattr(self, name)
+            if roi is not None:
+                setattr(self, name, [(x + dx, y + dy) for x, y in roi])
+
+    def stamp_frame(self):
+        """
+        Records the timestamp of the current frame.
+        """
+        if 0 <= self.frame_num < self.num_frames:
+            self.time_data[self.frame_num] = self.frame_time
+
+    def set_frame(self, frame, capture_time=None):
+        """
+        Makes the working and display frames from a decoded frame.
+
+        :param frame: BGR frame, as read from a capture
+        :param capture_time: time the frame was captured, defaults to now
+        """
+        if capture_time is None:
+            capture_time = time.time()
+        self.capture_time = capture_time
+
+        self.frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB,
+                                  dst=self.buffers.like('frame', frame))
+        self.display_frame = cv2.resize(
+            self.frame, (self.scaled_size[0], self.scaled_size[1]),
+            dst=self.buffers.get('display', (self.scaled_size[1],
+                                             self.scaled_size[0], 3)))
+        self.overlay.clear()
+
+    def seek(self, frame_num):
+        """
+        Seeks so that the next call to next_frame loads the given frame. Unlike
+        load_first_frame, leaves the data untouched.
+
+        :param frame_num: frame to seek to
+        :raise IOError: if no video file loaded
+        """
+        if self.cap is not None:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+            self.frame_num = frame_num - 1
         else:
             raise IOError('No video loaded.')
 
+    def retrack_range(self, start, stop, pupil_thresh=None,
+                      refle_thresh=None, roi_pupil=None, roi_refle=None,
+                      verbose=False):
+        """
+        Re-tracks only the frames from start up to (not including) stop and
+        merges the results into the existing data. Tracking starts from the
+        given ROIs, or the current ones if none are given, so a new pupil or
+        reflection can be selected on the first bad frame beforehand.
+
+        :param start: first frame to re-track
+        :param stop: frame after the last frame to re-track
+        :param pupil_thresh: pupil threshold to use, defaults to current
+        :param refle_thresh: reflection threshold to use, defaults to current
+        :param roi_pupil: initial pupil roi, defaults to current
+        :param roi_refle: initial reflection roi, defaults to current
+        :param verbose: whether or not to draw extra
+        :return: number of frames re-tracked
+        :raise IOError: if no video file loaded
+        :raise AttributeError: if there is no pupil roi to start from
+        """
+        if self.cap is None:
+            raise IOError('No video loaded.')
+
+        if roi_pupil is not None:
+            self.roi_pupil = roi_pupil
+            self.roi_size = None
+        if roi_refle is not None:
+            self.roi_refle = roi_refle
+        if self.roi_pupil is None:
+            raise AttributeError('No pupil selected to re-track from.')
+
+        start = max(start, 0)
+        stop = min(stop, self.num_frames)
+
+        # swap in new thresholds for the range
+        old_thresh = (self.app.pupil_thresh, self.app.refle_thresh)
+        if pupil_thresh is not None:
+            self.app.pupil_thresh = pupil_thresh
+        if refle_thresh is not None:
+            self.app.refle_thresh = refle_thresh
+
+        # failures in range should show up as NaN, not old values
+        self.data[:, start:stop] = np.NaN
+        self.angle_data[start:stop] = np.NaN
+        self.reused_data[start:stop] = False
+        self.blink_data[start:stop] = False
+        self.interp_data[start:stop] = False
+        self.quality_data[start:stop] = np.NaN
+        self.geometry_data[start:stop] = np.NaN
+
+        # results no longer match a full run
+        self.cache_key = None
+        self.prev_area = None
+
+        # blink and loss state belong to the frames before the range
+        self.dark_baseline = None
+        self.mean_baseline = None
+        self.lost_frames = 0
+        self.blink_frames = 0
+
+        self.seek(start)
+        try:
+            while self.frame_num + 1 < stop:
+                if not self.read_frame():
+                    break
+                self.frame_num += 1
+                self.stamp_frame()
+                self.track_pupil(verbose=verbose)
+                self.track_refle(verbose=verbose)
+        finally:
+            self.app.pupil_thresh, self.app.refle_thresh = old_thresh
+
+        return self.frame_num + 1 - start
+
+    def track_all(self, verbose=False):
+        """
+        Tracks the whole video from the current selection without the GUI.
+        Keeps a pending cache key, since this is a full run.
+
+        :param verbose: whether or not to draw extra
+        :return: number of frames tracked
+        """
+        cache_key = self.cache_key
+        count = self.retrack_range(0, self.num_frames, verbose=verbose)
+        self.cache_key = cache_key
+        return count
+
+    def skip_frame(self):
+        """
+        Advances past the next frame without decoding it into an image, only
+        recording its timestamp.
+
+        :return: whether or not there was a frame
+        """
+        if not self.cap.grab():
+            return False
+
+        self.frame_num += 1
+        self.frame_time = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        self.stamp_frame()
+        return True
+
+    def track_sparse(self, step=10, max_jump=20, seek_above=50,
+                     max_refine=0.25, verbose=False):
+        """
+        Tracks every step-th frame and the last frame from the current
+        selection, and interpolates the frames in between. Where neighbouring
+        samples jump by more than max_jump, or one failed or is a blink and
+        the other not, the frames between them are then tracked densely with
+        retrack_range. Frames left interpolated are flagged in interp_data.
+
+        At most max_refine of the frames are tracked densely, shortest
+        stretches first, so that a video that keeps moving or failing costs
+        little more than dense tracking would; the rest stay interpolated.
+
+        Skipped frames are passed over with grab, which skips converting them
+        to images, or by seeking when step is above seek_above, which lets the
+        decoder jump to the nearest keyframe.
+
+        :param step: frames between samples
+        :param max_jump: pupil or reflection movement between samples, in
+            pixels of a 1080p frame, that is tracked densely
+        :param seek_above: step above which skipped frames are seeked over
+        :param max_refine: fraction of frames that may be tracked densely
+        :param verbose: whether or not to draw extra
+        :return: dict of number of frames sampled, refined by dense tracking,
+            left interpolated, and in total
+        :raise IOError: if no video file loaded
+        :raise AttributeError: if there is no pupil roi to start from
+        """
+        if self.cap is None:
+            raise IOError('No video loaded.')
+        if self.roi_pupil is None:
+            raise AttributeError('No pupil selected to track from.')
+
+        self.clear_data()
+        self.cache_key = None
+
+        samples = sorted(set(range(0, self.num_frames, step)) |
+                         {self.num_frames - 1})
+        # rois each sample was tracked from, for starting dense tracking
+        rois = {}
+        roi_pupil, roi_refle = self.roi_pupil, self.roi_refle
+        # rois are in the coordinates of the frame they came from
+        roi_offset = self.frame_offset
+
+        self.seek(0)
+        for sample in samples:
+            if step > seek_above:
+                self.seek(sample)
+            else:
+                while self.frame_num + 1 < sample:
+                    if not self.skip_frame():
+                        break
+            if not self.read_frame():
+                break
+            self.frame_num += 1
+            self.stamp_frame()
+
+            rois[sample] = (roi_pupil, roi_refle, roi_offset)
+            self.track_pupil(verbose=verbose)
+            self.track_refle(verbose=verbose)
+            if not np.isnan(self.data[0][sample, 0]):
+                roi_pupil, roi_refle = self.roi_pupil, self.roi_refle
+                roi_offset = self.frame_offset
+
+        samples = [sample for sample in samples if sample in rois]
+        self.fill_between(samples)
+
+        # dense tracking where samples disagree or tracking was lost, within
+        # budget
+        jump = max_jump * self.param_scale
+        budget = max_refine * self.num_frames
+        refined = 0
+        for start, stop in sorted(self.sparse_ranges(samples, jump),
+                                  key=lambda r: r[1] - r[0]):
+            if refined + stop - start > budget:
+                break
+            roi_pupil, roi_refle, self.frame_offset = rois[start]
+            self.retrack_range(start, stop, roi_pupil=roi_pupil,
+                               roi_refle=roi_refle, verbose=verbose)
+            refined += stop - start
+
+        return dict(sampled=len(samples), refined=refined,
+                    interpolated=int(np.count_nonzero(self.interp_data)),
+                    frames=self.num_frames)
+
+    def fill_between(self, samples):
+        """
+        Linearly interpolates positions, angles and times between sampled
+        frames. Angles are interpolated the short way round.
+
+        :param samples: sorted frame numbers that were tracked
+        """
+        samples = np.asarray(samples)
+        if len(samples) < 2:
+            return
+        frames = np.arange(samples[0], samples[-1] + 1)
+        between = np.ones(len(frames), dtype=bool)
+        between[samples - samples[0]] = False
+        frames = frames[between]
+
+        for which in range(2):
+            for axis in range(2):
+                self.data[which][frames, axis] = np.interp(
+                    frames, samples, self.data[which][samples, axis],
+                    left=np.NaN, right=np.NaN)
+
+        # pupil angle is only defined up to 180 degrees
+        doubled = np.unwrap(np.radians(2 * self.angle_data[samples]))
+        self.angle_data[frames] = np.degrees(
+            np.interp(frames, samples, doubled)) / 2 % 180
+
+        missing = frames[np.isnan(self.time_data[frames])]
+        self.time_data[missing] = np.interp(missing, samples,
+                                            self.time_data[samples])
+
+        self.interp_data[frames] = ~np.isnan(self.data[0][frames, 0])
+
+    def sparse_ranges(self, samples, jump):
+        """
+        Finds the stretches between samples that need dense tracking: where
+        the pupil or reflection moved more than jump, or tracking was lost or
+        regained, i.e. one sample has no pupil or is a blink and the other
+        not. Stretches failed at both ends are left alone, so a reflection
+        lost for good doesn't refine the rest of the video. Touching stretches
+        are merged.
+
+        :param samples: sorted frame numbers that were tracked
+        :param jump: pixels of movement between samples to refine
+        :return: list of (start, stop) frame ranges, starting on a sample
+        """
+        samples = np.asarray(samples)
+        if len(samples) < 2:
+            return []
+
+        pupil = self.data[0][samples]
+        refle = self.data[1][samples]
+        pupil_failed = np.isnan(pupil[:, 0]) | self.blink_data[samples]
+        refle_failed = np.isnan(refle[:, 0])
+
+        with np.errstate(invalid='ignore'):
+            moved = (np.hypot(*np.diff(pupil, axis=0).T) > jump) | \
+                (np.hypot(*np.diff(refle, axis=0).T) > jump)
+        refine = moved | (pupil_failed[:-1] != pupil_failed[1:]) | \
+            (refle_failed[:-1] != refle_failed[1:])
+
+        ranges = []
+        for i in np.flatnonzero(refine):
+            start, stop = int(samples[i]), int(samples[i + 1]) + 1
+            if ranges and start < ranges[-1][1]:
+                ranges[-1][1] = stop
+            else:
+                ranges.append([start, stop])
+
+        return [tuple(r) for r in ranges]
+
+    def score_pupil(self, ellipse, cnt):
+        """
+        Scores how likely a candidate is the pupil, from its circularity,
+        darkness, size compared to size_prior and whether a reflection is
+        inside it. Each term is between 0 and 1.
+
+        :param ellipse: candidate ellipse
+        :param cnt: candidate contour, may be None
+        :return: score
+        """
+        (cx, cy), (w, h), angle = ellipse
+        area = np.pi * w * h / 4
+        half = int(max(w, h) / 2) + 1
+        box = [(max(int(cx) - half, 0), max(int(cy) - half, 0)),
+               (int(cx) + half, int(cy) + half)]
+
+        # round
+        if cnt is not None:
+            circularity = cv2.arcLength(cnt, True) ** 2 / \
+                (4 * np.pi * max(cv2.contourArea(cnt), 1))
+            round_score = 1 / max(circularity, 1)
+        else:
+            round_score = min(w, h) / max(w, h)
+
+        # dark inside ellipse
+        gray = cv2.cvtColor(self.frame[box[0][1]:box[1][1],
+                                       box[0][0]:box[1][0]],
+                            cv2.COLOR_BGR2GRAY)
+        mask = np.zeros_like(gray)
+        cv2.ellipse(mask, ((cx - box[0][0], cy - box[0][1]), (w, h), angle),
+                    255, -1)
+        darkness = cv2.mean(gray, mask)[0]
+        dark_score = np.clip(1 - darkness / self.app.pupil_thresh, 0, 1)
+
+        # near usual size
+        log_ratio = np.log(area / (self.size_prior * self.param_scale))
+        size_score = np.exp(-log_ratio ** 2 / 2)
+
+        # has a reflection
+        refle_score = 1 if self.find_refle(box) else 0
+
+        return round_score + dark_score + size_score + refle_score
+
+    def auto_init(self, num_frames=5, verbose=False):
+        """
+        Selects the pupil and reflection without a user, for unattended runs.
+        Scores every candidate in the first frames and adds up the scores of
+        candidates in the same place across frames, so a dark blob that is
+        only pupil-like in one frame loses out. The winner is selected on the
+        first frame, along with the reflection closest to its center.
+
+        :param num_frames: number of frames to score
+        :param verbose: if true, draws extra content to the frame (roi, etc)
+        :raise AttributeError: if no pupils found
+        :raise IOError: if no video file loaded
+        """
+        if self.cap is None:
+            raise IOError('No video loaded.')
+
+        self.clear_rois()
+        self.roi_size = None
+        self.tracking = False
+
+        # clusters of [x, y, radius, total score]
+        clusters = []
+        self.seek(0)
+        for _ in range(num_frames):
+            if not self.read_frame():
+                break
+            for ellipse, cnt in self.find_pupils():
+                (cx, cy), axes, _ = ellipse
+                score = self.score_pupil(ellipse, cnt)
+                for cluster in clusters:
+                    if np.hypot(cx - cluster[0], cy - cluster[1]) < cluster[2]:
+                        cluster[3] += score
+                        break
+                else:
+                    clusters.append([cx, cy, max(axes) / 2, score])
+
+        self.load_first_frame()
+
+        if not clusters:
+            raise AttributeError('No pupils found.')
+
+        # select best pupil on first frame; the best scoring candidate of the
+        # winning cluster, or the nearest to it if none is in it this frame
+        cx, cy, radius, _ = max(clusters, key=lambda c: c[3])
+        size = int(radius * 1.75)
+        roi = [(max(int(cx) - size, 0), max(int(cy) - size, 0)),
+               (int(cx) + size, int(cy) + size)]
+        candidates = self.find_pupils(roi)
+        if not candidates:
+            raise AttributeError('No pupils found.')
+        dists = [np.hypot(ellipse[0][0] - cx, ellipse[0][1] - cy)
+                 for ellipse, _ in candidates]
+        scores = [self.score_pupil(ellipse, cnt) if dist < radius else -np.inf
+                  for (ellipse, cnt), dist in zip(candidates, dists)]
+        if np.isfinite(max(scores)):
+            index = int(np.argmax(scores))
+        else:
+            index = int(np.argmin(dists))
+        self.draw_pupil(index=index, roi=roi, verbose=verbose)
+
+        # and reflection closest to it
+        reflections = self.find_refle(self.roi_pupil)
+        if reflections:
+            dists = [np.hypot(*(cv2.minAreaRect(cnt)[0] -
+                                np.array([self.cx_pupil, self.cy_pupil])))
+                     for cnt in reflections]
+            self.draw_refle(index=int(np.argmin(dists)), roi='pupil',
+                            verbose=verbose)
+
     def get_frame(self):
         """
-        Gets the current display frame.
+        Gets the current display frame with the annotations drawn over it.
 
-        :return: current display frame
+        :return: current annotated display frame
         """
         if self.display_frame is not None:
-            return self.display_frame
+            if not self.overlay:
+                return self.display_frame
+
+            composite = self.buffers.like('composite', self.display_frame)
+            np.copyto(composite, self.display_frame)
+            return self.overlay.render(composite)
 
     def load_first_frame(self):
         """
@@ -192,6 +808,7 @@ class PupilTracker(object):
             # clear data
             self.app.toggle_to_dump_data(set_to=False)
             self.clear_data()
+            self.cache_key = None
 
         else:
             raise IOError('No video loaded.')
@@ -211,29 +828,75 @@ class PupilTracker(object):
                                                                      'p',
                                                                      '4',
                                                                      'v'),
-                                       fps=60,
+                                       fps=self.fps,
                                        frameSize=(960, 540))
         else:
             raise IOError('VideoWriter already created. Release first.')
 
+    def init_crop_out(self, path, pad=2.0, fourcc='mp4v'):
+        """
+        Starts recording only the eye: a fixed size crop around the pupil roi
+        per frame, and where it was cut from. Open the recording like any
+        video to re-track it.
+
+        :param path: file save path
+        :param pad: crop size relative to the current pupil roi
+        :param fourcc: four character code of the codec
+        :raise IOError: if already recording
+        :raise AttributeError: if no pupil selected to size the crop
+        """
+        if self.crop_out is not None:
+            raise IOError('Crop recording already created. Release first.')
+        if self.roi_pupil is None:
+            raise AttributeError('No pupil selected to crop around.')
+
+        (x1, y1), (x2, y2) = self.roi_pupil
+        size = int(np.rint(pad * max(x2 - x1, y2 - y1)))
+        size += size % 2
+        self.crop_out = CropWriter(path, (size, size), self.vid_size,
+                                   self.fps, fourcc)
+
+    def write_crop_out(self):
+        """
+        Writes the crop around the pupil of the current frame, or where the
+        last one was cut from if the pupil is lost.
+        """
+        center = None
+        if self.roi_pupil is not None:
+            (x1, y1), (x2, y2) = self.roi_pupil
+            center = ((x1 + x2) // 2, (y1 + y2) // 2)
+        self.crop_out.write(self.frame, center, self.frame_num,
+                            self.frame_time, rgb=True)
+
     def write_out(self):
         """
-        Writes frames to file.
+        Writes frames to file, full display frames and/or eye crops.
         """
+        if self.crop_out is not None:
+            self.write_crop_out()
+            if self.out is None:
+                return
+
         if self.out is not None:
-            frame = cv2.cvtColor(self.display_frame, cv2.COLOR_RGB2BGR)
-            self.out.write(frame)
+            frame = cv2.cvtColor(self.display_frame, cv2.COLOR_RGB2BGR,
+                                 dst=self.buffers.like('out',
+                                                       self.display_frame))
+            self.out.write(self.overlay.render(frame, bgr=True))
         else:
             raise IOError('VideoWriter not created. Nothing with which to '
                           'write.')
 
     def release_out(self):
         """
-        Destroys out object.
+        Destroys out objects, full frame and crop.
         """
-        if self.out is not None:
-            self.out.release()
-            self.out = None
+        if self.out is not None or self.crop_out is not None:
+            if self.out is not None:
+                self.out.release()
+                self.out = None
+            if self.crop_out is not None:
+                self.crop_out.release()
+                self.crop_out = None
             print('Recording saved.')
         else:
             raise IOError('VideoWriter not created. Nothing to release.')
@@ -258,10 +921,11 @@ class PupilTracker(object):
         Resizes frame on size events.
         """
         if self.display_frame is not None:
-            self.orig_frame = cv2.resize(self.frame,
-                                         (self.scaled_size[0],
-                                             self.scaled_size[1]))
-            self.display_frame = self.orig_frame.copy()
+            self.display_frame = cv2.resize(
+                self.frame, (self.scaled_size[0], self.scaled_size[1]),
+                dst=self.buffers.get('display', (self.scaled_size[1],
+                                                 self.scaled_size[0], 3)))
+            self.overlay.clear()
 
         else:
             raise IOError('No video selected.')
@@ -270,8 +934,8 @@ class PupilTracker(object):
         """
         Clears frame of drawings.
         """
-        if self.orig_frame is not None:
-            self.display_frame = self.orig_frame.copy()
+        if self.display_frame is not None:
+            self.overlay.clear()
         else:
             raise IOError('Nothing here.')
 
@@ -288,10 +952,17 @@ class PupilTracker(object):
         """
         self.data.fill(np.NaN)
         self.angle_data.fill(np.NaN)
+        self.time_data.fill(np.NaN)
+        self.quality_data.fill(np.NaN)
+        self.geometry_data.fill(np.NaN)
+        self.prev_area = None
+        self.reused_data.fill(False)
+        self.blink_data.fill(False)
+        self.interp_data.fill(False)
 
     def dump_data(self, path):
         """
-        Dumps the data to file.
+        Dumps the data to file, and the geometry next to it.
 
         :param path: file save path
         """
@@ -312,18 +983,142 @@ class PupilTracker(object):
                        delimiter=',',
                        fmt='%f',
                        header='angle data\ndegrees',
-                       footer='end angle data')
+                       footer='end angle data\n')
+
+            np.savetxt(f, self.time_data,
+                       delimiter=',',
+                       fmt='%.6f',
+                       header='time data\nseconds',
+                       footer='end time data\n')
+
+            np.savetxt(f, self.blink_data,
+                       delimiter=',',
+                       fmt='%d',
+                       header='blink data\n1 if eye closed',
+                       footer='end blink data')
+
+        self.save_geometry(geometry_path(path))
 
         print('data dumped')
 
-    def process_image(self, img, roi=None):
+    def frame_times(self):
+        """
+        Gets the time of every frame. Frames not yet read are estimated from
+        the nominal frame rate.
+
+        :return: array of times in seconds
+        """
+        estimate = np.arange(self.num_frames) / self.fps
+        return np.where(np.isnan(self.time_data), estimate, self.time_data)
+
+    def velocity(self, which='pupil'):
+        """
+        Gets velocity using the real time between frames, so dropped frames
+        and variable frame rates don't skew it.
+
+        :param which: whether to return pupil or reflection velocity
+        :return: array of x,y velocities in pixels per second, NaN where
+            either frame is missing
+        """
+        if which == 'pupil':
+            pos = self.data[0]
+        elif which == 'refle':
+            pos = self.data[1]
+        else:
+            raise AttributeError('Wrong parameter.')
+
+        vel = np.empty_like(pos)
+        vel[0] = np.NaN
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vel[1:] = np.diff(pos, axis=0) / \
+                np.diff(self.time_data)[:, np.newaxis]
+        vel[~np.isfinite(vel)] = np.NaN
+
+        return vel
+
+    def cache_params(self):
+        """
+        Gets the parameters that determine the results of a run.
+
+        :return: tuple of parameters
+        """
+        return (self.app.pupil_thresh,
+                self.app.refle_thresh,
+                self.roi_pupil,
+                self.roi_refle,
+                self.roi_size,
+                self.num_frames,
+                self.detector.name,
+                self.blink_ratio,
+                self.blink_rise,
+                self.reacquire_after,
+                self.max_blink,
+                self.gate_tol,
+                self.refle_mode,
+                self.template_thresh)
+
+    def load_cached(self):
+        """
+        Starts a run from the first frame. If the video was already tracked
+        with the same parameters, loads the results from the cache instead.
+        Otherwise remembers the cache key so the results are cached when the
+        run reaches the end of the video.
+
+        :return: True if results were loaded from cache
+        """
+        self.cache_key = None
+
+        if self.cache is None or self.video_file in (None, 'webcam') \
+                or self.roi_pupil is None:
+            return False
+
+        key = self.cache.make_key(self.video_file, self.cache_params())
+        cached = self.cache.get(key)
+
+        # entries from before geometry was stored count as a miss
+        if cached is not None and 'geometry_data' in cached:
+            self.data[:] = cached['data']
+            self.angle_data[:] = cached['angle_data']
+            self.reused_data[:] = cached['reused_data']
+            self.time_data[:] = cached['time_data']
+            self.quality_data[:] = cached['quality_data']
+            self.blink_data[:] = cached['blink_data']
+            self.geometry_data[:] = cached['geometry_data']
+            self.interp_data.fill(False)
+            return True
+
+        self.cache_key = key
+        self.cache_thresh = (self.app.pupil_thresh, self.app.refle_thresh)
+        return False
+
+    def save_cached(self):
+        """
+        Caches the results of a run that started on the first frame and was
+        not modified along the way.
+        """
+        if self.cache_key is not None and self.cache_thresh == \
+                (self.app.pupil_thresh, self.app.refle_thresh):
+            self.cache.put(self.cache_key,
+                           data=self.data,
+                           angle_data=self.angle_data,
+                           reused_data=self.reused_data,
+                           time_data=self.time_data,
+                           quality_data=self.quality_data,
+                           blink_data=self.blink_data,
+                           geometry_data=self.geometry_data)
+        self.cache_key = None
+
+    def process_image(self, img, roi=None, stage='frame'):
         """
         Blurs, grayscales, and ROIs either entire frame or only certain
         region.
 
         :param img: frame being processed
         :param roi: region of interest being processed
-        :return: grayscaled, blurred, ROIed frame
+        :param stage: name of the buffers to use; pupil and reflection rois
+            differ in size, so each keeps its own
+        :return: grayscaled, blurred, ROIed frame, valid until the next call
+            for the same stage
         """
         if roi is not None:
             # roi
@@ -331,17 +1126,25 @@ class PupilTracker(object):
             self.dy = roi[0][1]
             roi_image = img[roi[0][1]:roi[1][1],
                             roi[0][0]:roi[1][0]]
-            # gaussian filter
-            gauss = cv2.GaussianBlur(roi_image, (5, 5), 0)
-
         else:
             self.dx = 0
             self.dy = 0
-            # gaussian filter
-            gauss = cv2.GaussianBlur(img, (5, 5), 0)
+            roi_image = img
+
+        # gaussian filter; rois move and clip at the edges, so buffers are
+        # views of frame sized ones
+        gauss = cv2.GaussianBlur(roi_image, (5, 5), 0,
+                                 dst=self.buffers.view(stage + '_gauss',
+                                                       roi_image.shape,
+                                                       roi_image.dtype,
+                                                       img.size))
 
         # make grayscale
-        gray = cv2.cvtColor(gauss, cv2.COLOR_BGR2GRAY)
+        gray = cv2.cvtColor(gauss, cv2.COLOR_BGR2GRAY,
+                            dst=self.buffers.view(stage + '_gray',
+                                                  gauss.shape[:2],
+                                                  gauss.dtype,
+                                                  img.shape[0] * img.shape[1]))
         return gray
 
     def get_filtered(self, which):
@@ -388,64 +1191,36 @@ class PupilTracker(object):
 
     def find_pupils(self, roi=None):
         """
-        Searches for possible pupils in processed image
+        Searches for possible pupils in processed image with the current
+        detector.
 
         :param roi: region of interest
-        :return: list of possible pupil contours
+        :return: list of possible pupils as (ellipse, contour) pairs
         """
         # roi and gauss
-        grayed = self.process_image(self.frame, roi)
-        # threshold and remove noise
-        _, thresh_pupil = cv2.threshold(grayed, self.app.pupil_thresh, 255,
-                                        cv2.THRESH_BINARY)
-        filtered_pupil = cv2.morphologyEx(thresh_pupil, cv2.MORPH_CLOSE,
-                                          self.noise_kernel, iterations=2)
+        grayed = self.process_image(self.frame, roi, 'pupil')
 
-        # cv2.imshow('filtered_pupil', filtered_pupil.copy())
-        # find contours
-        _, contours_pupil, _ = cv2.findContours(filtered_pupil, cv2.RETR_TREE,
-                                                cv2.CHAIN_APPROX_SIMPLE)
-
-        found_pupils = []
-        # process contours
-        if len(contours_pupil) != 0:
-            for cnt in contours_pupil:
+        found_pupils = self.detector.detect(grayed, self.app.pupil_thresh,
+                                            self.param_scale, self.roi_size)
 
-                # drop small and large
-                area = cv2.contourArea(cnt)
-                if area == 0:
-                    # print('pupil area zero', self.frame_num)
-                    continue
-
-                if self.roi_size is None:
-                    if not 2000 < area / self.param_scale < 120000:
-                        # print('pupil too small/large', self.frame_num,
-                        #       int(area / self.param_scale))
-                        continue
-                else:
-                    if not self.param_scale * 2000 < area < self.roi_size**2:
-                        continue
-
-                # remove concavities, drop too few points
-                hull = cv2.convexHull(cnt)
-                if hull.shape[0] < 5:
-                    # print('too few points', self.frame_num)
-                    continue
-
-                # drop too eccentric
-                circumference = cv2.arcLength(hull, True)
-                circularity = circumference ** 2 / (4*np.pi*area)
-                if circularity >= 1.6:
-                    # print('not circle', self.frame_num)
-                    continue
+        # rescale to full image
+        for i, (ellipse, cnt) in enumerate(found_pupils):
+            (cx, cy), axes, angle = ellipse
+            found_pupils[i] = (((cx + self.dx, cy + self.dy), axes, angle),
+                               cnt)
+            if cnt is not None:
+                cnt[:, :, 0] += self.dx
+                cnt[:, :, 1] += self.dy
 
-                # rescale to full image
-                hull[:, :, 0] += self.dx
-                hull[:, :, 1] += self.dy
+        return found_pupils
 
-                found_pupils.append(hull)
+    def set_detector(self, name):
+        """
+        Sets the pupil detector engine.
 
-        return found_pupils
+        :param name: name of detector, one of PupilDetectors.DETECTORS
+        """
+        self.detector = get_detector(name)
 
     def draw_pupil(self, index=None, roi=None, verbose=True):
         """
@@ -458,6 +1233,15 @@ class PupilTracker(object):
         :raise AttributeError: if list of pupils is empty
         """
 
+        # new selection mid run; results no longer match cache key
+        if index is not None and self.frame_num >= 0:
+            self.cache_key = None
+
+        # new selection may be a different eye; relearn open eye baseline
+        if index is not None:
+            self.dark_baseline = None
+            self.mean_baseline = None
+
         # if no index passed, means we are tracking single pupil, so will be
         # first in list returned
         if index is None:
@@ -470,16 +1254,23 @@ class PupilTracker(object):
         if not self.tracking:
             self.roi_size = None
 
-        # get list of pupil contours
-        cnt_list = self.find_pupils(roi)
+        # get list of pupils
+        pupil_list = self.find_pupils(roi)
 
-        if len(cnt_list) > 0:
-            cnt = cnt_list[index]
+        if len(pupil_list) > 0:
+            ellipse, cnt = pupil_list[index]
         else:
             raise AttributeError('No pupils found.')
 
-        # fit ellipse
-        ellipse = cv2.fitEllipse(cnt)
+        # quality of detection
+        self.pupil_ellipse = ellipse
+        self.pupil_count = len(pupil_list)
+        self.pupil_area = np.pi * ellipse[1][0] * ellipse[1][1] / 4
+        if cnt is not None:
+            self.pupil_circularity = cv2.arcLength(cnt, True) ** 2 / \
+                (4 * np.pi * max(cv2.contourArea(cnt), 1))
+        else:
+            self.pupil_circularity = np.NaN
 
         # centroid
         self.cx_pupil = int(np.rint(ellipse[0][0]))
@@ -493,42 +1284,27 @@ class PupilTracker(object):
             self.angle += 90
 
         # scale for drawing
-        scaled_cx = int(self.cx_pupil / self.display_scale)
-        scaled_cy = int(self.cy_pupil / self.display_scale)
-        self.scaled_cx = scaled_cx
-        self.scaled_cy = scaled_cy
+        self.scaled_cx = int(self.cx_pupil / self.display_scale)
+        self.scaled_cy = int(self.cy_pupil / self.display_scale)
 
-        # draw scaled
-        cv2.line(self.display_frame,
-                 (scaled_cx-2, scaled_cy),
-                 (scaled_cx+2, scaled_cy),
-                 (255, 255, 255), 1)
-        cv2.line(self.display_frame,
-                 (scaled_cx, scaled_cy-2),
-                 (scaled_cx, scaled_cy+2),
-                 (255, 255, 255), 1)
-
-        scaled_cnt = np.rint(cnt / self.display_scale)
-        scaled_cnt = scaled_cnt.astype(int)
-        scaled_ellipse = cv2.fitEllipse(scaled_cnt)
-        cv2.ellipse(self.display_frame, scaled_ellipse, (0, 255, 100), 1)
+        if cnt is not None:
+            scaled_cnt = np.rint(cnt / self.display_scale)
+            scaled_cnt = scaled_cnt.astype(int)
+        else:
+            scaled_cnt = None
+        (cx, cy), (w, h), angle = ellipse
+        self.scaled_ellipse = ((cx / self.display_scale,
+                                cy / self.display_scale),
+                               (w / self.display_scale,
+                                h / self.display_scale),
+                               angle)
 
         if self.roi_size is None:
             self.roi_size = int(np.rint(max(ellipse[1][0], ellipse[1][1]) *
                                         1.75))
         self.scaled_roi_size = int(self.roi_size / self.display_scale)
 
-        # extra drawings
-        if verbose:
-            cv2.drawContours(self.display_frame, scaled_cnt, -1, (255, 255,
-                                                                  255), 2)
-            cv2.rectangle(self.display_frame,
-                          (scaled_cx - self.scaled_roi_size, scaled_cy - self.scaled_roi_size),
-                          (scaled_cx + self.scaled_roi_size, scaled_cy + self.scaled_roi_size),
-                          (255, 255, 255))
-            # box = cv2.boxPoints(ellipse)
-            # box = np.int0(box)
-            # cv2.drawContours(self.display_frame, [box], 0,(0,0,255),1)
+        self.mark_pupil(scaled_cnt, verbose)
 
         # correct out of bounds roi
         roi_lu_x = self.cx_pupil - self.roi_size
@@ -544,6 +1320,146 @@ class PupilTracker(object):
                           (roi_rl_x, roi_rl_y)]
 
         self.tracking = False
+        self.gate_thumb = None
+
+    def mark_pupil(self, scaled_cnt=None, verbose=True):
+        """
+        Draws the centroid and ellipse of the current pupil to the frame.
+
+        :param scaled_cnt: pupil contour scaled to the display frame
+        :param verbose: if true, draws extra content to the frame (roi, etc)
+        """
+        scaled_cx = self.scaled_cx
+        scaled_cy = self.scaled_cy
+
+        # draw scaled
+        self.overlay.line((scaled_cx-2, scaled_cy),
+                          (scaled_cx+2, scaled_cy),
+                          (255, 255, 255), 1)
+        self.overlay.line((scaled_cx, scaled_cy-2),
+                          (scaled_cx, scaled_cy+2),
+                          (255, 255, 255), 1)
+
+        self.overlay.ellipse(self.scaled_ellipse, (0, 255, 100), 1)
+
+        # extra drawings
+        if verbose:
+            if scaled_cnt is not None:
+                self.overlay.contours(scaled_cnt, -1, (255, 255, 255), 2)
+            self.overlay.rectangle(
+                (scaled_cx - self.scaled_roi_size, scaled_cy - self.scaled_roi_size),
+                (scaled_cx + self.scaled_roi_size, scaled_cy + self.scaled_roi_size),
+                (255, 255, 255))
+
+    def roi_thumb(self, size=16):
+        """
+        Makes a small grayscale thumbnail of the pupil roi, cheap to compare
+        between frames.
+
+        :param size: width and height of the thumbnail
+        :return: thumbnail of the roi, or None if the roi is empty
+        """
+        roi = self.roi_pupil
+        roi_image = self.frame[roi[0][1]:roi[1][1],
+                               roi[0][0]:roi[1][0]]
+        if roi_image.size == 0:
+            return None
+
+        thumb = cv2.resize(roi_image, (size, size),
+                           interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+
+    def is_blink(self):
+        """
+        Cheap blink detector. Measures the fraction of dark pixels and the mean
+        intensity of the pupil roi; when the dark fraction drops well below
+        its usual value with the eye open and the roi gets brighter, the lid
+        covers the pupil.
+
+        :return: whether or not the eye is closed
+        """
+        if self.blink_ratio is None:
+            return False
+
+        thumb = self.roi_thumb(size=32)
+        if thumb is None:
+            return False
+
+        self.dark_frac = np.count_nonzero(thumb < self.app.pupil_thresh) / \
+            thumb.size
+        self.roi_mean = cv2.mean(thumb)[0]
+
+        if self.dark_baseline is None or self.mean_baseline is None:
+            return False
+        return self.dark_frac < self.blink_ratio * self.dark_baseline and \
+            self.roi_mean > self.mean_baseline + self.blink_rise
+
+    def blink_intervals(self):
+        """
+        Gets the blinks found so far.
+
+        :return: list of (start, stop) frame ranges
+        """
+        blinks = np.concatenate(([0], self.blink_data.view(np.int8), [0]))
+        edges = np.nonzero(np.diff(blinks))[0]
+        return [(int(start), int(stop)) for start, stop in
+                zip(edges[::2], edges[1::2])]
+
+    def reacquire(self, verbose=True):
+        """
+        Searches the whole frame for the pupil after it has been lost for
+        reacquire_after frames. Blink frames don't count, so no full frame
+        searches are wasted while the eye is closed.
+
+        :param verbose: whether or not to draw extra
+        """
+        self.lost_frames += 1
+        if self.reacquire_after is None or \
+                self.lost_frames < self.reacquire_after:
+            return
+
+        self.search_frame(verbose)
+
+    def search_frame(self, verbose=True):
+        """
+        Selects the pupil anywhere in the frame, moving the roi to it.
+
+        :param verbose: whether or not to draw extra
+        :return: whether or not a pupil was found
+        """
+        self.lost_frames = 0
+        self.blink_frames = 0
+        self.tracking = False
+
+        # relearn the open eye where the roi moves to
+        self.dark_frac = None
+        self.dark_baseline = None
+        self.mean_baseline = None
+        try:
+            self.draw_pupil(roi=None, verbose=verbose)
+        except AttributeError:
+            return False
+        return True
+
+    def roi_unchanged(self):
+        """
+        Temporal coherence gate. Checks whether the pupil roi looks the same as
+        it did on the frame the pupil was last detected in. Comparing against
+        the last detection rather than the previous frame keeps slow drift from
+        adding up over a run of reused frames.
+
+        :return: True if the mean absolute difference of the roi thumbnails is
+            below gate_tol gray levels
+        """
+        if self.gate_thumb is None:
+            return False
+
+        thumb = self.roi_thumb()
+        if thumb is None:
+            return False
+
+        diff = cv2.norm(thumb, self.gate_thumb, cv2.NORM_L1) / thumb.size
+        return diff < self.gate_tol
 
     def track_pupil(self, verbose=True):
         """
@@ -552,16 +1468,58 @@ class PupilTracker(object):
         :param verbose: whether or not to draw extra
         """
         if self.roi_pupil is not None:
+            # hold off while eye is closed, unless closed so long the eye
+            # has likely moved out from under the roi
+            if self.is_blink():
+                self.blink_frames += 1
+                if self.max_blink is None or \
+                        self.blink_frames < self.max_blink or \
+                        not self.search_frame(verbose):
+                    if 0 <= self.frame_num < self.num_frames:
+                        self.blink_data[self.frame_num] = True
+                    self.can_pip = False
+                    return
+            else:
+                self.blink_frames = 0
+
             try:
-                self.draw_pupil(roi='pupil', verbose=verbose)
+                # skip detection if the roi hasn't changed since last detection
+                reused = self.gate_tol is not None and self.can_pip and \
+                    self.roi_unchanged()
+
+                if reused:
+                    self.mark_pupil(verbose=verbose)
+                else:
+                    self.draw_pupil(roi='pupil', verbose=verbose)
+                    if self.gate_tol is not None:
+                        self.gate_thumb = self.roi_thumb()
+
                 try:
-                    self.data[0][self.frame_num] = [self.cx_pupil, self.cy_pupil]
+                    self.data[0][self.frame_num] = [
+                        self.cx_pupil + self.frame_offset[0],
+                        self.cy_pupil + self.frame_offset[1]]
                     self.angle_data[self.frame_num] = self.angle
+                    self.reused_data[self.frame_num] = reused
+                    self.record_quality(reused)
+                    self.record_geometry('pupil')
                 except IndexError:
                     self.frame_num = 0
                     self.track_pupil(verbose)
                 self.can_pip = True
                 self.tracking = True
+                self.lost_frames = 0
+
+                # track dark fraction and brightness of open eye for blink
+                # detection
+                if not reused and self.dark_frac is not None:
+                    if self.dark_baseline is None:
+                        self.dark_baseline = self.dark_frac
+                        self.mean_baseline = self.roi_mean
+                    else:
+                        self.dark_baseline += 0.1 * (self.dark_frac -
+                                                     self.dark_baseline)
+                        self.mean_baseline += 0.1 * (self.roi_mean -
+                                                     self.mean_baseline)
                 # TODO: make tracking tracker
                 # bc when loses roi then resets shape because can't pip...
 
@@ -573,6 +1531,7 @@ class PupilTracker(object):
             except AttributeError:
                 # print(e)
                 self.can_pip = False
+                self.reacquire(verbose)
         else:
             pass
 
@@ -584,12 +1543,17 @@ class PupilTracker(object):
         :return: list of possible reflection contours
         """
         # roi and gauss
-        grayed = self.process_image(self.frame, roi)
+        grayed = self.process_image(self.frame, roi, 'refle')
         # threshold and remove noise
-        _, thresh_refle = cv2.threshold(grayed, self.app.refle_thresh, 255,
-                                        cv2.THRESH_BINARY)
-        filtered_refle = cv2.morphologyEx(thresh_refle, cv2.MORPH_CLOSE,
-                                          self.noise_kernel, iterations=1)
+        capacity = self.frame.shape[0] * self.frame.shape[1]
+        _, thresh_refle = cv2.threshold(
+            grayed, self.app.refle_thresh, 255, cv2.THRESH_BINARY,
+            dst=self.buffers.view('refle_thresh', grayed.shape,
+                                  grayed.dtype, capacity))
+        filtered_refle = cv2.morphologyEx(
+            thresh_refle, cv2.MORPH_CLOSE, self.noise_kernel, iterations=1,
+            dst=self.buffers.view('refle_closed', grayed.shape,
+                                  grayed.dtype, capacity))
 
         # cv2.imshow('filtered_refle', filtered_refle.copy())
         # find contours
@@ -647,6 +1611,10 @@ class PupilTracker(object):
         :param verbose: if true, draws extra content to the frame (roi, etc)
         :raise AttributeError: if list of reflections is empty
         """
+        # new selection mid run; results no longer match cache key
+        if index is not None and self.frame_num >= 0:
+            self.cache_key = None
+
         # if no index passed, means we are tracking single reflection
         if index is None:
             index = 0
@@ -670,42 +1638,123 @@ class PupilTracker(object):
         # rect center
         self.cx_refle = int(rect[0][0])
         self.cy_refle = int(rect[0][1])
+        self.refle_template = None
 
         # reset roi
         # TODO: don't let ROI get too small
-        roi_size = int(np.rint(max(rect[1][0], rect[1][1])) * 1.25)
-        scaled_roi_size = int(roi_size / self.display_scale)
+        self.refle_rect = rect
+        self.refle_roi_size = int(np.rint(max(rect[1][0], rect[1][1])) * 1.25)
+        self.set_refle_roi()
+
+        scaled_cnt = np.rint(cnt / self.display_scale)
+        scaled_cnt = scaled_cnt.astype(int)
+        scaled_rect = cv2.minAreaRect(scaled_cnt)
+
+        self.mark_refle(scaled_rect, scaled_cnt, verbose)
+
+    def set_refle_roi(self):
+        """
+        Centers the reflection roi on the current reflection.
+        """
+        roi_size = self.refle_roi_size
         self.roi_refle = [(self.cx_refle - roi_size, self.cy_refle - roi_size),
                           (self.cx_refle + roi_size, self.cy_refle + roi_size)]
 
+    def mark_refle(self, scaled_rect, scaled_cnt=None, verbose=True):
+        """
+        Draws the centroid and bounding box of the current reflection to the
+        frame.
+
+        :param scaled_rect: reflection rect scaled to the display frame
+        :param scaled_cnt: reflection contour scaled to the display frame
+        :param verbose: if true, draws extra content to the frame (roi, etc)
+        """
         # scale for drawing
         scaled_cx = int(self.cx_refle / self.display_scale)
         scaled_cy = int(self.cy_refle / self.display_scale)
+        scaled_roi_size = int(self.refle_roi_size / self.display_scale)
 
         # draw
-        cv2.line(self.display_frame,
-                 (scaled_cx-2, scaled_cy),
-                 (scaled_cx+2, scaled_cy),
-                 (0, 0, 0), 1)
-        cv2.line(self.display_frame,
-                 (scaled_cx, scaled_cy-2),
-                 (scaled_cx, scaled_cy+2),
-                 (0, 0, 0), 1)
+        self.overlay.line((scaled_cx-2, scaled_cy),
+                          (scaled_cx+2, scaled_cy),
+                          (0, 0, 0), 1)
+        self.overlay.line((scaled_cx, scaled_cy-2),
+                          (scaled_cx, scaled_cy+2),
+                          (0, 0, 0), 1)
 
-        scaled_cnt = np.rint(cnt / self.display_scale)
-        scaled_cnt = scaled_cnt.astype(int)
-        scaled_rect = cv2.minAreaRect(scaled_cnt)
         box = cv2.boxPoints(scaled_rect)
         box = np.int0(box)
-        cv2.drawContours(self.display_frame, [box], 0, (0, 255, 100), 1)
+        self.overlay.contours([box], 0, (0, 255, 100), 1)
 
         # draw extra
         if verbose:
-            cv2.rectangle(self.display_frame,
-                          (scaled_cx - scaled_roi_size, scaled_cy - scaled_roi_size),
-                          (scaled_cx + scaled_roi_size, scaled_cy + scaled_roi_size),
-                          (255, 255, 255))
-            cv2.drawContours(self.display_frame, scaled_cnt, -1, (0, 0, 255), 2)
+            self.overlay.rectangle(
+                (scaled_cx - scaled_roi_size, scaled_cy - scaled_roi_size),
+                (scaled_cx + scaled_roi_size, scaled_cy + scaled_roi_size),
+                (255, 255, 255))
+            if scaled_cnt is not None:
+                self.overlay.contours(scaled_cnt, -1, (0, 0, 255), 2)
+
+    def make_refle_template(self):
+        """
+        Cuts a grayscale template of the current reflection out of the frame,
+        with a small margin so the edges of the reflection are included.
+
+        :return: reflection template, or None if too close to the frame edge
+        """
+        half = int(max(self.refle_rect[1][0], self.refle_rect[1][1]) / 2) + 2
+        x1, y1 = self.cx_refle - half, self.cy_refle - half
+        x2, y2 = self.cx_refle + half + 1, self.cy_refle + half + 1
+
+        if x1 < 0 or y1 < 0 or \
+                x2 > self.frame.shape[1] or y2 > self.frame.shape[0]:
+            return None
+
+        return cv2.cvtColor(self.frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+
+    def match_refle(self, verbose=True):
+        """
+        Fast path for tracking the reflection. Matches the template from the
+        last contour detection against the reflection roi with normalized
+        cross correlation.
+
+        :param verbose: if true, draws extra content to the frame (roi, etc)
+        :return: True if matched with at least template_thresh confidence
+        """
+        template = self.refle_template
+        if template is None:
+            return False
+
+        roi = self.roi_refle
+        x1, y1 = max(roi[0][0], 0), max(roi[0][1], 0)
+        window = self.frame[y1:roi[1][1], x1:roi[1][0]]
+        if window.shape[0] < template.shape[0] or \
+                window.shape[1] < template.shape[1]:
+            return False
+
+        window = cv2.cvtColor(window, cv2.COLOR_BGR2GRAY)
+        result = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+        _, confidence, _, loc = cv2.minMaxLoc(result)
+
+        if not confidence >= self.template_thresh:
+            return False
+
+        # template center is the reflection center
+        half = template.shape[0] // 2
+        self.cx_refle = x1 + loc[0] + half
+        self.cy_refle = y1 + loc[1] + half
+        self.refle_rect = ((self.cx_refle, self.cy_refle), self.refle_rect[1],
+                           self.refle_rect[2])
+        self.set_refle_roi()
+
+        scaled_rect = ((self.cx_refle / self.display_scale,
+                        self.cy_refle / self.display_scale),
+                       (self.refle_rect[1][0] / self.display_scale,
+                        self.refle_rect[1][1] / self.display_scale),
+                       self.refle_rect[2])
+        self.mark_refle(scaled_rect, verbose=verbose)
+
+        return True
 
     def track_refle(self, verbose=True):
         """
@@ -715,8 +1764,24 @@ class PupilTracker(object):
         """
         if self.roi_refle is not None:
             try:
-                self.draw_refle(roi='refle', verbose=verbose)
-                self.data[1][self.frame_num] = [self.cx_refle, self.cy_refle]
+                # template fast path, falling back to contours on low match
+                if self.refle_mode != 'template' or \
+                        not self.match_refle(verbose):
+                    self.draw_refle(roi='refle', verbose=verbose)
+                    if self.refle_mode == 'template':
+                        self.refle_template = self.make_refle_template()
+
+                self.data[1][self.frame_num] = [
+                    self.cx_refle + self.frame_offset[0],
+                    self.cy_refle + self.frame_offset[1]]
+                self.record_geometry('refle')
+
+                # reflection should sit inside the pupil roi
+                if self.roi_pupil is not None and \
+                        0 <= self.frame_num < self.num_frames:
+                    (x1, y1), (x2, y2) = self.roi_pupil
+                    self.quality_data[self.frame_num][3] = \
+                        x1 < self.cx_refle < x2 and y1 < self.cy_refle < y2
 
             # except IndexError as e:
             #     # print(e)
@@ -729,6 +1794,156 @@ class PupilTracker(object):
         else:
             pass
 
+    def record_quality(self, reused=False):
+        """
+        Records quality metrics of the current pupil detection: circularity,
+        relative change in area since the last detection and number of
+        candidates found. Whether the reflection is inside the pupil roi is
+        filled in by track_refle.
+
+        :param reused: whether the pupil was reused rather than detected
+        """
+        row = self.quality_data[self.frame_num]
+        if reused:
+            row[:] = [self.pupil_circularity, 0, self.pupil_count, 0]
+            return
+
+        if self.prev_area:
+            area_change = self.pupil_area / self.prev_area - 1
+        else:
+            area_change = 0
+        self.prev_area = self.pupil_area
+
+        row[:] = [self.pupil_circularity, area_change, self.pupil_count, 0]
+
+    def record_geometry(self, which):
+        """
+        Records the full pupil ellipse or reflection rect of the current
+        frame, unrounded.
+
+        :param which: 'pupil' or 'refle'
+        """
+        if not 0 <= self.frame_num < self.num_frames:
+            return
+
+        row = self.geometry_data[self.frame_num]
+        ox, oy = self.frame_offset
+        if which == 'pupil':
+            (cx, cy), (w, h), angle = self.pupil_ellipse
+            row[:8] = [cx + ox, cy + oy, w, h, angle, self.pupil_area,
+                       self.pupil_circularity, self.pupil_count]
+        else:
+            (cx, cy), (w, h), angle = self.refle_rect
+            row[8:] = [cx + ox, cy + oy, w, h, angle]
+
+    def mark_geometry(self):
+        """
+        Draws the pupil and reflection recorded for the current frame, without
+        tracking it again, e.g. when reviewing frames already tracked.
+
+        :return: whether or not anything was recorded to draw
+        """
+        if not 0 <= self.frame_num < self.num_frames:
+            return False
+
+        row = self.geometry_data[self.frame_num]
+        ox, oy = self.frame_offset
+        scale = self.display_scale
+        drawn = False
+
+        if not np.isnan(row[0]):
+            cx, cy = (row[0] - ox) / scale, (row[1] - oy) / scale
+            self.overlay.line((cx - 2, cy), (cx + 2, cy), (255, 255, 255), 1)
+            self.overlay.line((cx, cy - 2), (cx, cy + 2), (255, 255, 255), 1)
+            self.overlay.ellipse(((cx, cy), (row[2] / scale, row[3] / scale),
+                                  row[4]), (0, 255, 100), 1)
+            drawn = True
+
+        if not np.isnan(row[8]):
+            cx, cy = (row[8] - ox) / scale, (row[9] - oy) / scale
+            self.overlay.line((cx - 2, cy), (cx + 2, cy), (0, 0, 0), 1)
+            self.overlay.line((cx, cy - 2), (cx, cy + 2), (0, 0, 0), 1)
+            box = cv2.boxPoints(((cx, cy), (row[10] / scale, row[11] / scale),
+                                 row[12]))
+            self.overlay.contours([np.int0(box)], 0, (0, 255, 100), 1)
+            drawn = True
+
+        return drawn
+
+    def save_geometry(self, path):
+        """
+        Saves the per frame geometry with frame times and blinks, one array
+        per column, so single measurements load without reading the rest.
+        Read back with load_geometry.
+
+        :param path: .npz file save path
+        """
+        columns = dict((name, self.geometry_data[:, i])
+                       for i, name in enumerate(GEOMETRY_COLUMNS))
+        np.savez_compressed(path, time=self.time_data,
+                            blink=self.blink_data,
+                            interpolated=self.interp_data, **columns)
+
+    def suspect_frames(self, max_circularity=1.3, max_area_change=0.25):
+        """
+        Finds frames whose tracking is suspect, out of the frames read so far:
+        pupil not found, not round, changed area suddenly or had several
+        candidates, or reflection lost or outside the pupil roi.
+
+        :param max_circularity: largest circularity not suspect
+        :param max_area_change: largest relative change in area not suspect
+        :return: array of suspect frame numbers
+        """
+        quality = self.quality_data
+        with np.errstate(invalid='ignore'):
+            suspect = np.isnan(self.data[0][:, 0]) | \
+                (quality[:, 0] > max_circularity) | \
+                (np.abs(quality[:, 1]) > max_area_change) | \
+                (quality[:, 2] > 1)
+
+        # only check reflection if one was tracked at all
+        if not np.isnan(self.data[1][:, 0]).all():
+            suspect |= np.isnan(self.data[1][:, 0]) | (quality[:, 3] == 0)
+
+        # blinks are expected losses
+        read = ~np.isnan(self.time_data)
+        return np.nonzero(suspect & read & ~self.blink_data)[0]
+
+    def suspect_ranges(self, pad=2, gap=5):
+        """
+        Groups suspect frames into ranges to re-track, each padded by a few
+        frames and merged with neighbours closer than a gap.
+
+        :param pad: frames to add either side of each suspect frame
+        :param gap: largest gap between suspect frames to merge over
+        :return: list of (start, stop) ranges, as taken by retrack_range
+        """
+        ranges = []
+        for frame in self.suspect_frames():
+            start = max(frame - pad, 0)
+            stop = min(frame + pad + 1, self.num_frames)
+            if ranges and start - ranges[-1][1] <= gap:
+                ranges[-1][1] = stop
+            else:
+                ranges.append([start, stop])
+
+        return [tuple(r) for r in ranges]
+
+    def publish(self):
+        """
+        Sends the current frame's results to all sinks. Call once both pupil
+        and reflection are tracked.
+        """
+        if not self.sinks or not 0 <= self.frame_num < self.num_frames:
+            return
+
+        pupil = self.data[0][self.frame_num]
+        refle = self.data[1][self.frame_num]
+        angle = self.angle_data[self.frame_num]
+        for sink in self.sinks:
+            sink.publish(self.frame_num, self.capture_time, pupil, refle,
+                         angle)
+
     def pip(self):
         """
         Creates picture in picture of pupil ROI
@@ -740,17 +1955,106 @@ class PupilTracker(object):
             y1, y2 = self.scaled_cy-roi_size+1, self.scaled_cy+roi_size
             x1, x2 = self.scaled_cx-roi_size+1, self.scaled_cx+roi_size
 
-            coords = [x1, x2, y1, y2]
+            # copied into corner when composited
+            self.overlay.pip([(x1, y1), (x2, y2)])
+
+
+def geometry_path(path):
+    """
+    Gets where the geometry of a data file is saved.
+
+    :param path: data file path
+    :return: geometry file path
+    """
+    return os.path.splitext(path)[0] + '_geometry.npz'
+
+
+def load_geometry(path):
+    """
+    Opens a geometry file. Columns are read when first accessed.
+
+    :param path: geometry file, or the data file it was saved with
+    :return: mapping of column name to array; GEOMETRY_COLUMNS plus time,
+        blink and interpolated
+    :raise IOError: if there is no geometry file
+    """
+    if not path.endswith('.npz'):
+        path = geometry_path(path)
+    return np.load(path)
+
+
+def track_video(video_file, pupil_thresh=50, refle_thresh=190,
+                detector='contour', dump_path=None, cache=None, step=1):
+    """
+    Tracks a whole video with no user, selecting the pupil and reflection
+    with auto_init.
+
+    :param video_file: video path
+    :param pupil_thresh: pupil threshold
+    :param refle_thresh: reflection threshold
+    :param detector: name of pupil detector
+    :param dump_path: data file to save, or None to not save
+    :param cache: ResultCache to reuse and store results, or None
+    :param step: track every step-th frame with track_sparse, or 1 for
+        every frame
+    :return: the tracker, holding the data
+    :raise AttributeError: if no pupils found
+    """
+    tracker = PupilTracker(HeadlessApp(pupil_thresh, refle_thresh))
+    tracker.set_detector(detector)
+    tracker.cache = cache
+    tracker.init_cap(video_file, 960)
+
+    tracker.auto_init()
+    if not tracker.load_cached():
+        if step > 1:
+            tracker.track_sparse(step)
+        else:
+            tracker.track_all()
+        tracker.save_cached()
+
+    if dump_path is not None:
+        tracker.dump_data(dump_path)
+    tracker.release_cap()
 
-            for ind, element in enumerate(coords):
-                if element < 0:
-                    coords[ind] = 0
+    return tracker
 
-            roi_image = self.display_frame[
-                        coords[2]:coords[3],
-                        coords[0]:coords[1]]
 
-            # replace in frame
-            self.display_frame[0:roi_image.shape[0],
-                               self.display_frame.shape[1]-roi_image.shape[1]:
-                               self.display_frame.shape[1]] = roi_image
+def main():
+    """
+    Tracks a batch of videos from the command line, writing a data file next
+    to each.
+    """
+    # only needed from the command line; keeps worker startup light
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Track videos without the GUI, selecting the pupil '
+                    'automatically.')
+    parser.add_argument('videos', nargs='+', help='video paths')
+    parser.add_argument('--pupil-thresh', type=int, default=50)
+    parser.add_argument('--refle-thresh', type=int, default=190)
+    parser.add_argument('--detector', default='contour')
+    parser.add_argument('--cache', action='store_true',
+                        help='reuse results of identical runs')
+    parser.add_argument('--step', type=int, default=1,
+                        help='track every step-th frame, interpolating the '
+                             'rest and tracking densely where needed')
+    args = parser.parse_args()
+
+    cache = None
+    if args.cache:
+        from ResultCache import ResultCache
+        cache = ResultCache()
+
+    for video_file in args.videos:
+        dump_path = os.path.splitext(video_file)[0] + '.csv'
+        try:
+            track_video(video_file, args.pupil_thresh, args.refle_thresh,
+                        args.detector, dump_path, cache, args.step)
+        except (AttributeError, IOError) as e:
+            print('{}: {}'.format(video_file, e))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,11 +9,14 @@ Pupil tracking software.
 
 from __future__ import division, print_function
 import wx
-import wxmplot  # wx matplotlib library
-import numpy as np
 from os import path
 from sys import platform
 from PupilTracker import PupilTracker
+from PupilDetectors import DETECTORS
+from ResultCache import ResultCache
+from CoordinateStream import CoordinatePublisher, DEFAULT_ADDRESS
+from OnlineFilter import OnlineFilter
+from Playback import PlaybackScheduler
 # from psychopy.core import MonotonicClock  # for getting display fps
 
 
@@ -37,23 +40,54 @@ class ImagePanel(wx.Panel):
         # self.t = None
 
         self.SetDoubleBuffered(True)
-        self.fps = 1000  # why not
-        self.fps_timer = wx.Timer(self)
-        self.Bind(wx.EVT_TIMER, self.draw, self.fps_timer)
+
+        # frames are tracked by the playback scheduler; the display only
+        # shows the latest one, at most preview_rate times a second, or the
+        # monitor refresh rate if None
+        self.preview_rate = None
+        self.present_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_present, self.present_timer)
         self.Bind(wx.EVT_PAINT, self.on_paint)
 
+    def refresh_rate(self):
+        """
+        Gets the refresh rate of the monitor the panel is on.
+
+        :return: refresh rate in Hz, 60 if unknown
+        """
+        index = wx.Display.GetFromWindow(self)
+        if index == wx.NOT_FOUND:
+            return 60
+        rate = wx.Display(index).GetCurrentMode().refresh
+        if not 0 < rate < 1000:
+            return 60
+        return rate
+
+    def display_rate(self):
+        """
+        Gets how many times a second to show frames while playing.
+
+        :return: rate in Hz
+        """
+        if self.preview_rate is not None:
+            return min(self.preview_rate, self.refresh_rate())
+        return self.refresh_rate()
+
     def start_timer(self):
         """
-        Starts timer for draw timing.
+        Starts timer for showing frames while playing.
         """
-        self.fps_timer.Start(1000 // self.fps)
+        rate = self.display_rate()
+        if self.app.scheduler.mode == 'realtime':
+            rate = min(rate, self.app.tracker.fps)
+        self.present_timer.Start(int(1000 / rate))
         # self.t = MonotonicClock()
 
     def stop_timer(self):
         """
         Stops timer.
         """
-        self.fps_timer.Stop()
+        self.present_timer.Stop()
         # try:
         #     t = self.t.getTime()
         #     f = self.app.tracker.num_frames
@@ -79,7 +113,11 @@ class ImagePanel(wx.Panel):
 
         :param evt: Required event parameter
         """
-        if self.app.playing or step:
+        if step:
+            # stepping takes over from playback
+            if self.app.playing:
+                self.app.pause()
+
             try:
                 if direction == 'forward':
                     self.app.next_frame()
@@ -95,14 +133,7 @@ class ImagePanel(wx.Panel):
                     self.app.tracker.num_frames), 1)
             except EOFError as e:
                 print(e)
-                self.app.toggle_playing(set_to=False)
-                self.stop_timer()
-                self.app.clear_rois()
-                self.app.clear_indices()
-                self.load_image(self.app.get_frame())
-                self.app.SetStatusText(str(self.app.tracker.frame_num+1) +
-                                       '/' + str(
-                    self.app.tracker.num_frames), 1)
+                self.on_video_end()
                 return
             except IOError as e:
                 print(e)
@@ -110,17 +141,7 @@ class ImagePanel(wx.Panel):
                 self.stop_timer()
                 return
 
-            self.app.track_pupil()
-            self.app.track_refle()
-            if self.app.to_pip:
-                self.app.pip()
-            try:
-                self.app.write_out()
-            except IOError:
-                pass
-
-            if self.app.to_plot and self.app.tracker.frame_num % 3 == 0:
-                self.app.update_plot()
+            self.app.track_frame()
 
         if img is None:
             if self.image_bmp is not None:
@@ -136,6 +157,53 @@ class ImagePanel(wx.Panel):
         if evt is not None:
             evt.Skip()
 
+    def on_present(self, evt):
+        """
+        Shows the latest tracked frame, if any were tracked since last time.
+        Frames tracked in between are never drawn.
+
+        :param evt: timer event, required param
+        """
+        scheduler = self.app.scheduler
+
+        governor = scheduler.governor
+        if governor.changed:
+            governor.changed = False
+            self.app.SetStatusText(governor.report(), 0)
+
+        new = scheduler.take_new()
+        if not new or self.image_bmp is None:
+            return
+
+        # nothing to show to; frames are still tracked
+        if not self.IsShownOnScreen() or self.app.IsIconized():
+            return
+
+        with scheduler.lock:
+            self.image_bmp.CopyFromBuffer(self.app.get_frame())
+            frame_num = self.app.tracker.frame_num
+        self.Refresh()  # causes paint
+
+        self.app.SetStatusText(str(frame_num+1) + '/' +
+                               str(self.app.tracker.num_frames), 1)
+
+        # plot draws itself; only stop it when shed
+        if self.app.live_plot is not None:
+            self.app.live_plot.set_paused(not self.app.optional('plot'))
+
+    def on_video_end(self):
+        """
+        Stops playback at the end of the video and shows the first frame.
+        """
+        self.app.toggle_playing(set_to=False)
+        self.stop_timer()
+        self.app.clear_rois()
+        self.app.clear_indices()
+        self.load_image(self.app.get_frame())
+        self.app.SetStatusText(str(self.app.tracker.frame_num+1) +
+                               '/' + str(
+            self.app.tracker.num_frames), 1)
+
     def on_paint(self, evt):
         """
         Pulls bitmap from buffer and draws to panel.
@@ -211,6 +279,7 @@ class ToolsPanel(wx.Panel):
         # buttons
         self.find_pupil_button = wx.Button(self, label='Find pupil')
         self.find_refle_button = wx.Button(self, label='Find refle')
+        self.auto_button = wx.Button(self, label='Auto')
         self.clear_button = wx.Button(self, label='Clear')
         self.play_button = wx.Button(self, label='Play')
         self.pause_button = wx.Button(self, label='Pause')
@@ -229,6 +298,10 @@ class ToolsPanel(wx.Panel):
         self.dump_data_toggle = wx.CheckBox(self, label='Dump data')
         self.dump_data_toggle.SetValue(False)
 
+        # detector engine choice
+        self.detector_choice = wx.Choice(self, choices=sorted(DETECTORS))
+        self.detector_choice.SetStringSelection('contour')
+
         # threshold sliders
         self.pupil_slider = wx.Slider(self,
                                       value=50,
@@ -263,6 +336,9 @@ class ToolsPanel(wx.Panel):
         button_sizer.Add(self.find_refle_button,
                          flag=wx.LEFT | wx.RIGHT | wx.TOP,
                          border=5)
+        button_sizer.Add(self.auto_button,
+                         flag=wx.LEFT | wx.RIGHT | wx.TOP,
+                         border=5)
         button_sizer.Add(self.clear_button,
                          flag=wx.LEFT | wx.RIGHT | wx.TOP,
                          border=5)
@@ -290,6 +366,9 @@ class ToolsPanel(wx.Panel):
         button_sizer.Add(self.dump_data_toggle,
                          flag=wx.LEFT | wx.RIGHT | wx.TOP,
                          border=5)
+        button_sizer.Add(self.detector_choice,
+                         flag=wx.LEFT | wx.RIGHT | wx.TOP,
+                         border=5)
         button_sizer.Add(slider_sizer,
                          flag=wx.LEFT | wx.RIGHT | wx.TOP | wx.EXPAND,
                          border=5,
@@ -305,6 +384,9 @@ class ToolsPanel(wx.Panel):
         self.Bind(wx.EVT_BUTTON,
                   self.on_find_refle_button,
                   self.find_refle_button)
+        self.Bind(wx.EVT_BUTTON,
+                  self.on_auto_button,
+                  self.auto_button)
         self.Bind(wx.EVT_BUTTON,
                   self.on_clear_button,
                   self.clear_button)
@@ -332,6 +414,9 @@ class ToolsPanel(wx.Panel):
         self.Bind(wx.EVT_CHECKBOX,
                   self.on_dump_data_toggle,
                   self.dump_data_toggle)
+        self.Bind(wx.EVT_CHOICE,
+                  self.on_detector_choice,
+                  self.detector_choice)
         self.Bind(wx.EVT_SCROLL_THUMBTRACK,
                   self.on_pupil_slider_thumbtrack,
                   self.pupil_slider)
@@ -371,18 +456,20 @@ class ToolsPanel(wx.Panel):
             if self.pupil_index is None:
                 self.pupil_index = 0
 
-            # clear to draw
-            self.app.clear(draw=False, keep_roi=True)
+            # the playback worker may be tracking this frame
+            with self.app.scheduler.lock:
+                # clear to draw
+                self.app.clear(draw=False, keep_roi=True)
 
-            # redraw reflection if present
-            if self.refle_index is not None:
-                self.app.redraw_refle()
+                # redraw reflection if present
+                if self.refle_index is not None:
+                    self.app.redraw_refle()
 
-            # draw pupil
-            self.app.draw_pupil(self.pupil_index)
-            self.pupil_index += 1
+                # draw pupil
+                self.app.draw_pupil(self.pupil_index)
+                self.pupil_index += 1
 
-            self.app.draw()
+                self.app.draw()
 
         # end of pupil list, so go back to beginning
         except IndexError:
@@ -409,22 +496,24 @@ class ToolsPanel(wx.Panel):
             if self.refle_index is None:
                 self.refle_index = 0
 
-            # clear to draw
-            self.app.clear(draw=False, keep_roi=True)
+            # the playback worker may be tracking this frame
+            with self.app.scheduler.lock:
+                # clear to draw
+                self.app.clear(draw=False, keep_roi=True)
 
-            # redraw pupil if present
-            if self.pupil_index is not None:
-                self.app.redraw_pupil()
+                # redraw pupil if present
+                if self.pupil_index is not None:
+                    self.app.redraw_pupil()
 
-                # draw reflection, only search in pupil if present
-                self.app.draw_refle(self.refle_index, roi='pupil')
+                    # draw reflection, only search in pupil if present
+                    self.app.draw_refle(self.refle_index, roi='pupil')
 
-            else:
-                self.app.draw_refle(self.refle_index)
+                else:
+                    self.app.draw_refle(self.refle_index)
 
-            self.refle_index += 1
+                self.refle_index += 1
 
-            self.app.draw()
+                self.app.draw()
 
         # end of refle list, so go back to beginning
         except IndexError as e:
@@ -441,6 +530,38 @@ class ToolsPanel(wx.Panel):
             self.pupil_index = None
             print(e)
 
+    def on_auto_button(self, evt):
+        """
+        Selects the most likely pupil and reflection automatically.
+
+        :param evt: required event parameter
+        """
+        self.clear_indices()
+
+        # searches from the first frame, so playback can't read meanwhile
+        was_playing = self.app.playing
+        self.app.pause()
+
+        try:
+            self.app.clear(draw=False, keep_roi=False)
+            found_refle = self.app.auto_init()
+            self.pupil_index = 0
+            if found_refle:
+                self.refle_index = 0
+            self.app.draw()
+
+        except AttributeError as e:
+            self.app.draw()
+            print(e)
+            return
+
+        except IOError as e:
+            print(e)
+            return
+
+        if was_playing:
+            self.app.play()
+
     def on_clear_button(self, evt):
         """
         Clears drawings.
@@ -520,6 +641,14 @@ class ToolsPanel(wx.Panel):
         """
         self.app.toggle_to_dump_data()
 
+    def on_detector_choice(self, evt):
+        """
+        Switches pupil detector engine.
+
+        :param evt: required event parameter
+        """
+        self.app.set_detector(evt.GetString())
+
     def on_pupil_slider_thumbtrack(self, evt):
         """
         Dynamically adjusts threshold for pupils.
@@ -647,131 +776,6 @@ class ToolsPanel(wx.Panel):
         self.on_slider_release(evt)
 
 
-class PlotPanel(wxmplot.PlotPanel):
-    """
-    Class for panel with dynamic plots of coordinates and angle.
-    """
-    def __init__(self, parent):
-        """
-        Constructor.
-
-        :param parent: parent app
-        """
-        self.plot_height = 300
-        kwargs = dict(fontsize=5,
-                      size=(960, self.plot_height),
-                      )
-
-        super(PlotPanel, self).__init__(parent, **kwargs)
-
-        self.frames = None
-        self.data = None
-        self.angle_data = None
-        self.background = None
-        self.x_delta = None
-        self.y_delta = None
-        self.x_apos = None
-        self.y_apos = None
-        self.pup_an = None
-        self.pupil_x = None
-        self.pupil_y = None
-        self.x_norm = None
-        self.y_norm = None
-
-    def init_plot(self, data, angle_data):
-        self.frames = np.arange(data.shape[1])
-        self.data = data
-        self.angle_data = angle_data
-
-        self.calc()
-
-        guess_dif = 200
-        self.x_delta = self.plot(self.frames, self.pupil_x,
-                                 ymin=0-guess_dif,
-                                 ymax=0+guess_dif,
-                                 color='red',
-                                 label='x delta',
-                                 markersize=5,
-                                 labelfontsize=5,
-                                 show_legend=True,
-                                 legend_loc='ul',
-                                 legendfontsize=5,
-                                 linewidth=1,
-                                 xlabel='frame number',
-                                 ylabel='pixels')[0]
-
-        self.y_delta = self.oplot(self.frames, self.pupil_y,
-                                  color='blue',
-                                  label='y delta',
-                                  linewidth=1)[0]
-
-        self.x_apos = self.oplot(self.frames, self.x_norm,
-                                 color='orange',
-                                 label='x pos',
-                                 linewidth=1)[0]
-
-        self.y_apos = self.oplot(self.frames, self.y_norm,
-                                 color='purple',
-                                 label='y pos',
-                                 linewidth=1)[0]
-
-        self.pup_an = self.oplot(self.frames, self.angle_data,
-                                 color='green',
-                                 label='angle',
-                                 linewidth=1,
-                                 side='right',
-                                 ymin=0,
-                                 ymax=180,
-                                 # ylabel='angle (deg)'
-                                 )[0]
-
-        self.copy_background()
-
-    def copy_background(self):
-        """
-        Copys background for quicker drawing.
-        """
-        self.background = self.fig.canvas.copy_from_bbox(self.axes.bbox)
-
-    def calc(self):
-        pupil_data = self.data[0]
-        refle_data = self.data[1]
-
-        self.x_norm = pupil_data[:, 0] - pupil_data[0][0]
-        self.y_norm = pupil_data[:, 1] - pupil_data[0][1]
-
-        refle_x_norm = refle_data[:, 0] - refle_data[0][0]
-        refle_y_norm = refle_data[:, 1] - refle_data[0][1]
-
-        self.pupil_x = self.x_norm - refle_x_norm
-        self.pupil_y = self.y_norm - refle_y_norm
-
-    def on_draw(self, verbose=False):
-        self.calc()
-        self.fig.canvas.restore_region(self.background)
-
-        self.x_delta.set_ydata(self.pupil_x)
-        self.y_delta.set_ydata(self.pupil_y)
-
-        if verbose:
-            self.x_apos.set_ydata(self.x_norm)
-            self.y_apos.set_ydata(self.y_norm)
-            self.pup_an.set_ydata(self.angle_data)
-
-        self.axes.draw_artist(self.x_delta)
-        self.axes.draw_artist(self.y_delta)
-
-        if verbose:
-            self.axes.draw_artist(self.x_apos)
-            self.axes.draw_artist(self.y_apos)
-            self.axes.draw_artist(self.pup_an)
-
-        self.fig.canvas.blit(self.axes.bbox)
-
-    def clear_plot(self):
-        self.clear()
-
-
 class MyFrame(wx.Frame):
     """
     Class for generating main frame. Holds other panels.
@@ -791,6 +795,7 @@ class MyFrame(wx.Frame):
         self.to_plot = False
         self.to_pip = False
         self.to_save_video = False
+        self.record_eye_only = False
         self.to_dump_data = False
         self.save_video_name = None
         self.dump_file_name = None
@@ -801,11 +806,18 @@ class MyFrame(wx.Frame):
 
         # instantiate tracker
         self.tracker = PupilTracker(self)
+        self.tracker.cache = ResultCache()
+
+        # tracks frames while playing, off the gui thread
+        self.scheduler = PlaybackScheduler(self.play_step,
+                                           on_end=self.on_play_end)
+
+        # plot of results, drawn by another process; made when first shown
+        self.live_plot = None
 
         # create panels
         self.image_panel = ImagePanel(self)
         self.tools_panel = ToolsPanel(self)
-        self.plots_panel = PlotPanel(self)
 
         # sizer for image and tools panels
         image_tools_sizer = wx.BoxSizer(wx.HORIZONTAL)
@@ -817,20 +829,9 @@ class MyFrame(wx.Frame):
         image_tools_sizer.Add(self.tools_panel,
                               flag=wx.EXPAND)
 
-        # sizer for image/tools and plot
-        panel_plot_sizer = wx.BoxSizer(wx.VERTICAL)
-
-        # add to sizer
-        panel_plot_sizer.Add(image_tools_sizer,
-                             flag=wx.EXPAND,
-                             proportion=1)
-        panel_plot_sizer.Add(self.plots_panel,
-                             flag=wx.EXPAND)
-
         # set sizer
-        self.plots_panel.Hide()
-        self.SetSizer(panel_plot_sizer)
-        panel_plot_sizer.Fit(self)
+        self.SetSizer(image_tools_sizer)
+        image_tools_sizer.Fit(self)
 
         # status bar
         self.CreateStatusBar(2)
@@ -845,6 +846,52 @@ class MyFrame(wx.Frame):
         file_camera = file_menu.Append(wx.ID_CANCEL,
                                        'Webcam',
                                        'Use webcam as video stream')
+        file_menu.AppendSeparator()
+        file_eye_only = file_menu.AppendCheckItem(wx.ID_ANY,
+                                                  'Record eye only',
+                                                  'Save video as crops '
+                                                  'around the pupil; open '
+                                                  'the saved video to '
+                                                  're-track it')
+
+        track_menu = wx.Menu()
+        track_retrack = track_menu.Append(wx.ID_ANY,
+                                          'Re-track range',
+                                          'Re-track frames from the current '
+                                          'frame with current settings')
+        track_stream = track_menu.AppendCheckItem(wx.ID_ANY,
+                                                  'Stream coordinates',
+                                                  'Send coordinates of each '
+                                                  'frame over UDP port '
+                                                  '{}'.format(
+                                                      DEFAULT_ADDRESS[1]))
+        track_saccades = track_menu.AppendCheckItem(wx.ID_ANY,
+                                                    'Detect saccades',
+                                                    'Smooth position and '
+                                                    'detect saccades as '
+                                                    'frames are tracked')
+        track_menu.AppendSeparator()
+        track_fast = track_menu.AppendRadioItem(wx.ID_ANY,
+                                                'Play as fast as possible',
+                                                'Track every frame as fast as '
+                                                'possible')
+        track_realtime = track_menu.AppendRadioItem(wx.ID_ANY,
+                                                    'Play in real time',
+                                                    'Track at the video\'s '
+                                                    'frame rate')
+        track_step = track_menu.AppendRadioItem(wx.ID_ANY,
+                                                'Step with arrow keys',
+                                                'Only advance frames with the '
+                                                'arrow keys')
+        track_realtime.Check()
+        self.playback_modes = {track_fast.GetId(): 'fast',
+                               track_realtime.GetId(): 'realtime',
+                               track_step.GetId(): 'step'}
+        track_menu.AppendSeparator()
+        track_preview = track_menu.Append(wx.ID_ANY,
+                                          'Preview rate',
+                                          'Limit how often frames are shown '
+                                          'while playing')
 
         help_menu = wx.Menu()
         help_about = help_menu.Append(wx.ID_ABOUT,
@@ -854,6 +901,7 @@ class MyFrame(wx.Frame):
         # create menu bar
         menu_bar = wx.MenuBar()
         menu_bar.Append(file_menu, 'File')
+        menu_bar.Append(track_menu, 'Track')
         menu_bar.Append(help_menu, 'Help')
 
         # set menu bar
@@ -866,6 +914,14 @@ class MyFrame(wx.Frame):
 
         self.Bind(wx.EVT_MENU, self.on_file_open, file_open)
         self.Bind(wx.EVT_MENU, self.on_file_camera, file_camera)
+        self.Bind(wx.EVT_MENU, self.on_file_eye_only, file_eye_only)
+        self.Bind(wx.EVT_MENU, self.on_track_retrack, track_retrack)
+        self.Bind(wx.EVT_MENU, self.on_track_stream, track_stream)
+        self.Bind(wx.EVT_MENU, self.on_track_saccades, track_saccades)
+        self.Bind(wx.EVT_MENU, self.on_track_mode, track_fast)
+        self.Bind(wx.EVT_MENU, self.on_track_mode, track_realtime)
+        self.Bind(wx.EVT_MENU, self.on_track_mode, track_step)
+        self.Bind(wx.EVT_MENU, self.on_track_preview, track_preview)
         self.Bind(wx.EVT_MENU, self.on_help_about, help_about)
 
         # keyboard binders
@@ -888,17 +944,42 @@ class MyFrame(wx.Frame):
 
     def play(self):
         """
-        Plays video.
+        Plays video. If starting from the first frame and the video was
+        already tracked with the same parameters, loads the cached results
+        instead.
         """
-        self.image_panel.start_timer()
-        self.playing = True
+        if self.tracker.frame_num == -1 and not self.to_save_video:
+            if self.tracker.load_cached():
+                self.SetStatusText('Loaded cached results', 0)
+                if self.to_dump_data:
+                    self.toggle_to_dump_data(False)
+                return
+
+        if self.scheduler.mode == 'step':
+            self.SetStatusText('Step mode: use the arrow keys', 0)
+            return
+
+        self.scheduler.fps = self.tracker.fps
+        if self.scheduler.start():
+            self.playing = True
+            self.image_panel.start_timer()
 
     def pause(self):
         """
         Pauses video.
         """
         self.image_panel.stop_timer()
-        self.playing = False
+        if self.playing:
+            self.scheduler.stop()
+            self.playing = False
+
+            # show the last frame tracked
+            self.draw()
+
+            # say if anything was skipped to keep up
+            governor = self.scheduler.governor
+            if any(governor.shed_frames.values()):
+                self.SetStatusText(governor.report(), 0)
 
         if self.to_save_video:
             self.toggle_to_save_video(False)
@@ -911,6 +992,7 @@ class MyFrame(wx.Frame):
         Stops the video, returning to beginning.
         """
         self.image_panel.stop_timer()
+        self.scheduler.stop()
         self.playing = False
 
         if self.to_save_video:
@@ -954,6 +1036,24 @@ class MyFrame(wx.Frame):
         """
         self.tools_panel.clear_indices()
 
+    def set_detector(self, name):
+        """
+        Sets the pupil detector engine and redraws the pupil with it.
+
+        :param name: name of detector
+        """
+        self.tracker.set_detector(name)
+
+        if not self.playing and self.tools_panel.pupil_index is not None:
+            try:
+                self.clear(draw=False, keep_roi=True)
+            except IOError:
+                return
+            self.redraw_pupil()
+            if self.tools_panel.refle_index is not None:
+                self.redraw_refle()
+            self.draw()
+
     def draw_pupil(self, pupil_index=None):
         """
         Draws the pupil to the frame.
@@ -976,6 +1076,16 @@ class MyFrame(wx.Frame):
                                     roi=roi,
                                     verbose=self.verbose)
 
+    def auto_init(self):
+        """
+        Selects the pupil and reflection automatically, on the first frame.
+
+        :return: whether or not a reflection was found
+        :raise AttributeError: if no pupils found
+        """
+        self.tracker.auto_init(verbose=self.verbose)
+        return self.tracker.roi_refle is not None
+
     def redraw_pupil(self):
         """
         Redraws the pupil in the same location.
@@ -1004,13 +1114,85 @@ class MyFrame(wx.Frame):
         """
         Tracks a pupil every frame.
         """
-        self.tracker.track_pupil(verbose=self.verbose)
+        self.tracker.track_pupil(verbose=self.verbose and
+                                 self.optional('verbose'))
 
     def track_refle(self):
         """
         Tracks a reflection every frame.
         """
-        self.tracker.track_refle(verbose=self.verbose)
+        self.tracker.track_refle(verbose=self.verbose and
+                                 self.optional('verbose'))
+
+    def optional(self, name):
+        """
+        Checks whether optional work should be done this frame, or was shed
+        by the load governor because playback is falling behind.
+
+        :param name: one of Playback.SHED_ORDER
+        :return: whether or not to do it
+        """
+        return not self.playing or self.scheduler.governor.active(name)
+
+    def track_frame(self):
+        """
+        Tracks the current frame and does everything else done per frame:
+        publishing, PiP and saving video.
+        """
+        self.track_pupil()
+        self.track_refle()
+        self.publish()
+        if self.to_pip and self.optional('pip'):
+            self.pip()
+        try:
+            self.write_out()
+        except IOError:
+            pass
+
+    def play_step(self):
+        """
+        Reads and tracks the next frame. Run by the playback scheduler's
+        worker, so touches nothing but the tracker.
+
+        :raise EOFError: if at end of video file
+        :raise IOError: if no video file loaded
+        """
+        self.next_frame()
+        self.track_frame()
+
+    def on_play_end(self):
+        """
+        Called by the playback scheduler's worker at the end of the video.
+        Finishes up on the gui thread.
+        """
+        if not wx.IsMainThread():
+            wx.CallAfter(self.on_play_end)
+            return
+
+        self.scheduler.stop()
+        self.image_panel.on_video_end()
+
+    def set_playback_mode(self, mode):
+        """
+        Sets how frames are played: 'fast', 'realtime' or 'step'.
+
+        :param mode: playback mode
+        """
+        was_playing = self.playing
+        self.pause()
+        self.scheduler.set_mode(mode)
+        if was_playing:
+            self.play()
+
+    def retrack_range(self, start, stop):
+        """
+        Re-tracks a range of frames with the current settings.
+
+        :param start: first frame to re-track
+        :param stop: frame after the last frame to re-track
+        :return: number of frames re-tracked
+        """
+        return self.tracker.retrack_range(start, stop, verbose=self.verbose)
 
     def next_frame(self):
         """
@@ -1030,6 +1212,12 @@ class MyFrame(wx.Frame):
         """
         return self.tracker.get_frame()
 
+    def publish(self):
+        """
+        Sends frame's results to any coordinate sinks.
+        """
+        self.tracker.publish()
+
     def pip(self):
         """
         Make picture in picture.
@@ -1042,12 +1230,6 @@ class MyFrame(wx.Frame):
         """
         self.tracker.write_out()
 
-    def update_plot(self):
-        """
-        Draws new data to plot panel.
-        """
-        self.plots_panel.on_draw(self.verbose)
-
     def toggle_playing(self, set_to=None):
         """
         Toggles playing variable.
@@ -1069,17 +1251,15 @@ class MyFrame(wx.Frame):
         """
         if self.to_plot:
             self.to_plot = False
-            size = self.Size
-            if not self.IsMaximized():
-                self.SetSize((size[0], size[1]-self.plots_panel.plot_height))
-            self.plots_panel.Hide()
-            self.Layout()
+            self.live_plot.stop()
         else:
             self.to_plot = True
-            size = self.Size
-            self.SetSize((size[0], size[1]+self.plots_panel.plot_height))
-            self.plots_panel.Show()
-            self.Layout()
+            if self.live_plot is None:
+                from LivePlot import LivePlot
+                self.live_plot = LivePlot()
+            self.live_plot.set_verbose(self.verbose)
+            if self.tracker.cap is not None:
+                self.live_plot.start(self.tracker, self.scheduler.lock)
 
     def toggle_to_pip(self):
         """
@@ -1112,7 +1292,32 @@ class MyFrame(wx.Frame):
                 self.redraw_refle()
             self.draw()
 
-        self.update_plot()
+        if self.live_plot is not None:
+            self.live_plot.set_verbose(self.verbose)
+
+    def init_out(self):
+        """
+        Starts saving video, either full frames or, if record eye only is
+        checked, crops around the pupil. Falls back to full frames if no pupil
+        is selected yet.
+        """
+        # the playback worker writes frames in write_out
+        with self.scheduler.lock:
+            if self.record_eye_only:
+                try:
+                    self.tracker.init_crop_out(self.save_video_name)
+                    return
+                except AttributeError:
+                    self.SetStatusText('No pupil selected; saving full '
+                                       'frames', 0)
+            self.tracker.init_out(self.save_video_name)
+
+    def release_out(self):
+        """
+        Stops saving video, once the frame being written is done.
+        """
+        with self.scheduler.lock:
+            self.tracker.release_out()
 
     def toggle_to_save_video(self, set_to=None):
         """
@@ -1123,7 +1328,7 @@ class MyFrame(wx.Frame):
         if set_to is not None:
             if not set_to and self.to_save_video:
                 self.to_save_video = False
-                self.tracker.release_out()
+                self.release_out()
                 self.tools_panel.save_video_toggle.SetValue(False)
 
             elif set_to and not self.to_save_video:
@@ -1134,7 +1339,7 @@ class MyFrame(wx.Frame):
 
                 self.to_save_video = True
                 self.save_dialog('video')
-                self.tracker.init_out(self.save_video_name)
+                self.init_out()
 
                 if was_playing:
                     self.play()
@@ -1145,7 +1350,7 @@ class MyFrame(wx.Frame):
         else:
             if self.to_save_video:
                 self.to_save_video = False
-                self.tracker.release_out()
+                self.release_out()
                 self.tools_panel.save_video_toggle.SetValue(False)
 
             else:
@@ -1155,7 +1360,7 @@ class MyFrame(wx.Frame):
                     self.stop()
 
                 self.to_save_video = True
-                self.tracker.init_out(self.save_video_name)
+                self.init_out()
                 self.save_dialog('video')
 
                 if was_playing:
@@ -1167,6 +1372,21 @@ class MyFrame(wx.Frame):
 
         :param set_to: overrides toggle
         """
+        # tracker calls this at the end of the video, which may be on the
+        # playback worker; dump now, before the tracker clears its data, and
+        # leave the toggle to the gui thread
+        if not wx.IsMainThread():
+            if not set_to and self.to_dump_data:
+                self.to_dump_data = False
+                try:
+                    self.tracker.dump_data(self.dump_file_name)
+                # no filename passed
+                except TypeError:
+                    pass
+                wx.CallAfter(self.tools_panel.dump_data_toggle.SetValue,
+                             False)
+            return
+
         if set_to is not None:
             if not set_to and self.to_dump_data:
                 self.to_dump_data = False
@@ -1213,10 +1433,13 @@ class MyFrame(wx.Frame):
 
     def open_video(self, video_file):
         """
-        Opens the video and loads the first frame. Makes plot.
+        Opens the video and loads the first frame. Restarts the plot, if open.
 
         :param video_file: video file to open
         """
+        # the playback worker reads from the capture being replaced
+        self.pause()
+
         self.SetStatusText(video_file, 0)
 
         width = self.image_panel.GetClientRect()[2]
@@ -1226,7 +1449,9 @@ class MyFrame(wx.Frame):
         # load first frame
         self.load_frame(self.tracker.get_frame())
 
-        self.plots_panel.init_plot(self.tracker.data, self.tracker.angle_data)
+        # new video has new data arrays to share
+        if self.to_plot:
+            self.live_plot.start(self.tracker, self.scheduler.lock)
 
     def load_frame(self, img):
         """
@@ -1312,6 +1537,173 @@ class MyFrame(wx.Frame):
         self.tools_panel.clear_indices()
         self.open_video('webcam')
 
+    def on_file_eye_only(self, evt):
+        """
+        Menu event for file, record eye only. Sets whether videos are saved
+        as crops around the pupil, from the next time saving starts.
+
+        :param evt: required event parameter
+        """
+        self.record_eye_only = evt.IsChecked()
+
+    def on_track_retrack(self, evt):
+        """
+        Menu event for track, re-track range. Re-tracks a range of frames
+        starting at the current frame, using the current thresholds and
+        selected pupil and reflection.
+
+        :param evt: required event parameter
+        """
+        self.pause()
+        tracker = self.tracker
+        if tracker.cap is None:
+            return
+
+        first = max(tracker.frame_num, 0) + 1
+        dialog = wx.TextEntryDialog(self,
+                                    message='Frames to re-track (first-last)',
+                                    caption='Re-track range',
+                                    defaultValue='{}-{}'.format(
+                                        first, tracker.num_frames))
+
+        # to exit out of popup on cancel button
+        if dialog.ShowModal() == wx.ID_CANCEL:
+            return
+
+        try:
+            first, last = [int(i) for i in dialog.GetValue().split('-')]
+        except ValueError:
+            print('Range must be two frame numbers, e.g. 100-200.')
+            return
+
+        try:
+            count = self.retrack_range(first - 1, last)
+        except AttributeError as e:
+            print(e)
+            return
+
+        self.SetStatusText('Re-tracked {} frames'.format(count), 0)
+        self.SetStatusText(str(tracker.frame_num+1) + '/' +
+                           str(tracker.num_frames), 1)
+        self.draw()
+
+    def on_track_mode(self, evt):
+        """
+        Menu event for track, playback mode radio items.
+
+        :param evt: required event parameter
+        """
+        self.set_playback_mode(self.playback_modes[evt.GetId()])
+
+    def on_track_preview(self, evt):
+        """
+        Menu event for track, preview rate. Sets the most frames a second to
+        show while playing; blank for the monitor refresh rate. Every frame is
+        still tracked.
+
+        :param evt: required event parameter
+        """
+        rate = self.image_panel.preview_rate
+        dialog = wx.TextEntryDialog(self,
+                                    message='Frames shown per second '
+                                            '(blank for monitor rate)',
+                                    caption='Preview rate',
+                                    defaultValue='' if rate is None else
+                                    str(rate))
+
+        # to exit out of popup on cancel button
+        if dialog.ShowModal() == wx.ID_CANCEL:
+            return
+
+        value = dialog.GetValue().strip()
+        try:
+            rate = float(value) if value else None
+        except ValueError:
+            print('Preview rate must be a number.')
+            return
+        if rate is not None and rate <= 0:
+            print('Preview rate must be above zero.')
+            return
+
+        self.image_panel.preview_rate = rate
+        if self.playing:
+            self.image_panel.stop_timer()
+            self.image_panel.start_timer()
+
+    def on_track_stream(self, evt):
+        """
+        Menu event for track, stream coordinates. Starts or stops sending
+        each frame's coordinates to a local socket.
+
+        :param evt: required event parameter
+        """
+        if evt.IsChecked():
+            with self.scheduler.lock:
+                self.tracker.sinks.append(CoordinatePublisher())
+        else:
+            self.remove_sinks(CoordinatePublisher)
+
+    def on_track_saccades(self, evt):
+        """
+        Menu event for track, detect saccades. Starts or stops smoothing
+        position and detecting saccades on each tracked frame, and reports
+        the time it took per frame when stopped. Position is corrected by the
+        reflection if one is selected when started.
+
+        :param evt: required event parameter
+        """
+        if evt.IsChecked():
+            # webcam frames are timed by capture, video frames by frame rate
+            if self.tracker.video_file == 'webcam':
+                fps = None
+            else:
+                fps = self.tracker.fps
+            with self.scheduler.lock:
+                self.tracker.sinks.append(
+                    OnlineFilter(fps=fps,
+                                 correct=self.tracker.roi_refle is not None,
+                                 on_event=self.on_saccade))
+        else:
+            for sink in self.remove_sinks(OnlineFilter):
+                stats = sink.report()
+                if stats['samples']:
+                    self.SetStatusText('Saccade detection: {samples} frames, '
+                                       'median {median_ms:.3f} ms, max '
+                                       '{max_ms:.3f} ms per frame'.format(
+                                           **stats), 0)
+
+    def on_saccade(self, event):
+        """
+        Called by the online filter on saccade start and end, from whichever
+        thread is tracking. Events are sent on with the coordinates when
+        streaming, see CoordinatePublisher.publish_event.
+
+        :param event: event tuple, see OnlineFilter.emit
+        """
+        for sink in self.tracker.sinks:
+            if isinstance(sink, CoordinatePublisher):
+                sink.publish_event(event)
+
+        if self.verbose:
+            print(event)
+
+    def remove_sinks(self, kind):
+        """
+        Closes and removes the tracker's coordinate sinks of a type.
+
+        :param kind: sink class
+        :return: sinks removed
+        """
+        # the playback worker publishes to the sinks each frame
+        with self.scheduler.lock:
+            removed = [sink for sink in self.tracker.sinks
+                       if isinstance(sink, kind)]
+            for sink in removed:
+                sink.close()
+            self.tracker.sinks = [sink for sink in self.tracker.sinks
+                                  if not isinstance(sink, kind)]
+        return removed
+
     def on_help_about(self, evt):
         """
         Menu event for help, about.
@@ -1334,6 +1726,8 @@ class MyFrame(wx.Frame):
         :param evt: required event parameter
         """
         self.pause()
+        if self.live_plot is not None:
+            self.live_plot.stop()
         try:
             self.tracker.release_cap()
         except IOError:
@@ -1348,21 +1742,55 @@ class MyFrame(wx.Frame):
         :param evt: required event parameter
         """
         new_width = self.image_panel.GetClientRect()[2]
-        size = self.tracker.get_set_scaled_size(new_width)
 
         try:
-            self.tracker.on_size()
-            self.redraw_pupil()
-            self.redraw_refle()
-            self.image_panel.on_size(size, self.get_frame())
-            # self.plots_panel.copy_background()
-            # self.plots_panel.init_plot(
-            # TODO: fix plot background sizing problem
+            # resizes buffers the playback worker draws into
+            with self.scheduler.lock:
+                size = self.tracker.get_set_scaled_size(new_width)
+                self.tracker.on_size()
+                self.redraw_pupil()
+                self.redraw_refle()
+                self.image_panel.on_size(size, self.get_frame())
         except IOError:
             pass
 
         evt.Skip()
 
+    def show_suspect(self, direction='forward'):
+        """
+        Jumps to the next or previous frame with suspect tracking, so only
+        those frames need reviewing, and shows the pupil and reflection as
+        tracked there.
+
+        :param direction: 'forward' or 'backward'
+        """
+        self.pause()
+        tracker = self.tracker
+        if tracker.cap is None:
+            return
+
+        suspects = tracker.suspect_frames()
+        if direction == 'forward':
+            later = suspects[suspects > tracker.frame_num]
+            frame_num = int(later[0]) if len(later) else None
+        else:
+            earlier = suspects[suspects < tracker.frame_num]
+            frame_num = int(earlier[-1]) if len(earlier) else None
+
+        if frame_num is None:
+            self.SetStatusText('No more suspect frames', 0)
+            return
+
+        # reading the frame clears the overlay; show what was tracked
+        tracker.seek(frame_num)
+        tracker.next_frame()
+        tracker.mark_geometry()
+        self.SetStatusText('Suspect frame ({} total)'.format(len(suspects)),
+                           0)
+        self.SetStatusText(str(tracker.frame_num+1) + '/' +
+                           str(tracker.num_frames), 1)
+        self.draw()
+
     def on_maximize(self, evt):
         """
         Catches maximize event. Because of bug with getting size after
@@ -1389,6 +1817,12 @@ class MyFrame(wx.Frame):
             self.draw(step=True, direction='backward')
             # print('sorry, can\'t yet')
 
+        elif key == ord('N'):
+            self.show_suspect(direction='forward')
+
+        elif key == ord('P'):
+            self.show_suspect(direction='backward')
+
         else:
             evt.Skip()
 
@@ -0,0 +1,213 @@
+"""
+Content-addressed cache of tracking results.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import os
+import re
+import hashlib
+import numpy as np
+
+# top level import of a module, e.g. 'from BufferPool import BufferPool'
+IMPORT = re.compile(r'^(?:from|import)\s+(\w+)')
+
+
+def video_digest(video_file, samples=64, chunk_size=2**16):
+    """
+    Hashes the identity of a video file. The size and chunks spread evenly
+    from the start to the end of the file are read, so large videos are
+    hashed in constant time yet a change anywhere in the encoded stream is
+    likely seen. Small files are read whole.
+
+    :param video_file: video path
+    :param samples: number of chunks read
+    :param chunk_size: bytes per chunk
+    :return: hex digest
+    """
+    size = os.path.getsize(video_file)
+    sha = hashlib.sha1(str(size).encode('ascii'))
+
+    with open(video_file, 'rb') as f:
+        if size <= samples * chunk_size:
+            sha.update(f.read())
+        else:
+            last = size - chunk_size
+            for i in range(samples):
+                f.seek(i * last // (samples - 1))
+                sha.update(f.read(chunk_size))
+
+    return sha.hexdigest()
+
+
+def tracking_modules(module='PupilTracker.py'):
+    """
+    Finds the modules of this package a module imports, directly or not.
+
+    :param module: file name of the module to start from
+    :return: sorted list of file names, including module
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    found = set()
+    pending = [module]
+    while pending:
+        name = pending.pop()
+        if name in found:
+            continue
+        found.add(name)
+        with open(os.path.join(here, name)) as f:
+            for line in f:
+                match = IMPORT.match(line)
+                if match is None:
+                    continue
+                imported = match.group(1) + '.py'
+                if os.path.isfile(os.path.join(here, imported)):
+                    pending.append(imported)
+
+    return sorted(found)
+
+
+def code_version():
+    """
+    Hashes the source of the tracking code, i.e. the tracker and every module
+    of this package it imports, so cached results are invalidated whenever
+    the code that produced them changes.
+
+    :return: hex digest
+    """
+    sha = hashlib.sha1()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for module in tracking_modules():
+        sha.update(module.encode('ascii'))
+        with open(os.path.join(here, module), 'rb') as f:
+            sha.update(f.read())
+
+    return sha.hexdigest()
+
+
+class ResultCache(object):
+    """
+    On disk cache of result arrays, keyed by a hash of the video, the tracker
+    parameters and the code version. Least recently used entries are evicted
+    once the cache grows past its size limit.
+    """
+    def __init__(self, cache_dir=None, max_bytes=512 * 2**20):
+        """
+        Constructor.
+
+        :param cache_dir: directory to hold cache entries
+        :param max_bytes: size limit of the cache in bytes
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser('~'),
+                                     '.pupiltracker', 'cache')
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        # video digests, keyed by (path, size, mtime) so files aren't rehashed
+        self.digests = {}
+        self.version = code_version()
+
+    def make_key(self, video_file, params):
+        """
+        Makes the cache key for a run.
+
+        :param video_file: video path
+        :param params: tuple of tracker parameters (thresholds, rois, etc)
+        :return: hex key
+        """
+        stat = os.stat(video_file)
+        ident = (os.path.abspath(video_file), stat.st_size, stat.st_mtime)
+        if ident not in self.digests:
+            self.digests[ident] = video_digest(video_file)
+
+        sha = hashlib.sha1()
+        sha.update(self.digests[ident].encode('ascii'))
+        sha.update(repr(params).encode('ascii'))
+        sha.update(self.version.encode('ascii'))
+
+        return sha.hexdigest()
+
+    def path(self, key):
+        """
+        Gets the file path of a cache entry.
+
+        :param key: cache key
+        :return: entry path
+        """
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def get(self, key):
+        """
+        Loads a cache entry and marks it as recently used.
+
+        :param key: cache key
+        :return: dict of cached arrays, or None on miss
+        """
+        entry = self.path(key)
+        if not os.path.isfile(entry):
+            return None
+
+        try:
+            with np.load(entry) as cached:
+                arrays = dict((name, cached[name]) for name in cached.files)
+        except (IOError, ValueError):
+            # corrupt entry
+            os.remove(entry)
+            return None
+
+        # touch for lru
+        os.utime(entry, None)
+
+        return arrays
+
+    def put(self, key, **arrays):
+        """
+        Saves arrays as a cache entry and evicts old entries if over the size
+        limit.
+
+        :param key: cache key
+        :param arrays: named arrays to cache
+        """
+        entry = self.path(key)
+        tmp = entry + '.tmp'
+
+        # write then rename so a half written entry is never read
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        if os.path.exists(entry):
+            os.remove(entry)
+        os.rename(tmp, entry)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used entries until under the size limit.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                entry = os.path.join(self.cache_dir, name)
+                stat = os.stat(entry)
+                entries.append((stat.st_mtime, stat.st_size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(entry)
+            total -= size
+
+    def clear(self):
+        """
+        Removes all cache entries.
+        """
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(self.cache_dir, name))
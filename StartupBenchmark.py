@@ -0,0 +1,124 @@
+"""
+Measures how long a fresh process takes to import the tracking core and to
+load the first frame of a video, and checks no GUI or plotting library is
+pulled in along the way. Batch jobs start many short-lived workers, so this
+should stay low.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import argparse
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+
+# libraries the tracking core must not import
+HEAVY_MODULES = ['wx', 'wxmplot', 'matplotlib']
+
+# run in a fresh interpreter, so nothing is imported yet
+PROBE = """
+import json, sys, time
+start = time.time()
+import PupilTracker
+imported = time.time()
+first_frame = None
+if len(sys.argv) > 1:
+    tracker = PupilTracker.PupilTracker(PupilTracker.HeadlessApp())
+    tracker.init_cap(sys.argv[1], 960)
+    first_frame = time.time() - imported
+print(json.dumps(dict(
+    import_ms=1000 * (imported - start),
+    first_frame_ms=None if first_frame is None else 1000 * first_frame,
+    heavy=[m for m in {heavy} if m in sys.modules])))
+"""
+
+
+def probe(video_file=None):
+    """
+    Times one cold start in a new process.
+
+    :param video_file: video to load the first frame of, or None to only
+        import
+    :return: dict of import_ms, first_frame_ms and heavy, the heavy modules
+        that were imported
+    """
+    args = [sys.executable, '-c', PROBE.format(heavy=HEAVY_MODULES)]
+    if video_file is not None:
+        args.append(os.path.abspath(video_file))
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.check_output(args, cwd=here)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def measure(video_file=None, runs=5):
+    """
+    Times several cold starts. The first run also warms the disk cache, so it
+    is dropped.
+
+    :param video_file: video to load the first frame of, or None to only
+        import
+    :param runs: number of runs to time
+    :return: dict of median and max import and first frame times in ms, and
+        heavy modules imported
+    """
+    probe(video_file)
+    results = [probe(video_file) for _ in range(runs)]
+
+    stats = dict(runs=runs,
+                 heavy=sorted(set(m for r in results for m in r['heavy'])))
+    for name in ['import_ms', 'first_frame_ms']:
+        times = [r[name] for r in results if r[name] is not None]
+        if times:
+            stats[name + '_median'] = float(np.median(times))
+            stats[name + '_max'] = float(np.max(times))
+
+    return stats
+
+
+def main():
+    """
+    Runs the startup benchmark from the command line. Exits with an error if
+    a limit is given and exceeded, or a heavy module was imported.
+    """
+    parser = argparse.ArgumentParser(
+        description='Measure tracker import and first frame latency.')
+    parser.add_argument('video_file', nargs='?',
+                        help='video to load the first frame of')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-import-ms', type=float,
+                        help='fail if median import time is above this')
+    parser.add_argument('--max-first-frame-ms', type=float,
+                        help='fail if median first frame time is above this')
+    args = parser.parse_args()
+
+    stats = measure(args.video_file, args.runs)
+
+    print('import: median {:.1f} ms, max {:.1f} ms'.format(
+        stats['import_ms_median'], stats['import_ms_max']))
+    if 'first_frame_ms_median' in stats:
+        print('first frame: median {:.1f} ms, max {:.1f} ms'.format(
+            stats['first_frame_ms_median'], stats['first_frame_ms_max']))
+
+    failed = False
+    if stats['heavy']:
+        print('core imported: ' + ', '.join(stats['heavy']))
+        failed = True
+    if args.max_import_ms is not None and \
+            stats['import_ms_median'] > args.max_import_ms:
+        print('import slower than {} ms'.format(args.max_import_ms))
+        failed = True
+    if args.max_first_frame_ms is not None and \
+            stats.get('first_frame_ms_median', 0) > args.max_first_frame_ms:
+        print('first frame slower than {} ms'.format(args.max_first_frame_ms))
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
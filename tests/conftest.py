@@ -0,0 +1,51 @@
+"""
+Shared fixtures. The modules live at the top of the repository, so it is put
+on the path here.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import os
+import sys
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def write_eye_video(path, num_frames=60, size=(640, 480), jump_at=None):
+    """
+    Writes a synthetic eye video: a dark pupil drifting across a gray frame
+    with a bright square reflection beside its center.
+
+    :param path: video save path
+    :param num_frames: number of frames
+    :param size: (width, height) of frames
+    :param jump_at: frame the pupil jumps 60 pixels right at, or None
+    :return: path
+    """
+    w, h = size
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, size)
+    for i in range(num_frames):
+        img = np.full((h, w, 3), 150, np.uint8)
+        x = w * 0.4 + 0.2 * i
+        y = h * 0.45 + 0.1 * i
+        if jump_at is not None and i >= jump_at:
+            x += 60
+        cv2.ellipse(img, ((x, y), (90, 80), 0), (20, 20, 20), -1)
+        rx, ry = int(x) + 15, int(y) - 15
+        cv2.rectangle(img, (rx, ry), (rx + 10, ry + 10), (255, 255, 255), -1)
+        out.write(img)
+    out.release()
+    return path
+
+
+@pytest.fixture
+def eye_video(tmp_path):
+    """
+    :return: path of a 60 frame synthetic eye video
+    """
+    return write_eye_video(str(tmp_path / 'eye.avi'))
@@ -0,0 +1,78 @@
+"""
+Streaming analysis gives the same results whatever the chunk size.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import numpy as np
+import pytest
+from Analysis import analyze_file, has_reflection
+
+
+def write_data(path, reflection=True, n=3000):
+    """
+    Writes a data file like dump_data: a random walk with gaps, a spike, a
+    few saccades and a blink.
+
+    :param path: file save path
+    :param reflection: whether or not a reflection was tracked
+    :param n: number of frames
+    :return: path
+    """
+    rng = np.random.RandomState(0)
+    pupil = np.cumsum(rng.randn(n, 2), 0) + 200
+    for start in range(500, n, 700):
+        pupil[start:] += 40
+    pupil[100:103] = np.NaN
+    pupil[1200:1210] = np.NaN
+    pupil[300] += 60
+    refle = np.full((n, 2), 50.0 if reflection else np.NaN)
+    blink = np.zeros(n, int)
+    blink[2000:2005] = 1
+
+    with open(path, 'w') as f:
+        for name, values, fmt, units in [
+                ('pupil', pupil, '%.0f', 'x,y (pixels)'),
+                ('reflection', refle, '%.0f', 'x,y (pixels)'),
+                ('angle', np.zeros(n), '%f', 'degrees'),
+                ('time', np.arange(n) / 60, '%.6f', 'seconds'),
+                ('blink', blink, '%d', '1 if eye closed')]:
+            np.savetxt(f, values, delimiter=',', fmt=fmt,
+                       header='{} data\n{}'.format(name, units),
+                       footer='end {} data\n'.format(name))
+    return path
+
+
+def analyze(path, out_path, chunk_size):
+    """
+    :return: per frame results, saccades and fixations
+    """
+    analyzer = analyze_file(path, out_path, chunk_size)
+    return (np.loadtxt(out_path, delimiter=','), analyzer.saccades,
+            analyzer.fixations)
+
+
+@pytest.mark.parametrize('chunk_size', [1000, 7, 3])
+def test_chunk_size_invariance(tmp_path, chunk_size):
+    path = write_data(str(tmp_path / 'data.csv'))
+    whole = analyze(path, str(tmp_path / 'whole.csv'), 65536)
+    chunked = analyze(path, str(tmp_path / 'chunked.csv'), chunk_size)
+
+    assert len(whole[1]) > 0
+    np.testing.assert_allclose(chunked[0], whole[0])
+    np.testing.assert_allclose(chunked[1], whole[1])
+    np.testing.assert_allclose(chunked[2], whole[2])
+
+
+def test_raw_pupil_without_reflection(tmp_path):
+    corrected = write_data(str(tmp_path / 'corrected.csv'))
+    raw = write_data(str(tmp_path / 'raw.csv'), reflection=False)
+    assert has_reflection(corrected)
+    assert not has_reflection(raw)
+
+    with_refle = analyze(corrected, str(tmp_path / 'a.csv'), 65536)
+    without = analyze(raw, str(tmp_path / 'b.csv'), 65536)
+    # same movement, relative to the first frame either way
+    np.testing.assert_allclose(without[0], with_refle[0])
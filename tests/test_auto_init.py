@@ -0,0 +1,53 @@
+"""
+Automatic selection goes by the cluster scored over several frames, not the
+best candidate of one frame.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import cv2
+import numpy as np
+from PupilTracker import PupilTracker, HeadlessApp
+
+
+def write_decoy_video(path, num_frames=10):
+    """
+    Writes a video of a long pupil at (300, 200), and on the first frame only
+    a rounder, darker blob with a reflection just below it, close enough to
+    be in the box searched around the pupil.
+
+    :param path: video save path
+    :param num_frames: number of frames
+    :return: path
+    """
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30,
+                          (640, 480))
+    for i in range(num_frames):
+        img = np.full((480, 640, 3), 150, np.uint8)
+        cv2.ellipse(img, ((300, 200), (180, 90), 0), (40, 40, 40), -1)
+        if i == 0:
+            cv2.circle(img, (300, 305), 45, (5, 5, 5), -1)
+            cv2.rectangle(img, (302, 297), (308, 303), (255, 255, 255), -1)
+        out.write(img)
+    out.release()
+    return path
+
+
+def test_selects_winning_cluster_over_best_single_candidate(tmp_path):
+    path = write_decoy_video(str(tmp_path / 'decoy.avi'))
+    tracker = PupilTracker(HeadlessApp())
+    tracker.init_cap(path, 640)
+
+    # on the first frame alone, the decoy is the better candidate
+    tracker.seek(0)
+    tracker.read_frame()
+    candidates = tracker.find_pupils()
+    assert len(candidates) == 2
+    best = max(candidates, key=lambda c: tracker.score_pupil(*c))
+    assert abs(best[0][0][1] - 305) < 2
+
+    tracker.auto_init()
+    assert abs(tracker.cx_pupil - 300) < 2
+    assert abs(tracker.cy_pupil - 200) < 2
@@ -0,0 +1,77 @@
+"""
+Blink detection holds off re-acquisition, but not for good.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import cv2
+import numpy as np
+from PupilTracker import PupilTracker, HeadlessApp
+
+
+def write_blink_video(path, reopen_at=(250, 220), num_frames=60):
+    """
+    Writes a video of an eye at (250, 220) closed on frames 20 to 29, with a
+    lid brighter than the background over it, then open at reopen_at.
+
+    :param path: video save path
+    :param reopen_at: pupil center once the eye opens again
+    :param num_frames: number of frames
+    :return: path
+    """
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30,
+                          (640, 480))
+    for i in range(num_frames):
+        img = np.full((480, 640, 3), 150, np.uint8)
+        if 20 <= i < 30:
+            cv2.ellipse(img, ((250, 220), (120, 100), 0), (175, 175, 175),
+                        -1)
+        else:
+            x, y = (250, 220) if i < 20 else reopen_at
+            cv2.ellipse(img, ((x, y), (90, 80), 0), (20, 20, 20), -1)
+            cv2.rectangle(img, (x + 15, y - 15), (x + 25, y - 5),
+                          (255, 255, 255), -1)
+        out.write(img)
+    out.release()
+    return path
+
+
+def track(path, **settings):
+    """
+    :param path: video path
+    :param settings: tracker attributes to set
+    :return: tracker that tracked the whole video from auto_init
+    """
+    tracker = PupilTracker(HeadlessApp())
+    tracker.init_cap(path, 640)
+    for name, value in settings.items():
+        setattr(tracker, name, value)
+    tracker.auto_init()
+    tracker.track_all()
+    return tracker
+
+
+def test_blink_is_marked(tmp_path):
+    path = write_blink_video(str(tmp_path / 'blink.avi'))
+    tracker = track(path, blink_ratio=0.3)
+
+    assert tracker.blink_intervals() == [(20, 30)]
+    assert not np.isnan(tracker.data[0][30:, 0]).any()
+
+
+def test_off_by_default(tmp_path):
+    path = write_blink_video(str(tmp_path / 'blink.avi'))
+    assert track(path).blink_intervals() == []
+
+
+def test_reopening_outside_roi_is_found(tmp_path):
+    path = write_blink_video(str(tmp_path / 'moved.avi'),
+                             reopen_at=(560, 380))
+    tracker = track(path, blink_ratio=0.3, reacquire_after=3)
+
+    start, stop = tracker.blink_intervals()[0]
+    assert start == 20 and stop <= 20 + tracker.max_blink
+    assert not np.isnan(tracker.data[0][stop:, 0]).any()
+    np.testing.assert_allclose(tracker.data[0][-1], (560, 380), atol=2)
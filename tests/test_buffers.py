@@ -0,0 +1,65 @@
+"""
+Buffer reuse must not change what is tracked.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import numpy as np
+from BufferPool import BufferPool
+from PupilTracker import PupilTracker, HeadlessApp
+
+
+class FreshPool(BufferPool):
+    """
+    Pool that hands out a new array every time, as if nothing were reused.
+    """
+    def get(self, name, shape, dtype=np.uint8):
+        self.allocations += 1
+        return np.empty(shape, dtype)
+
+    def view(self, name, shape, dtype=np.uint8, capacity=0):
+        return self.get(name, shape, dtype)
+
+
+def track(path, pool=None):
+    """
+    Tracks a video from auto_init.
+
+    :param path: video path
+    :param pool: pool to use for the tracker and its detector, or None for
+        their own
+    :return: tracker
+    """
+    tracker = PupilTracker(HeadlessApp())
+    if pool is not None:
+        tracker.buffers = pool
+        tracker.detector.buffers = pool
+    tracker.init_cap(path, 640)
+    tracker.auto_init()
+    tracker.track_all()
+    return tracker
+
+
+def test_view_keeps_one_allocation():
+    pool = BufferPool()
+    big = pool.view('roi', (40, 50), capacity=100 * 100)
+    small = pool.view('roi', (13, 7))
+    assert pool.allocations == 1
+    assert small.shape == (13, 7) and small.flags['C_CONTIGUOUS']
+    assert np.shares_memory(big, small)
+
+    pool.view('roi', (101, 100))
+    assert pool.allocations == 2
+
+
+def test_reuse_matches_fresh_buffers(eye_video):
+    reused = track(eye_video)
+    fresh = track(eye_video, FreshPool())
+
+    assert not np.isnan(reused.data[0][:, 0]).all()
+    np.testing.assert_array_equal(reused.data, fresh.data)
+    np.testing.assert_array_equal(reused.angle_data, fresh.angle_data)
+    # roi buffers are cut from frame sized ones, so aren't remade per frame
+    assert reused.buffers.allocations < 20
@@ -0,0 +1,61 @@
+"""
+Result cache keys and eviction.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import os
+import numpy as np
+from ResultCache import ResultCache, tracking_modules, video_digest
+
+
+def test_key_depends_on_video_and_params(tmp_path, eye_video):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    other = str(tmp_path / 'other.avi')
+    with open(eye_video, 'rb') as f, open(other, 'wb') as g:
+        g.write(f.read()[::-1])
+
+    key = cache.make_key(eye_video, (50, 190))
+    assert cache.make_key(eye_video, (50, 190)) == key
+    assert cache.make_key(eye_video, (51, 190)) != key
+    assert cache.make_key(other, (50, 190)) != key
+
+
+def test_digest_sees_middle_of_large_file(tmp_path):
+    path = str(tmp_path / 'big.bin')
+    data = bytearray(np.random.RandomState(0).bytes(100000))
+    with open(path, 'wb') as f:
+        f.write(data)
+    before = video_digest(path, samples=3, chunk_size=1000)
+
+    # inside the middle chunk read, far from both ends
+    data[len(data) // 2] ^= 0xFF
+    with open(path, 'wb') as f:
+        f.write(data)
+    assert video_digest(path, samples=3, chunk_size=1000) != before
+
+
+def test_version_covers_tracking_imports():
+    modules = tracking_modules()
+    for module in ['PupilTracker.py', 'PupilDetectors.py', 'BufferPool.py',
+                   'CropArchive.py', 'Overlay.py']:
+        assert module in modules
+
+
+def test_evicts_least_recently_used(tmp_path):
+    entry = np.zeros(1000)
+    cache = ResultCache(str(tmp_path), max_bytes=2.5 * entry.nbytes)
+
+    for age, key in enumerate(['a', 'b']):
+        cache.put(key, data=entry)
+        os.utime(cache.path(key), (age, age))
+
+    # a is older, but used since
+    assert cache.get('a') is not None
+    cache.put('c', data=entry)
+
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
+    assert cache.get('c') is not None
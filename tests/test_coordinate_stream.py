@@ -0,0 +1,77 @@
+"""
+Coordinates and events survive the trip through a loopback receiver.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import socket
+import time
+import numpy as np
+import pytest
+from CoordinateStream import (MESSAGE, EVENT, unpack, unpack_event,
+                              CoordinatePublisher, LoopbackReceiver)
+
+
+def free_port():
+    """
+    :return: a UDP port nothing is bound to on localhost
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@pytest.fixture(params=['udp', 'unix'])
+def address(request, tmp_path):
+    """
+    :return: a UDP address, or a unix domain socket path where supported
+    """
+    if request.param == 'udp':
+        return ('127.0.0.1', free_port())
+    if not hasattr(socket, 'AF_UNIX'):
+        pytest.skip('no unix domain sockets')
+    return str(tmp_path / 'stream.sock')
+
+
+def test_messages_round_trip():
+    assert MESSAGE.size != EVENT.size
+
+    message = MESSAGE.pack(7, 1.5, 2.5, 10, 20, 30, 40, 45)
+    assert unpack(message) == (7, 1.5, 2.5, 10, 20, 30, 40, 45)
+
+    message = EVENT.pack(1, 9, 3.0, 4.0, 5, 6, 0.25, 8, 300)
+    assert unpack_event(message) == ('saccade_end', 9, 3.0, 4.0, 5, 6, 0.25,
+                                     8, 300)
+
+
+def test_loopback(address, capsys):
+    receiver = LoopbackReceiver(address, verbose=True)
+    receiver.start()
+    publisher = CoordinatePublisher(address)
+
+    for frame_num in range(5):
+        publisher.publish(frame_num, time.time(), (100 + frame_num, 200),
+                          (np.NaN, np.NaN), 30)
+    publisher.publish_event(('saccade_start', 3, 0.05, 103, 200))
+    publisher.publish_event(('saccade_end', 4, 0.1, 110, 201, 0.05, 7, 250))
+
+    time.sleep(0.2)
+    receiver.stop()
+    publisher.close()
+
+    assert publisher.dropped == 0
+    assert receiver.report()['received'] == 5
+    assert max(receiver.send_latency) < 0.2
+    assert 'frame 4 pupil (104, 200) refle (nan, nan) angle 30.0' in \
+        capsys.readouterr().out
+
+    start, end = receiver.events
+    assert start[:3] == ('saccade_start', 3, 0.05)
+    assert start[4:6] == (103, 200)
+    assert np.isnan(start[6:]).all()
+    assert end[:3] == ('saccade_end', 4, 0.1)
+    assert end[4:] == (110, 201, pytest.approx(0.05), 7, 250)
@@ -0,0 +1,43 @@
+"""
+Eye crops re-track to the same positions as the full frames.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import numpy as np
+from CropArchive import CropCapture, is_crop_archive
+from PupilTracker import PupilTracker, HeadlessApp
+
+
+def test_crop_round_trip(tmp_path, eye_video):
+    crop_path = str(tmp_path / 'crop.avi')
+
+    full = PupilTracker(HeadlessApp())
+    full.init_cap(eye_video, 640)
+    full.auto_init()
+    full.init_crop_out(crop_path, fourcc='MJPG')
+    full.seek(0)
+    while full.frame_num + 1 < full.num_frames and full.read_frame():
+        full.frame_num += 1
+        full.stamp_frame()
+        full.track_pupil()
+        full.track_refle()
+        full.write_out()
+    full.release_out()
+
+    assert is_crop_archive(crop_path)
+    cap = CropCapture(crop_path)
+    assert cap.source_size == full.vid_size
+    assert len(cap.offsets) == full.num_frames
+    cap.release()
+
+    crop = PupilTracker(HeadlessApp())
+    crop.init_cap(crop_path, 640)
+    assert crop.param_scale == full.param_scale
+    crop.auto_init()
+    crop.track_all()
+
+    assert not np.isnan(crop.data).any()
+    np.testing.assert_allclose(crop.data, full.data, atol=1)
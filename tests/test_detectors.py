@@ -0,0 +1,43 @@
+"""
+Every pupil detector finds the synthetic pupil, and the benchmark harness
+compares them.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import numpy as np
+import pytest
+from PupilDetectors import DETECTORS, benchmark, get_detector
+from PupilTracker import PupilTracker, HeadlessApp
+
+
+@pytest.mark.parametrize('name', sorted(DETECTORS))
+def test_detector_tracks_pupil(eye_video, name):
+    tracker = PupilTracker(HeadlessApp())
+    tracker.set_detector(name)
+    tracker.init_cap(eye_video, 640)
+    tracker.auto_init()
+    tracker.track_all()
+
+    # where write_eye_video drew it
+    frames = np.arange(60)
+    truth = np.column_stack([256 + 0.2 * frames, 216 + 0.1 * frames])
+    assert np.abs(tracker.data[0] - truth).max() < 2
+
+
+def test_benchmark_compares_all(eye_video):
+    results = benchmark(eye_video, max_frames=30)
+
+    assert sorted(results) == sorted(DETECTORS)
+    for result in results.values():
+        assert result['detected'] == 1
+        assert result['ms_per_frame'] > 0
+        assert result['p95_err'] < 2
+    assert results['contour']['median_err'] == 0
+
+
+def test_unknown_detector():
+    with pytest.raises(AttributeError):
+        get_detector('hough')
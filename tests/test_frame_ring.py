@@ -0,0 +1,55 @@
+"""
+Frame ring validity as the writer laps readers.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+from LivePipeline import FrameRing
+
+
+class CountingCapture(object):
+    """
+    Capture whose frame i is filled with i.
+    """
+    def __init__(self):
+        self.count = 0
+
+    def read(self, image=None):
+        image[...] = self.count
+        self.count += 1
+        return True, image
+
+
+def test_frames_valid_until_lapped():
+    ring = FrameRing((2, 3, 3), slots=4)
+    cap = CountingCapture()
+
+    for _ in range(3):
+        ring.write_from(cap)
+    frame, _ = ring.read(0)
+    assert (frame == 0).all()
+    assert ring.still_valid(0)
+
+    ring.write_from(cap)
+    # the next write goes into frame 0's buffer
+    assert not ring.still_valid(0)
+    assert ring.still_valid(1)
+
+    ring.write_from(cap)
+    assert (ring.read(0)[0] == 4).all()
+    assert not ring.still_valid(1)
+
+
+def test_reader_skips_overwritten_frames():
+    ring = FrameRing((2, 3, 3), slots=4)
+    cap = CountingCapture()
+
+    assert ring.next_index(0) == (None, 0)
+    for _ in range(6):
+        ring.write_from(cap)
+
+    assert ring.next_index(0) == (3, 3)
+    assert ring.next_index(4) == (4, 0)
+    assert ring.next_index(6) == (None, 0)
@@ -0,0 +1,49 @@
+"""
+The temporal coherence gate reuses the pupil while its roi looks the same,
+and detects again once it doesn't.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import numpy as np
+from conftest import write_eye_video
+from PupilTracker import PupilTracker, HeadlessApp
+
+
+def track(path, **settings):
+    """
+    :param path: video path
+    :param settings: tracker attributes to set
+    :return: tracker that tracked the whole video from auto_init
+    """
+    tracker = PupilTracker(HeadlessApp())
+    tracker.init_cap(path, 640)
+    for name, value in settings.items():
+        setattr(tracker, name, value)
+    tracker.auto_init()
+    tracker.track_all()
+    return tracker
+
+
+def test_gate_reuses_until_the_pupil_moves(tmp_path):
+    path = write_eye_video(str(tmp_path / 'eye.avi'), jump_at=30)
+    dense = track(path)
+    gated = track(path, gate_tol=2)
+
+    assert not dense.reused_data.any()
+    detected = np.flatnonzero(~gated.reused_data)
+    assert np.array_equal(detected, [0, 30])
+
+    # reused frames lag only by the slow drift, and the jump is caught
+    error = np.abs(gated.data[0] - dense.data[0])
+    assert error.max() <= 0.2 * 30
+    assert error[30].max() == 0
+    assert np.array_equal(np.isnan(gated.data[0]), np.isnan(dense.data[0]))
+
+
+def test_gate_off_by_default(eye_video):
+    tracker = track(eye_video)
+    assert tracker.gate_tol is None
+    assert not tracker.reused_data.any()
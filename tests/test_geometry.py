@@ -0,0 +1,42 @@
+"""
+Per frame geometry is saved next to the data file and loads back by column.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import os
+import numpy as np
+import pytest
+from PupilTracker import (GEOMETRY_COLUMNS, geometry_path, load_geometry,
+                          track_video)
+
+
+def test_geometry_round_trip(eye_video, tmp_path):
+    dump_path = str(tmp_path / 'eye.txt')
+    tracker = track_video(eye_video, dump_path=dump_path)
+    assert os.path.exists(geometry_path(dump_path))
+
+    geometry = load_geometry(dump_path)
+    assert set(GEOMETRY_COLUMNS) <= set(geometry.files)
+    for i, name in enumerate(GEOMETRY_COLUMNS):
+        assert np.array_equal(geometry[name], tracker.geometry_data[:, i],
+                              equal_nan=True)
+    assert np.array_equal(geometry['time'], tracker.time_data)
+    assert not geometry['blink'].any() and not geometry['interpolated'].any()
+
+    # unrounded centers of the drawn pupil and its reflection
+    frames = np.arange(60)
+    assert np.abs(geometry['pupil_cx'] - (256 + 0.2 * frames)).max() < 1
+    assert np.abs(geometry['pupil_cy'] - (216 + 0.1 * frames)).max() < 1
+    assert np.abs(geometry['pupil_w'] - 80).max() < 4
+    assert np.abs(geometry['pupil_h'] - 90).max() < 4
+    assert (geometry['pupil_count'] == 1).all()
+    assert np.abs(geometry['refle_cx'] - geometry['pupil_cx'] - 20).max() < 2
+    assert np.abs(geometry['refle_cy'] - geometry['pupil_cy'] + 10).max() < 2
+
+
+def test_missing_geometry(tmp_path):
+    with pytest.raises(IOError):
+        load_geometry(str(tmp_path / 'none.txt'))
@@ -0,0 +1,38 @@
+"""
+Streams tracked in their own processes report back, even when they fail.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import numpy as np
+import pytest
+from MultiCapture import MultiSourceTracker
+
+
+def test_streams_are_aligned(eye_video):
+    multi = MultiSourceTracker([eye_video, eye_video])
+    multi.run()
+
+    aligned = multi.aligned()
+    assert aligned.shape == (60, 1 + 2 * 7)
+    # same video, so same positions at the same times
+    np.testing.assert_array_equal(aligned[:, 3:8], aligned[:, 10:15])
+    assert not np.isnan(aligned[:, 3]).any()
+
+
+def test_bad_source_raises(tmp_path, eye_video):
+    multi = MultiSourceTracker([eye_video, str(tmp_path / 'missing.avi')])
+    with pytest.raises(IOError):
+        multi.run()
+    assert len(multi.results[0]) == 60
+
+
+def test_dead_worker_raises():
+    multi = MultiSourceTracker([0])
+    multi.start()
+    for process in multi.processes:
+        process.terminate()
+    with pytest.raises(IOError):
+        multi.join()
@@ -0,0 +1,30 @@
+"""
+Slots of a MultiTracker keep the times of the frames they share.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import numpy as np
+from Analysis import iter_chunks
+from MultiTracker import MultiTracker
+
+
+def test_slot_data_carries_times(eye_video, tmp_path):
+    multi = MultiTracker()
+    slot = multi.add_slot()
+    multi.init_cap(eye_video)
+    multi.run()
+
+    assert not np.isnan(slot.data[0][:, 0]).all()
+    times = slot.time_data
+    assert not np.isnan(times).any()
+    # 30 fps video
+    assert np.allclose(np.diff(times), 1 / 30, atol=1e-3)
+    assert slot.fps == 30
+
+    path = str(tmp_path / 'slot.txt')
+    slot.dump_data(path)
+    chunk = next(iter_chunks(path))
+    assert np.allclose(chunk['time'], times, atol=1e-6)
@@ -0,0 +1,56 @@
+"""
+Online saccade detection.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import math
+import numpy as np
+from OnlineFilter import OnlineFilter, measure_latency
+
+
+def test_finds_every_saccade_of_synthetic_trace():
+    stats = measure_latency(count=5000, fps=500)
+    assert stats['saccades'] == stats['targets']
+
+
+def test_events_pair_up_with_amplitude():
+    events = []
+    online = OnlineFilter(fps=500, on_event=events.append)
+    refle = np.zeros(2)
+    for frame_num in range(500):
+        x = 0 if frame_num < 250 else 100
+        online.publish(frame_num, None, (x, 0), refle, 0)
+
+    assert [e[0] for e in events] == ['saccade_start', 'saccade_end']
+    start, end = events
+    assert 250 <= start[1] < end[1]
+    # measured between onset and offset of the filtered position, which
+    # lags, so less than the jump
+    assert 0 < end[6] <= 100
+    assert list(online.events) == events
+
+
+def test_lost_eye_ends_saccade_without_amplitude():
+    events = []
+    online = OnlineFilter(fps=500, max_gap=2, on_event=events.append)
+    refle = np.zeros(2)
+    for frame_num in range(300):
+        if frame_num < 250:
+            x = 0
+        elif frame_num < 252:
+            x = 100
+        else:
+            x = np.NaN
+        online.publish(frame_num, None, (x, 0), refle, 0)
+
+    assert [e[0] for e in events] == ['saccade_start', 'saccade_end']
+    assert math.isnan(events[1][6])
+
+
+def test_uncorrected_ignores_missing_reflection():
+    online = OnlineFilter(fps=500, correct=False)
+    online.publish(0, None, (10, 20), (np.NaN, np.NaN), 0)
+    assert online.position == (10, 20)
@@ -0,0 +1,164 @@
+"""
+Playback modes, load governor and realtime schedule.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import threading
+import time
+import numpy as np
+import pytest
+from Playback import LoadGovernor, PlaybackScheduler, SHED_ORDER
+
+
+class RecordingGovernor(LoadGovernor):
+    """
+    Governor held at one level that records the lateness of each frame.
+    """
+    def __init__(self, level=0):
+        super(RecordingGovernor, self).__init__()
+        self.level = level
+        self.lateness = []
+
+    def reset(self):
+        pass
+
+    def frame_done(self, lateness, interval):
+        self.lateness.append(lateness)
+
+
+def play(scheduler, seconds):
+    """
+    Plays in realtime for a while.
+    """
+    scheduler.set_mode('realtime')
+    scheduler.start()
+    time.sleep(seconds)
+    scheduler.stop()
+
+
+def counting_step(frames):
+    """
+    Step that tracks a video of some frames, then raises EOFError.
+    """
+    done = []
+
+    def step():
+        if len(done) == frames:
+            raise EOFError
+        done.append(True)
+    return step
+
+
+def test_fast_mode_runs_to_the_end():
+    ended = threading.Event()
+    scheduler = PlaybackScheduler(counting_step(50), on_end=ended.set,
+                                  mode='fast')
+    assert scheduler.start()
+    assert ended.wait(5)
+    scheduler.stop()
+
+    assert scheduler.frames_tracked == 50
+    assert not scheduler.running()
+
+
+def test_realtime_mode_is_paced():
+    ended = threading.Event()
+    scheduler = PlaybackScheduler(counting_step(20), on_end=ended.set,
+                                  mode='realtime', fps=100)
+    begin = time.time()
+    scheduler.start()
+    assert ended.wait(5)
+    scheduler.stop()
+
+    assert scheduler.frames_tracked == 20
+    assert time.time() - begin >= 0.19
+    assert scheduler.take_new() == 20
+    assert scheduler.take_new() == 0
+
+
+def test_step_mode_has_no_worker():
+    scheduler = PlaybackScheduler(counting_step(5), mode='step')
+    assert not scheduler.start()
+    assert not scheduler.running()
+
+    with pytest.raises(AttributeError):
+        scheduler.set_mode('slow')
+    assert scheduler.mode == 'step'
+
+
+def test_sheds_in_order_and_restores_with_hysteresis():
+    governor = LoadGovernor(window=10)
+    interval = 0.01
+
+    for level in range(1, len(SHED_ORDER) + 1):
+        for _ in range(10):
+            governor.frame_done(2 * interval, interval)
+        assert governor.level == level
+        assert governor.shed() == SHED_ORDER[:level]
+    assert not governor.active('display')
+
+    # a few misses, between the thresholds, hold the level
+    for i in range(10):
+        governor.frame_done(2 * interval if i < 1 else 0, interval)
+    assert governor.level == len(SHED_ORDER)
+
+    for level in reversed(range(len(SHED_ORDER))):
+        for _ in range(10):
+            governor.frame_done(0, interval)
+        assert governor.level == level
+    report = governor.report()
+    assert report.startswith('Keeping up') and 'display 11 frames' in report
+
+
+def test_stall_does_not_count_as_lateness_forever():
+    stalled = []
+
+    def step():
+        if len(stalled) == 20:
+            time.sleep(0.3)
+        stalled.append(True)
+        time.sleep(0.002)
+
+    scheduler = PlaybackScheduler(step, fps=100)
+    scheduler.governor = RecordingGovernor()
+    play(scheduler, 1.5)
+
+    lateness = np.array(scheduler.governor.lateness)
+    assert lateness[20] > 0.25
+    # back on time within a couple of frames
+    assert np.median(lateness[25:]) < 0.01
+
+    # and the real governor never sheds over it
+    stalled[:] = []
+    scheduler.governor = LoadGovernor()
+    play(scheduler, 1.5)
+    assert not any(scheduler.governor.shed_frames.values())
+
+
+def test_shedding_display_shortens_stalls():
+    def step():
+        time.sleep(0.001)
+
+    def mean_lateness(level):
+        scheduler = PlaybackScheduler(step, fps=100)
+        scheduler.governor = RecordingGovernor(level)
+        stop = threading.Event()
+
+        def display():
+            # composites under the lock, like ImagePanel.on_present
+            while not stop.wait(0.002):
+                if scheduler.take_new():
+                    with scheduler.lock:
+                        time.sleep(0.008)
+
+        thread = threading.Thread(target=display)
+        thread.start()
+        play(scheduler, 1)
+        stop.set()
+        thread.join()
+        return np.mean(scheduler.governor.lateness)
+
+    assert mean_lateness(len(SHED_ORDER)) < 0.6 * mean_lateness(0)
@@ -0,0 +1,67 @@
+"""
+Re-tracking ranges of suspect frames.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import numpy as np
+from PupilTracker import PupilTracker, HeadlessApp
+
+
+def tracked(path):
+    """
+    :param path: video path
+    :return: tracker that tracked the whole video from auto_init
+    """
+    tracker = PupilTracker(HeadlessApp())
+    tracker.init_cap(path, 640)
+    tracker.auto_init()
+    tracker.track_all()
+    return tracker
+
+
+def test_suspect_ranges_are_padded_and_merged(eye_video):
+    tracker = tracked(eye_video)
+    assert len(tracker.suspect_frames()) == 0
+
+    for frame in [10, 13, 30]:
+        tracker.data[0][frame] = np.NaN
+
+    assert tracker.suspect_ranges(pad=2, gap=5) == [(8, 16), (28, 33)]
+
+
+def test_retrack_range_merges_into_data(eye_video):
+    tracker = tracked(eye_video)
+    full = tracker.data.copy()
+
+    tracker.data[:, 20:30] = np.NaN
+    start, stop = tracker.suspect_ranges()[0]
+    assert tracker.retrack_range(start, stop) == stop - start
+
+    np.testing.assert_allclose(tracker.data, full, atol=1)
+    # outside the range is left as it was
+    np.testing.assert_array_equal(tracker.data[:, :start], full[:, :start])
+    np.testing.assert_array_equal(tracker.data[:, stop:], full[:, stop:])
+
+
+def test_suspect_frame_shows_tracking(eye_video):
+    tracker = tracked(eye_video)
+    tracker.data[0][25] = np.NaN
+    frame_num = int(tracker.suspect_frames()[0])
+
+    # as PupilTrackerGUI.show_suspect does
+    tracker.seek(frame_num)
+    tracker.next_frame()
+    assert len(tracker.overlay) == 0
+    assert tracker.mark_geometry()
+
+    kinds = [item[0] for item in tracker.overlay.items]
+    assert kinds.count('ellipse') == 1 and kinds.count('contours') == 1
+    ellipse = [item for item in tracker.overlay.items
+               if item[0] == 'ellipse'][0][1][0]
+    center = tracker.geometry_data[frame_num, :2] / tracker.display_scale
+    assert np.allclose(ellipse[0], center)
+    # data from the first run is kept
+    assert np.isnan(tracker.data[0][frame_num, 0])
@@ -0,0 +1,58 @@
+"""
+Sparse tracking interpolates smooth stretches and tracks gaps densely.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import numpy as np
+import pytest
+from conftest import write_eye_video
+from test_blink import write_blink_video
+from PupilTracker import PupilTracker, HeadlessApp
+
+
+def track(path, step, **settings):
+    """
+    :param path: video path
+    :param step: frames between samples, or 1 to track every frame
+    :param settings: tracker attributes to set
+    :return: tracker that tracked the whole video from auto_init
+    """
+    tracker = PupilTracker(HeadlessApp())
+    tracker.init_cap(path, 640)
+    for name, value in settings.items():
+        setattr(tracker, name, value)
+    tracker.auto_init()
+    if step > 1:
+        tracker.track_sparse(step)
+    else:
+        tracker.track_all()
+    return tracker
+
+
+def test_interpolated_frames_match_dense(tmp_path):
+    path = write_eye_video(str(tmp_path / 'eye.avi'), num_frames=90)
+    dense = track(path, 1)
+    sparse = track(path, 5)
+
+    interpolated = sparse.interp_data
+    assert interpolated.sum() == 90 - 19
+    assert not interpolated[::5].any() and not interpolated[-1]
+    assert np.abs(sparse.data - dense.data).max() <= 1
+    assert not np.isnan(sparse.time_data).any()
+
+
+@pytest.mark.parametrize('blink_ratio', [None, 0.3])
+def test_gaps_are_not_interpolated_through(tmp_path, blink_ratio):
+    path = write_blink_video(str(tmp_path / 'blink.avi'), num_frames=90)
+    tracker = track(path, 10, blink_ratio=blink_ratio)
+
+    # the eye is closed, or lost, on frames 20 to 29 only
+    gap = np.arange(20, 30)
+    lost = np.flatnonzero(np.isnan(tracker.data[0][:, 0]))
+    assert np.array_equal(lost, gap)
+    assert not tracker.interp_data[10:31].any()
+    if blink_ratio is not None:
+        assert np.array_equal(np.flatnonzero(tracker.blink_data), gap)
@@ -0,0 +1,59 @@
+"""
+Template matching tracks the reflection where contours would, and falls back
+to contours when it can't.
+"""
+
+# Copyright (C) 2016 Alexander Tomlinson
+# Distributed under the terms of the GNU General Public License (GPL).
+
+from __future__ import division, print_function
+import numpy as np
+from PupilTracker import PupilTracker, HeadlessApp
+
+
+def track(path, refle_mode, template_thresh=0.8):
+    """
+    Tracks a whole video, counting contour detections of the reflection.
+
+    :param path: video path
+    :param refle_mode: 'contour' or 'template'
+    :param template_thresh: match confidence needed
+    :return: tracker, and number of contour detections after auto_init
+    """
+    tracker = PupilTracker(HeadlessApp())
+    tracker.init_cap(path, 640)
+    tracker.refle_mode = refle_mode
+    tracker.template_thresh = template_thresh
+    tracker.auto_init()
+
+    calls = []
+    draw_refle = tracker.draw_refle
+
+    def counted(*args, **kwargs):
+        calls.append(True)
+        return draw_refle(*args, **kwargs)
+    tracker.draw_refle = counted
+
+    tracker.track_all()
+    return tracker, len(calls)
+
+
+def test_template_matches_contours(eye_video):
+    contour, contour_calls = track(eye_video, 'contour')
+    template, template_calls = track(eye_video, 'template')
+
+    assert contour_calls == 60
+    # one detection to cut the first template, matched after that
+    assert template_calls < 5
+    assert template.refle_template is not None
+    assert not np.isnan(template.data[1]).any()
+    assert np.abs(template.data[1] - contour.data[1]).max() <= 1
+
+
+def test_template_falls_back_to_contours(eye_video):
+    contour, _ = track(eye_video, 'contour')
+    # no match is ever good enough
+    template, template_calls = track(eye_video, 'template', 1.1)
+
+    assert template_calls == 60
+    assert np.array_equal(template.data[1], contour.data[1])